@@ -0,0 +1,114 @@
+""" Combination of fit results with external Gaussian measurements (e.g. Ae
+    from tau polarisation, from other difermion final states or LEP/SLC
+    values).
+
+    An external measurement of parameters p with covariance R is added to a
+    fit covariance C in its update form
+      C' = C - C H^T (H C H^T + R)^-1 H C
+    with H selecting the measured parameters. This equals (C^-1 + H^T R^-1 H)^-1
+    but needs neither C nor R to be invertible (fixed parameters have zero
+    variance). The inverse is applied through the Cholesky factor L of
+    S = H C H^T + R:
+      A = L^-1 H C,   C' = C - A^T A
+    which keeps the combined covariance symmetric.
+    All covariance matrices of a stack [..., M, M] (e.g. all setups of a grid)
+    are combined in one call, independent measurements are combined at once.
+"""
+
+import collections
+import numpy as np
+
+# Local modules
+import Analysis.ParNameTable as APNT
+
+# External Gaussian measurement of the given parameters with their covariance
+# matrix, either one [n, n] matrix or one per combined matrix [..., n, n]
+Constraint = collections.namedtuple("Constraint", ["par_names", "cov"])
+
+def independent(par_name, unc):
+  """ Independent measurement of a single parameter with the given
+      uncertainty (or uncertainties, one per combined matrix).
+  """
+  unc = np.asarray(unc, dtype=float)
+  return Constraint([par_name], (unc**2)[..., np.newaxis, np.newaxis])
+
+def stacked_constraints(par_names, constraints):
+  """ Stack the constraints into one measurement of several parameters.
+      Parameters that are not in the given parameter names are left out (the
+      constraint is marginalised).
+      Returns the indices of the measured parameters and the (block diagonal)
+      measurement covariance [..., n, n] (None if nothing is measured).
+  """
+  indices, blocks = [], []
+  for constraint in constraints:
+    cov = np.asarray(constraint.cov, dtype=float)
+    found = APNT.alignment(par_names, constraint.par_names)
+    if cov.shape[-2:] != (len(found), len(found)):
+      raise Exception("Constraint on {} needs a {}x{} covariance, has {}."
+                      .format(constraint.par_names, len(found), len(found),
+                              cov.shape))
+    keep = np.nonzero(found >= 0)[0]
+    if len(keep) == 0:
+      continue
+    indices.append(found[keep])
+    blocks.append(cov[..., keep[:, np.newaxis], keep])
+  if not indices:
+    return np.array([], dtype=int), None
+
+  # Block diagonal covariance of all measurements
+  indices = np.concatenate(indices)
+  shape = np.broadcast_shapes(*[block.shape[:-2] for block in blocks])
+  cov = np.zeros(shape + (len(indices), len(indices)))
+  start = 0
+  for block in blocks:
+    stop = start + block.shape[-1]
+    cov[..., start:stop, start:stop] = block
+    start = stop
+  return indices, cov
+
+def combine(covs, par_names, constraints):
+  """ Combine the covariance matrix (or stack of matrices [..., M, M]) of the
+      given parameters with the external measurements (list of Constraint).
+      Returns the combined covariance matrices.
+  """
+  covs = np.asarray(covs, dtype=float)
+  indices, R = stacked_constraints(par_names, constraints)
+  if R is None:
+    return covs.copy()
+
+  HC = covs[..., indices, :]
+  S = HC[..., indices] + R
+  L = np.linalg.cholesky(S)
+  A = np.linalg.solve(L, np.broadcast_to(HC, S.shape[:-2] + HC.shape[-2:]))
+  return covs - np.swapaxes(A, -1, -2) @ A
+
+def combine_summaries(summaries, constraints, member="cov_mat_avg"):
+  """ Combine the covariance matrices (given member) of several result
+      summaries with the external measurements.
+      Summaries with the same parameters are combined as one stack.
+      Constraints can have one covariance matrix per summary [summary, n, n].
+      Returns the combined covariance matrices (in the order of the summaries,
+      None for summaries without the member).
+  """
+  groups = collections.OrderedDict()
+  for i, summary in enumerate(summaries):
+    if getattr(summary, member) is not None:
+      groups.setdefault(id(summary.par_names), []).append(i)
+
+  combined = [None] * len(summaries)
+  for rows in groups.values():
+    par_names = summaries[rows[0]].par_names
+    covs = np.array([getattr(summaries[i], member) for i in rows])
+    group_constraints = []
+    for constraint in constraints:
+      cov = np.asarray(constraint.cov, dtype=float)
+      if cov.ndim > 2:
+        if cov.shape[0] != len(summaries):
+          raise Exception("Constraint on {} has {} matrices for {} summaries."
+                          .format(constraint.par_names, cov.shape[0],
+                                  len(summaries)))
+        cov = cov[rows]
+      group_constraints.append(Constraint(constraint.par_names, cov))
+    for i, cov in zip(rows, combine(covs, par_names, group_constraints)):
+      combined[i] = cov
+  return combined
@@ -4,6 +4,9 @@
 
 import numpy as np
 
+# Local modules
+import Analysis.NumpyHelp as ANH
+
 def calc_cov_mat(result_vals):
   """ Calculate the covariance matrix for the given fits.
       For each of the N fits, the final result values x of all M parameters are 
@@ -24,15 +27,16 @@ def calc_cov_mat(result_vals):
   
 def calc_std_dev(cov_mat):
   """ Calculate the standard deviations of the parameters for the given 
-      covariance matrix.
+      covariance matrix (or stack of matrices in the last two axes).
   """
-  return np.sqrt(np.diagonal(cov_mat))
+  return np.sqrt(np.diagonal(cov_mat, axis1=-2, axis2=-1))
   
 def calc_cor_mat(cov_mat):
-  """ Calculate the correlation matrix for the given covariance matrix.
+  """ Calculate the correlation matrix for the given covariance matrix (or 
+      stack of matrices in the last two axes).
   """
   std_dev = calc_std_dev(cov_mat)
-  norm = np.outer(std_dev,std_dev)
+  norm = std_dev[..., :, np.newaxis] * std_dev[..., np.newaxis, :]
   
   # Avoid devide-by-zero errors and numerical fluctuations 
   # (e.g. for fixed parameters)
@@ -40,6 +44,24 @@ def calc_cor_mat(cov_mat):
   
   return cov_mat / norm * (np.abs(norm) > 1.e-12)
   
+def calc_packed_cor_mat(packed_cov, dtype=np.float64):
+  """ Calculate the packed correlation matrices for the given packed 
+      covariance matrices (see Analysis.NumpyHelp.sym_pack), same conventions 
+      as calc_cor_mat.
+      The correlations can be returned with lower precision (e.g. np.float32) 
+      where that is sufficient.
+  """
+  std_dev = np.sqrt(ANH.sym_diag(packed_cov))
+  rows, cols = np.triu_indices(std_dev.shape[-1])
+  norm = std_dev[..., rows] * std_dev[..., cols]
+  
+  # Avoid devide-by-zero errors and numerical fluctuations 
+  # (e.g. for fixed parameters)
+  valid = np.abs(norm) > 1.e-12
+  norm += 1.0 * np.logical_not(valid)
+  
+  return (packed_cov / norm * valid).astype(dtype, copy=False)
+  
 def clean_cor_mat(cor_mat):
   """ Clean the correlation matrix by removing parameters which were fixed in 
       the fit. Such parameters can be noticed by their zero-value diagonal 
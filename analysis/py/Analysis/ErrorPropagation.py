@@ -0,0 +1,103 @@
+""" Linear error propagation for observables derived from fit parameters.
+
+    A derived observable is defined once as function of named parameters, e.g.
+      Af = AEP.Observable(["AFB", "Ae", "ef"],
+                          lambda AFB, Ae, ef: (8./3. * AFB - ef) / (2 * Ae))
+    The function gets one array per parameter and can return a single value
+    or a list of values (several derived observables). Its Jacobian is either
+    given analytically (function of the same arguments returning the nested
+    list [observable][parameter] of derivatives) or calculated with central
+    finite differences, all parameters in one batched function call.
+    The covariance matrices are propagated as J C J^T with one einsum for any
+    number of points / setups (leading dimensions of the arrays):
+      values, cov = Af.propagate(values[..., n_pars], cov[..., n_pars, n_pars])
+"""
+
+import numpy as np
+
+# Fit result fields needed for the covariance matrix members of the summary
+cov_fields = { "cov_mat_avg": "cov_matrix", "cov_mat_calc": "pars_fin" }
+
+def stack(outputs, shape):
+  """ Stack the output(s) of a function of the parameters along a new last
+      axis, broadcast to the shape of the points.
+  """
+  if not isinstance(outputs, (list, tuple)):
+    outputs = [outputs]
+  return np.stack([np.broadcast_to(np.asarray(out, dtype=float), shape)
+                   for out in outputs], axis=-1)
+
+def propagate_linear(jacobian, cov):
+  """ Propagate the covariance matrices [..., n_pars, n_pars] with the
+      Jacobians [..., n_obs, n_pars]: J C J^T.
+  """
+  return np.einsum("...ij,...jk,...lk->...il", jacobian, cov, jacobian)
+
+class Observable:
+  """ Observable(s) derived from the given parameters by the function fct, see
+      the module description.
+  """
+
+  def __init__(self, par_names, fct, jacobian=None, rel_step=1e-6):
+    self.par_names = list(par_names)
+    self.fct = fct
+    self.analytic_jacobian = jacobian
+    self.rel_step = rel_step
+
+  def __call__(self, values):
+    """ Observable values [..., n_obs] at the parameter values [..., n_pars].
+    """
+    values = np.asarray(values, dtype=float)
+    if values.shape[-1] != len(self.par_names):
+      raise Exception("Need values of {} parameters {}, got {}.".format(
+                        len(self.par_names), self.par_names, values.shape))
+    columns = [values[..., i] for i in range(len(self.par_names))]
+    return stack(self.fct(*columns), values.shape[:-1])
+
+  def jacobian(self, values):
+    """ Jacobians [..., n_obs, n_pars] at the parameter values [..., n_pars].
+    """
+    values = np.asarray(values, dtype=float)
+    n_pars = len(self.par_names)
+    if self.analytic_jacobian is not None:
+      columns = [values[..., i] for i in range(n_pars)]
+      rows = self.analytic_jacobian(*columns)
+      return np.stack([stack(row, values.shape[:-1]) for row in rows],
+                      axis=-2)
+
+    # Central differences, points [..., varied parameter, parameter]
+    steps = self.rel_step * np.maximum(np.abs(values), 1.)
+    shifts = steps[..., np.newaxis] * np.eye(n_pars)
+    points = values[..., np.newaxis, :]
+    diffs = self(points + shifts) - self(points - shifts)
+    return np.swapaxes(diffs / (2. * steps[..., np.newaxis]), -1, -2)
+
+  def propagate(self, values, cov):
+    """ Observable values [..., n_obs] and their covariance matrices
+        [..., n_obs, n_obs] for the parameter values [..., n_pars] with
+        covariance matrices [..., n_pars, n_pars].
+    """
+    values = np.asarray(values, dtype=float)
+    return self(values), propagate_linear(self.jacobian(values), cov)
+
+  def uncs(self, values, cov):
+    """ Uncertainties [..., n_obs] of the observables.
+    """
+    return np.sqrt(np.diagonal(self.propagate(values, cov)[1],
+                               axis1=-2, axis2=-1))
+
+  def propagate_summaries(self, summaries, values=None, member="cov_mat_avg"):
+    """ Observable values [summary, n_obs] and covariance matrices [summary,
+        n_obs, n_obs] for the given result summaries (all summaries in one
+        operation).
+        The parameters are evaluated at the given values ([n_pars] or
+        [summary, n_pars]), by default at the average fit results.
+    """
+    indices = [summary.par_indices(self.par_names) for summary in summaries]
+    covs = np.array([summary.require(member, cov_fields[member])[np.ix_(i, i)]
+                     for summary, i in zip(summaries, indices)])
+    if values is None:
+      values = np.array([summary.require("par_avg", "pars_fin")[i]
+                         for summary, i in zip(summaries, indices)])
+    values = np.broadcast_to(np.asarray(values, dtype=float), covs.shape[:-1])
+    return self.propagate(values, covs)
@@ -0,0 +1,199 @@
+""" Emulation of setups with fixed parameters from the fits in which they are
+    free (or constrained).
+
+    Fixing parameters f of a Gaussian fit is equivalent to conditioning its
+    covariance on them, the covariance of the other parameters o is the Schur
+    complement
+      C_oo|f = C_oo - C_of C_ff^-1 C_fo
+    (the fixed parameters keep zero variance). The conditioning is done for
+    all setups with the same parameters in one batched operation.
+
+    Each fixed variant of the production grid (e.g. MuAccFixd instead of
+    MuAccFree) is described by the setup dimension that changes, the free and
+    fixed setup names and the parameters that are fixed. Where both setups
+    were run, validate compares the emulated with the fitted uncertainties and
+    correlations of the fixed setup.
+"""
+
+import collections
+import fnmatch
+import numpy as np
+
+# Local modules
+import Analysis.CovMatrixCalc as ACMC
+import Analysis.ResultSummary as ARS
+import Analysis.UncertaintyTensor as AUT
+
+# Fixed variant of a setup: name, setup dimension that changes, setup name
+# with free and with fixed parameters, and patterns of the fixed parameters
+FixedVariant = collections.namedtuple("FixedVariant", ["name", "dim", "free",
+                                                       "fixed", "par_patterns"])
+
+# Comparison of an emulated with a fitted fixed setup: variant name, keys of
+# the free and the fixed setup, compared parameters (those that are not
+# fixed), emulated and fitted uncertainties and the largest absolute
+# difference of the correlations
+Validation = collections.namedtuple("Validation", ["variant", "free_key",
+                                                   "fixed_key", "par_names",
+                                                   "emulated", "fitted",
+                                                   "max_cor_diff"])
+
+lumi_pars = ["Lumi"]
+pol_pars = ["ePol*", "pPol*"]
+muacc_pars = ["MuonAcc_*"]
+ks_pars = ["k0_2f_*", "dk_2f_*"]
+
+def default_variants():
+  """ The fixed variants of the default setups (see Setups.DefaultSetups).
+  """
+  variants = [
+    FixedVariant("MuAccFixd", "muacc_name", "MuAccFree", "MuAccFixd",
+                 muacc_pars),
+    FixedVariant("P0fixed", "run_name", "1pol_LPcnstr", "1pol_LPcnstr_P0fixed",
+                 ["ePol0", "pPol0"])
+  ]
+  for pol in ["2pol", "2polExt", "1pol", "0pol"]:
+    P = "P0" if pol == "0pol" else "P"
+    free = "{}_LPcnstr".format(pol)
+    variants += [
+      FixedVariant("Lfixed", "run_name", free,
+                   "{}_Lfixed_{}constr".format(pol, P), lumi_pars),
+      FixedVariant("Pfixed", "run_name", free,
+                   "{}_Lconstr_{}fixed".format(pol, P), pol_pars),
+      FixedVariant("LPfixed", "run_name", free, "{}_LPfixed".format(pol),
+                   lumi_pars + pol_pars)
+    ]
+  for free, fixed in [
+      ("mumu_free", "mumu_fixed_ks"),
+      ("mumu_LEPconstr_Ae_Af", "mumu_LEPconstr_Ae_Af_fixed_ks"),
+      ("mumu_ILCconstr_Ae_Af_ef_ks", "mumu_ILCconstr_Ae_Af_ef_fixed_ks")]:
+    variants.append(FixedVariant("fixed_ks", "difparam_name", free, fixed,
+                                 ks_pars))
+  for TGCs in ["WWcTGCs", "WW"]:
+    for A in ["AFree", "AFixd"]:
+      variants.append(FixedVariant(
+        "xs0Fixd", "WW_name", "{}_xs0Free_{}".format(TGCs, A),
+        "{}_xs0Fixd_{}".format(TGCs, A), ["ScaleTotChiXS_WW_*"]))
+    for xs0 in ["xs0Free", "xs0Fixd"]:
+      variants.append(FixedVariant(
+        "AFixd", "WW_name", "{}_{}_AFree".format(TGCs, xs0),
+        "{}_{}_AFixd".format(TGCs, xs0), ["DeltaA_WW_*"]))
+  return variants
+
+def fixed_mask(par_names, par_patterns):
+  """ Boolean array whether each parameter matches one of the patterns.
+  """
+  return np.array([any([fnmatch.fnmatchcase(par_name, pattern)
+                        for pattern in par_patterns])
+                   for par_name in par_names], dtype=bool)
+
+def condition(covs, fixed):
+  """ Covariance matrices [..., M, M] with the parameters in the boolean mask
+      fixed [M] known exactly (Schur complement, see module description).
+      Parameters that already have zero variance are handled by using the
+      pseudo-inverse of C_ff.
+  """
+  covs = np.asarray(covs, dtype=float)
+  o, f = np.nonzero(~fixed)[0], np.nonzero(fixed)[0]
+  conditioned = np.zeros_like(covs)
+  C_oo = covs[..., o[:, np.newaxis], o]
+  if len(f) == 0:
+    conditioned[..., o[:, np.newaxis], o] = C_oo
+    return conditioned
+  C_of = covs[..., o[:, np.newaxis], f]
+  C_ff_inv = np.linalg.pinv(covs[..., f[:, np.newaxis], f], hermitian=True)
+  conditioned[..., o[:, np.newaxis], o] = \
+    C_oo - C_of @ C_ff_inv @ np.swapaxes(C_of, -1, -2)
+  return conditioned
+
+def emulate(summaries, par_patterns):
+  """ Summaries of the given setups with the parameters that match the
+      patterns fixed.
+      Only the covariance members (and the correlations and uncertainties
+      following from them) and the average results are filled, summaries with
+      the same parameters are conditioned in one operation.
+  """
+  groups = collections.OrderedDict()
+  for i, summary in enumerate(summaries):
+    groups.setdefault(id(summary.par_names), []).append(i)
+
+  emulated = [None] * len(summaries)
+  for rows in groups.values():
+    par_names = summaries[rows[0]].par_names
+    fixed = fixed_mask(par_names, par_patterns)
+    members = [ { "par_avg": summaries[i].par_avg,
+                  "n_toys": summaries[i].n_toys } for i in rows ]
+    for cov_member, cor_member, unc_member in [
+        ("cov_mat_avg", "cor_mat_avg", "unc_vec_avg"),
+        ("cov_mat_calc", "cor_mat_calc", "unc_vec_calc")]:
+      with_cov = [j for j, i in enumerate(rows)
+                  if getattr(summaries[i], cov_member) is not None]
+      if not with_cov:
+        continue
+      covs = condition([getattr(summaries[rows[j]], cov_member)
+                        for j in with_cov], fixed)
+      cors = ACMC.calc_cor_mat(covs)
+      uncs = ACMC.calc_std_dev(covs)
+      for k, j in enumerate(with_cov):
+        members[j].update({ cov_member: covs[k], cor_member: cors[k],
+                            unc_member: uncs[k] })
+    for i, i_members in zip(rows, members):
+      emulated[i] = ARS.ResultSummary.from_members(par_names, i_members)
+  return emulated
+
+def fixed_key(key, variant):
+  """ Key of the fixed setup for the key of the free setup (None if the
+      variant doesn't apply to it).
+  """
+  d = AUT.dims.index(variant.dim)
+  if key[d] != variant.free:
+    return None
+  return key[:d] + (variant.fixed,) + key[d+1:]
+
+def validate(mrr, variants=None):
+  """ Compare the emulated fixed setups with the fitted ones for all setups
+      of the reader (or result server client) for which both the free and
+      the fixed setup exist.
+      Returns a list of Validation.
+  """
+  variants = default_variants() if variants is None else variants
+  pairs = []
+  for i, variant in enumerate(variants):
+    for key in mrr.results:
+      fixed = fixed_key(key, variant)
+      if (fixed is not None) and (fixed in mrr.results):
+        pairs.append((i, key, fixed))
+  if not pairs:
+    return []
+
+  keys = list(set([key for _, free, fixed in pairs for key in [free, fixed]]))
+  summaries = dict(zip(keys, mrr.result_summaries(keys)))
+
+  # Emulate all free setups of the same variant at once
+  by_variant = collections.OrderedDict()
+  for i, free, fixed in pairs:
+    by_variant.setdefault(i, []).append((free, fixed))
+  validations = []
+  for i, variant_pairs in by_variant.items():
+    variant = variants[i]
+    emulated = emulate([summaries[free] for free, _ in variant_pairs],
+                       variant.par_patterns)
+    for (free, fixed), rs_emul in zip(variant_pairs, emulated):
+      rs_fixed = summaries[fixed]
+      if (rs_emul.cov_mat_avg is None) or (rs_fixed.unc_vec_avg is None):
+        continue
+      # Compare the parameters that are in both and not fixed
+      compared = rs_fixed.has_pars(rs_emul.par_names) & \
+                 ~fixed_mask(rs_emul.par_names, variant.par_patterns)
+      par_names = rs_emul.par_names[compared].tolist()
+      i_emul = np.nonzero(compared)[0]
+      i_fixed = rs_fixed.par_indices(par_names)
+      max_cor_diff = np.nan
+      if rs_fixed.cor_mat_avg is not None:
+        max_cor_diff = np.amax(np.abs(
+          rs_emul.cor_mat_avg[np.ix_(i_emul, i_emul)] -
+          rs_fixed.cor_mat_avg[np.ix_(i_fixed, i_fixed)]), initial=0.)
+      validations.append(Validation(
+        variant.name, free, fixed, par_names, rs_emul.unc_vec_avg[i_emul],
+        rs_fixed.unc_vec_avg[i_fixed], max_cor_diff))
+  return validations
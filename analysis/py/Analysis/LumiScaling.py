@@ -0,0 +1,181 @@
+""" Surrogate for the luminosity dependence of the fit covariance matrices.
+
+    For setups that only differ by their luminosity L, the inverse covariance
+    matrix (precision) of the free parameters is modelled as
+      C(L)^-1 = L * F + P
+    where F is the information per luminosity from the data and P the
+    information from the external constraints (e.g. on the polarisations),
+    which doesn't grow with more data. The Lumi parameter itself is the
+    luminosity, so its row and column of the covariance matrix are divided by
+    L first (relative luminosity uncertainty) and scaled back for the
+    predictions. Parameters with zero variance at all luminosities (fixed)
+    stay fixed.
+
+    F and P are fitted to all available luminosities by least squares of
+    C(L)^-1 / L = F + P / L (which weights the points by their relative size),
+    all matrix elements at once, and made positive semi-definite by clipping
+    negative eigenvalues. Predictions at any number of luminosities are one
+    array operation, the precision is inverted for the covariance matrices.
+    With three or more luminosities the fit is validated by leaving out each
+    luminosity in turn and predicting it from the others.
+"""
+
+import collections
+import logging as log
+import numpy as np
+
+# Local modules
+import Analysis.CovMatrixCalc as ACMC
+import Analysis.UncertaintyTensor as AUT
+
+def lumi_scales(par_names, lumis, lumi_par="Lumi"):
+  """ Scale factors [n_lumi, M] of the parameters into scaled coordinates
+      (1/L for the luminosity parameter, 1 for the others).
+  """
+  scales = np.ones((len(lumis), len(par_names)))
+  is_lumi = np.asarray(par_names) == lumi_par
+  scales[:, is_lumi] = 1. / np.asarray(lumis, dtype=float)[:, np.newaxis]
+  return scales
+
+def scale_covs(covs, scales):
+  """ Covariance matrices [..., M, M] in the coordinates scaled by the
+      factors [..., M].
+  """
+  return covs * scales[..., :, np.newaxis] * scales[..., np.newaxis, :]
+
+def nearest_psd(covs):
+  """ Closest positive semi-definite matrices (negative eigenvalues set to
+      zero) of the symmetric matrices [..., M, M].
+  """
+  values, vectors = np.linalg.eigh(covs)
+  return (vectors * np.maximum(values, 0.)[..., np.newaxis, :]) @ \
+         np.swapaxes(vectors, -1, -2)
+
+def fit_scaling(lumis, precisions):
+  """ Fit the data and constraint information F and P [M, M] to the (scaled)
+      precision matrices [n_lumi, M, M] at the given luminosities.
+  """
+  lumis = np.asarray(lumis, dtype=float)
+  design = np.stack([np.ones_like(lumis), 1. / lumis], axis=-1)
+  targets = (precisions / lumis[:, np.newaxis, np.newaxis]).reshape(
+              len(lumis), -1)
+  F, P = (np.linalg.pinv(design) @ targets).reshape(
+           (2,) + precisions.shape[1:])
+  return nearest_psd(F), nearest_psd(P)
+
+def scaled_covs(lumis, F, P):
+  """ Covariance matrices [n, M, M] of the information F and P at the given
+      luminosities [n].
+  """
+  lumis = np.asarray(lumis, dtype=float)
+  return np.linalg.pinv(lumis[:, np.newaxis, np.newaxis] * F + P,
+                        hermitian=True)
+
+class LumiSurrogate:
+  """ Luminosity scaling of the covariance matrices [n_lumi, M, M] of one
+      setup family (see module description).
+  """
+
+  def __init__(self, lumis, par_names, covs, lumi_par="Lumi"):
+    order = np.argsort(lumis)
+    self.lumis = np.asarray(lumis, dtype=float)[order]
+    self.par_names = list(par_names)
+    self.lumi_par = lumi_par
+    covs = np.asarray(covs, dtype=float)[order]
+    self.covs = covs
+    self.scaled = scale_covs(covs, lumi_scales(self.par_names, self.lumis,
+                                               lumi_par))
+    uncs = ACMC.calc_std_dev(self.scaled)
+    self.fixed = np.all(uncs == 0, axis=0)
+    if np.any(uncs[:, ~self.fixed] == 0):
+      raise Exception("Parameters fixed in only some setups: {}".format(
+        [par_name for par_name, zero in
+         zip(self.par_names, np.any(uncs == 0, axis=0) & ~self.fixed)
+         if zero]))
+    self.free = np.nonzero(~self.fixed)[0]
+    self.precisions = np.linalg.inv(
+      self.scaled[:, self.free[:, np.newaxis], self.free])
+    self.F, self.P = fit_scaling(self.lumis, self.precisions)
+    self.loo_errors = self.leave_one_out()
+
+  def predict(self, lumis):
+    """ Predicted covariance matrices [n, M, M] at the given luminosities.
+    """
+    lumis = np.atleast_1d(np.asarray(lumis, dtype=float))
+    scaled = np.zeros((len(lumis), len(self.par_names), len(self.par_names)))
+    scaled[:, self.free[:, np.newaxis], self.free] = \
+      scaled_covs(lumis, self.F, self.P)
+    scales = lumi_scales(self.par_names, lumis, self.lumi_par)
+    return scale_covs(scaled, 1. / scales)
+
+  def uncs(self, lumis):
+    """ Predicted uncertainties [n, M] at the given luminosities.
+    """
+    return ACMC.calc_std_dev(self.predict(lumis))
+
+  def stat_fraction(self, lumis):
+    """ Fraction [n, M] of each (scaled) variance that is statistical at the
+        given luminosities, i.e. the diagonal of C * L F * C relative to the
+        diagonal of C = C * (L F + P) * C (zero for fixed parameters).
+    """
+    lumis = np.atleast_1d(np.asarray(lumis, dtype=float))
+    covs = scaled_covs(lumis, self.F, self.P)
+    stat = covs @ (lumis[:, np.newaxis, np.newaxis] * self.F) @ covs
+    fractions = np.zeros((len(lumis), len(self.par_names)))
+    fractions[:, self.free] = np.diagonal(stat, axis1=1, axis2=2) / \
+                              np.diagonal(covs, axis1=1, axis2=2)
+    return fractions
+
+  def leave_one_out(self):
+    """ Relative errors [n_lumi, M] of the uncertainties predicted for each
+        luminosity by the fit to the other luminosities (None for fewer than
+        three luminosities).
+    """
+    if len(self.lumis) < 3:
+      return None
+    errors = np.zeros((len(self.lumis), len(self.par_names)))
+    for i in range(len(self.lumis)):
+      others = np.arange(len(self.lumis)) != i
+      F, P = fit_scaling(self.lumis[others], self.precisions[others])
+      predicted = ACMC.calc_std_dev(scaled_covs(self.lumis[i:i+1], F, P)[0])
+      fitted = ACMC.calc_std_dev(
+        self.scaled[i][self.free[:, np.newaxis], self.free])
+      # Fixed parameters count as correctly predicted
+      errors[i, self.free] = predicted / fitted - 1.
+    return errors
+
+  def max_loo_error(self):
+    """ Largest absolute leave-one-out error of each parameter [M] (NaN if
+        it can't be validated).
+    """
+    if self.loo_errors is None:
+      return np.full(len(self.par_names), np.nan)
+    return np.amax(np.abs(self.loo_errors), axis=0)
+
+def from_reader(mrr, member="cov_mat_avg", lumi_par="Lumi"):
+  """ Luminosity surrogates of all setup families (setups that only differ
+      by their luminosity) of the reader (or result server client) with at
+      least two luminosities.
+      Returns a dictionary by the key without the luminosity, i.e.
+      (run_name, muacc_name, difparam_name, WW_name).
+  """
+  keys = list(mrr.results.keys())
+  summaries = dict(zip(keys, mrr.result_summaries(keys)))
+  families = collections.defaultdict(list)
+  for key in sorted(summaries.keys(), key=AUT.sort_key):
+    if getattr(summaries[key], member) is not None:
+      families[key[1:]].append(key)
+
+  surrogates = {}
+  for family, keys in families.items():
+    if len(keys) < 2:
+      continue
+    tables = set([id(summaries[key].par_names) for key in keys])
+    if len(tables) > 1:
+      log.warning("Setups of {} have different parameters, no luminosity "
+                  "surrogate.".format(family))
+      continue
+    surrogates[family] = LumiSurrogate(
+      [key[0] for key in keys], summaries[keys[0]].par_names,
+      [getattr(summaries[key], member) for key in keys], lumi_par)
+  return surrogates
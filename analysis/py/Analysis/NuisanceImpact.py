@@ -0,0 +1,137 @@
+""" Impact of the nuisance parameters on the physics parameters of all setups.
+
+    The impact of a nuisance parameter group g on a physics parameter p is the
+    part of the uncertainty of p that would vanish if g were known perfectly,
+    in quadrature:
+      impact^2 = C_pp - C_pp|g = (C_pg C_gg^-1 C_gp)_pp
+    (see Analysis.FixedEmulation for the conditioning). For all setups with
+    the same parameters and each group this is one batched operation.
+
+    The impacts are kept in one array impacts[setup, parameter, group] with
+    the setups sorted by key (as in Analysis.UncertaintyTensor), the union of
+    the physics parameters (all parameters that are in no group) and NaN where
+    a setup doesn't have the parameter or none of the group's parameters.
+"""
+
+import collections
+import fnmatch
+import numpy as np
+
+# Local modules
+import Analysis.CovMatrixCalc as ACMC
+import Analysis.FixedEmulation as AFE
+import Analysis.ParNameTable as APNT
+import Analysis.UncertaintyTensor as AUT
+
+# Nuisance parameter groups: name and patterns of the parameters
+default_groups = collections.OrderedDict([
+  ("Lumi", ["Lumi"]),
+  ("ePol", ["ePol*"]),
+  ("pPol", ["pPol*"]),
+  ("MuonAcc_dCenter", ["MuonAcc_dCenter*"]),
+  ("MuonAcc_dWidth", ["MuonAcc_dWidth*"]),
+  ("WW_xs0", ["ScaleTotChiXS_WW_*"])
+])
+
+def is_nuisance(par_name, groups):
+  """ Is the parameter in one of the groups.
+  """
+  return any([fnmatch.fnmatchcase(par_name, pattern)
+              for patterns in groups.values() for pattern in patterns])
+
+def reductions(covs, physics, nuisance):
+  """ Variance reductions [..., n_physics] of the physics parameters (indices)
+      if the nuisance parameters (indices) of the covariance matrices
+      [..., M, M] were known.
+  """
+  C_pg = covs[..., physics[:, np.newaxis], nuisance]
+  C_gg_inv = np.linalg.pinv(covs[..., nuisance[:, np.newaxis], nuisance],
+                            hermitian=True)
+  return np.einsum("...pg,...gh,...ph->...p", C_pg, C_gg_inv, C_pg)
+
+def relative_reduction(uncs, impacts):
+  """ Relative reduction of the uncertainties 1 - unc_fixed / unc for the
+      given impacts (in quadrature).
+  """
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return 1. - np.sqrt(np.maximum(uncs**2 - impacts**2, 0.)) / uncs
+
+class NuisanceImpacts:
+  """ Impacts [setup, physics parameter, nuisance group] of the given setup
+      results (see module description).
+  """
+
+  def __init__(self, setup_results, summaries, groups=default_groups,
+               member="cov_mat_avg"):
+    order = sorted(range(len(setup_results)),
+                   key=lambda i: AUT.sort_key(setup_results[i].key()))
+    summaries = [summaries[i] for i in order]
+    self.keys = [setup_results[i].key() for i in order]
+    self.key_index = { key: i for i, key in enumerate(self.keys) }
+    self.groups = list(groups.keys())
+    self.par_names = [par_name for par_name
+                      in APNT.union([rs.par_names for rs in summaries])
+                      if not is_nuisance(par_name, groups)]
+    self.par_index = { par_name: i 
+                       for i, par_name in enumerate(self.par_names) }
+
+    self.uncs = np.full((len(self.keys), len(self.par_names)), np.nan)
+    self.impacts = np.full((len(self.keys), len(self.par_names),
+                            len(self.groups)), np.nan)
+
+    # Setups with the same parameters are done at once
+    by_table = collections.OrderedDict()
+    for row, summary in enumerate(summaries):
+      if getattr(summary, member) is not None:
+        by_table.setdefault(id(summary.par_names), []).append(row)
+    for rows in by_table.values():
+      par_names = summaries[rows[0]].par_names
+      covs = np.array([getattr(summaries[row], member) for row in rows])
+      physics = np.array([i for i, par_name in enumerate(par_names)
+                          if not is_nuisance(par_name, groups)], dtype=int)
+      cols = [self.par_index[par_names[i]] for i in physics]
+      self.uncs[np.ix_(rows, cols)] = ACMC.calc_std_dev(covs)[:, physics]
+      for g, patterns in enumerate(groups.values()):
+        nuisance = np.nonzero(AFE.fixed_mask(par_names, patterns))[0]
+        if len(nuisance) == 0:
+          continue
+        reduction = reductions(covs, physics, nuisance)
+        self.impacts[np.ix_(rows, cols, [g])] = \
+          np.sqrt(np.maximum(reduction, 0.))[..., np.newaxis]
+
+  def relative(self):
+    """ Relative reduction of the uncertainties [setup, parameter, group] if
+        each group were known: 1 - unc_fixed / unc.
+    """
+    return relative_reduction(self.uncs[..., np.newaxis], self.impacts)
+
+  def ranking(self, key, par_name):
+    """ Nuisance groups of the setup ordered by their impact on the parameter
+        (largest first), as list of (group, impact, relative reduction).
+        Groups that the setup doesn't have are left out.
+    """
+    row, col = self.key_index[key], self.par_index[par_name]
+    impacts = self.impacts[row, col]
+    relative = relative_reduction(self.uncs[row, col], impacts)
+    order = [g for g in np.argsort(-impacts) if not np.isnan(impacts[g])]
+    return [(self.groups[g], impacts[g], relative[g]) for g in order]
+
+  def select(self, **patterns):
+    """ Rows of the setups that match the patterns of the setup dimensions
+        (see Analysis.UncertaintyTensor).
+    """
+    unknown = set(patterns.keys()) - set(AUT.dims)
+    if unknown:
+      raise Exception("Unknown setup dimensions {}, known: {}".format(
+                        list(unknown), AUT.dims))
+    return [row for row, key in enumerate(self.keys)
+            if all([AUT.matches(value, patterns.get(dim, "*"))
+                    for value, dim in zip(key, AUT.dims)])]
+
+def from_reader(mrr, groups=default_groups, member="cov_mat_avg"):
+  """ Nuisance impacts of all setups of the reader (or result server client),
+      missing summaries are calculated in parallel first.
+  """
+  setup_results = mrr.setup_results
+  return NuisanceImpacts(setup_results, mrr.result_summaries(), groups,
+                         member)
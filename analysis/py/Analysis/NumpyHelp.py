@@ -6,4 +6,37 @@ import numpy as np
 def is_symmetric(matrix, rtol=1e-05, atol=1e-08):
   """ Check if the matrix is symmetric within a given precision.
   """
-  return np.allclose(matrix, matrix.T, rtol=rtol, atol=atol)
\ No newline at end of file
+  return np.allclose(matrix, matrix.T, rtol=rtol, atol=atol)
+
+def sym_dim(n_packed):
+  """ Dimension M of a symmetric MxM matrix from the length of its packed 
+      upper triangle (M*(M+1)/2).
+  """
+  dim = int(round((np.sqrt(8 * n_packed + 1) - 1) / 2))
+  if dim * (dim + 1) // 2 != n_packed:
+    raise Exception("{} is not the size of a packed triangle.".format(n_packed))
+  return dim
+
+def sym_pack(matrices):
+  """ Pack the upper triangles of symmetric matrices (in the last two axes) 
+      into vectors of length M*(M+1)/2.
+  """
+  rows, cols = np.triu_indices(matrices.shape[-1])
+  return matrices[..., rows, cols]
+
+def sym_unpack(packed):
+  """ Unpack vectors of packed upper triangles (see sym_pack) into the full 
+      symmetric matrices.
+  """
+  dim = sym_dim(packed.shape[-1])
+  rows, cols = np.triu_indices(dim)
+  matrices = np.empty(packed.shape[:-1] + (dim, dim), dtype=packed.dtype)
+  matrices[..., rows, cols] = packed
+  matrices[..., cols, rows] = packed
+  return matrices
+
+def sym_diag(packed):
+  """ Diagonal elements of packed symmetric matrices (see sym_pack).
+  """
+  rows, cols = np.triu_indices(sym_dim(packed.shape[-1]))
+  return packed[..., rows == cols]
@@ -0,0 +1,60 @@
+""" Shared table of parameter name arrays.
+    All results with the same parameters use the same (read-only) array of 
+    parameter names instead of each carrying its own copy.
+    Each table also has a shared name -> index dictionary, so that parameters
+    are found without scanning the names.
+"""
+
+import numpy as np
+import sys
+
+_tables = {}
+_indices = {}
+_alignments = {}
+
+def par_name_table(par_names):
+  """ Return the shared, read-only numpy array for the given parameter names.
+  """
+  key = tuple(sys.intern(str(par_name)) for par_name in par_names)
+  if key not in _tables:
+    table = np.array(key)
+    table.setflags(write=False)
+    _tables[key] = table
+    _indices[id(table)] = { par_name: i for i, par_name in enumerate(key) }
+  return _tables[key]
+
+def index_table(table):
+  """ Return the name -> index dictionary of a shared parameter name table.
+  """
+  if id(table) not in _indices:
+    table = par_name_table(table)
+  return _indices[id(table)]
+
+def alignment(table, par_names):
+  """ Indices of the given parameter names in the shared table, -1 for names
+      that are not in it.
+      The index array is cached (read-only), so that aligning many results 
+      with the same parameters to the same names only looks them up once.
+  """
+  if id(table) not in _indices:
+    table = par_name_table(table)
+  if isinstance(par_names, str):
+    par_names = [par_names]
+  key = (id(table), tuple(par_names))
+  if key not in _alignments:
+    indices = _indices[id(table)]
+    aligned = np.array([indices.get(par_name, -1) for par_name in par_names],
+                       dtype=int)
+    aligned.setflags(write=False)
+    _alignments[key] = aligned
+  return _alignments[key]
+
+def union(tables):
+  """ Union of the parameter names of the given tables, in order of their 
+      first appearance.
+  """
+  names = {}
+  for table in tables:
+    for par_name in table:
+      names.setdefault(str(par_name), len(names))
+  return list(names.keys())
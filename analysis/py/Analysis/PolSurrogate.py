@@ -0,0 +1,261 @@
+""" Surrogate for the beam polarisation dependence of the fit covariances.
+
+    Setups that only differ by the polarisations (PeM, PeP) of their run setup
+    (same luminosity, run scheme, e.g. "LPcnstr", muon acceptance, difermion
+    and WW setup) form a family. The polarisations are taken from the
+    RunSetup of each result, or from the default run setups with the same
+    name if the result's RunSetup has no polarisations. Run setups with
+    external (luminosity sharing) polarisation schemes, e.g. "2polExt_*",
+    would sit on the same point as their normal counterpart and are left out.
+
+    In each family the log-uncertainties and the Fisher-transformed
+    correlations (arctanh) of the parameters that all points share are
+    interpolated in (PeM, PeP) by ordinary kriging with a Gaussian kernel. All
+    targets share the kernel weights, so any number of polarisation points is
+    predicted with one matrix product. The predicted correlation matrices are
+    made positive semi-definite (clipped eigenvalues, unit diagonal) before
+    they are combined with the uncertainties. Parameters with zero variance
+    at all points (fixed) stay fixed.
+    Each prediction comes with the kriging error of the log-uncertainties,
+    i.e. a relative error estimate, and with three or more points the
+    surrogate is validated by leaving out each point and predicting it from
+    the others.
+"""
+
+import collections
+import fnmatch
+import logging as log
+import numpy as np
+
+# Local modules
+import Analysis.CovMatrixCalc as ACMC
+import Analysis.LumiScaling as ALS
+import Setups.DefaultSetups as SDS
+
+# Run setups that are left out of the families by default
+default_exclude = ["*Ext_*"]
+
+def default_run_setups():
+  """ Default run setups by name.
+  """
+  return { rs.name: rs for rs in SDS.default_pol_run_setups +
+                                 SDS.default_unpol_run_setups }
+
+def pol_point(run_setup, defaults=None):
+  """ Polarisations (PeM, PeP) of the run setup as fractions, from the setup
+      itself or from the default run setup with the same name.
+  """
+  PeM, PeP = run_setup.PeM, run_setup.PeP
+  if (PeM is None) or (PeP is None):
+    defaults = default_run_setups() if defaults is None else defaults
+    if run_setup.name not in defaults:
+      raise Exception("Unknown polarisations of run setup {}".format(
+                        run_setup.name))
+    PeM, PeP = defaults[run_setup.name].PeM, defaults[run_setup.name].PeP
+  return (PeM / 100., PeP / 100.)
+
+def run_scheme(run_name):
+  """ Run scheme of the run setup name, i.e. the name without the
+      polarisation prefix (e.g. "LPcnstr" for "2pol_LPcnstr").
+  """
+  return run_name.split("_", 1)[1] if "_" in run_name else ""
+
+def pol_grid(PeM_values, PeP_values):
+  """ Dense grid of polarisation points [n_PeM * n_PeP, 2] (as fractions),
+      PeP changing fastest.
+  """
+  PeM, PeP = np.meshgrid(PeM_values, PeP_values, indexing="ij")
+  return np.stack([PeM.ravel(), PeP.ravel()], axis=-1)
+
+def fisher(cors):
+  """ Fisher transformation of the correlations (clipped to stay finite).
+  """
+  return np.arctanh(np.clip(cors, -1. + 1e-12, 1. - 1e-12))
+
+def nearest_cor(cors):
+  """ Closest correlation matrices (positive semi-definite with unit
+      diagonal) of the symmetric matrices [..., M, M].
+  """
+  covs = ALS.nearest_psd(cors)
+  return ACMC.calc_cor_mat(covs)
+
+class Kriging:
+  """ Ordinary kriging (constant mean, Gaussian kernel with the given length
+      scale) of the values [n_points, n_targets] at the points [n_points,
+      n_dims], all targets at once.
+  """
+
+  def __init__(self, points, values, length_scale=1., nugget=1e-10):
+    self.points = np.asarray(points, dtype=float)
+    self.length_scale = length_scale
+    values = np.asarray(values, dtype=float)
+    K = self.kernel(self.points) + nugget * np.eye(len(self.points))
+    self.K_inv = np.linalg.inv(K)
+    ones = np.ones(len(self.points))
+    self.K_inv_1 = self.K_inv @ ones
+    self.norm = ones @ self.K_inv_1
+    self.mean = (self.K_inv_1 @ values) / self.norm
+    residuals = values - self.mean
+    self.weights = self.K_inv @ residuals
+    # Process variance of each target
+    self.variance = np.sum(residuals * self.weights, axis=0) / len(self.points)
+
+  def kernel(self, points):
+    """ Kernel [n, n_points] between the points [n, n_dims] and the fitted
+        points.
+    """
+    diffs = points[:, np.newaxis, :] - self.points[np.newaxis, :, :]
+    return np.exp(-0.5 * np.sum(diffs**2, axis=-1) / self.length_scale**2)
+
+  def predict(self, points):
+    """ Predicted values [n, n_targets] at the points [n, n_dims] and their
+        kriging standard deviations [n, n_targets].
+    """
+    k = self.kernel(np.atleast_2d(np.asarray(points, dtype=float)))
+    values = self.mean + k @ self.weights
+    k_K_inv = k @ self.K_inv
+    scale = 1. - np.sum(k_K_inv * k, axis=-1) + \
+            (1. - k @ self.K_inv_1)**2 / self.norm
+    stds = np.sqrt(np.maximum(scale, 0.)[:, np.newaxis] * self.variance)
+    return values, stds
+
+class PolSurrogate:
+  """ Polarisation dependence of the covariance matrices [n_points, M, M] of
+      one setup family at the polarisation points [n_points, 2] (see module
+      description).
+  """
+
+  def __init__(self, pol_points, par_names, covs, length_scale=1.):
+    self.pol_points = np.asarray(pol_points, dtype=float)
+    self.par_names = list(par_names)
+    self.length_scale = length_scale
+    self.covs = np.asarray(covs, dtype=float)
+    uncs = ACMC.calc_std_dev(self.covs)
+    self.fixed = np.all(uncs == 0, axis=0)
+    if np.any(uncs[:, ~self.fixed] == 0):
+      raise Exception("Parameters fixed in only some setups: {}".format(
+        [par_name for par_name, zero in
+         zip(self.par_names, np.any(uncs == 0, axis=0) & ~self.fixed)
+         if zero]))
+    self.free = np.nonzero(~self.fixed)[0]
+    self.upper = np.triu_indices(len(self.free), k=1)
+    self.kriging = Kriging(self.pol_points, self.targets(self.covs),
+                           length_scale)
+    self.loo_errors = self.leave_one_out()
+
+  def targets(self, covs):
+    """ Interpolated values [n, n_targets] of the covariance matrices: the
+        log-uncertainties and Fisher-transformed correlations of the free
+        parameters.
+    """
+    covs = covs[:, self.free[:, np.newaxis], self.free]
+    cors = ACMC.calc_cor_mat(covs)[:, self.upper[0], self.upper[1]]
+    return np.concatenate([np.log(ACMC.calc_std_dev(covs)), fisher(cors)],
+                          axis=-1)
+
+  def from_targets(self, targets):
+    """ Covariance matrices [n, M, M] from the interpolated values.
+    """
+    n_free = len(self.free)
+    cors = np.zeros((len(targets), n_free, n_free))
+    cors[:, self.upper[0], self.upper[1]] = np.tanh(targets[:, n_free:])
+    cors = cors + np.swapaxes(cors, -1, -2) + np.eye(n_free)
+    uncs = np.exp(targets[:, :n_free])
+    covs = np.zeros((len(targets), len(self.par_names), len(self.par_names)))
+    covs[:, self.free[:, np.newaxis], self.free] = \
+      nearest_cor(cors) * uncs[:, :, np.newaxis] * uncs[:, np.newaxis, :]
+    return covs
+
+  def predict(self, pol_points):
+    """ Predicted covariance matrices [n, M, M] at the polarisation points
+        [n, 2] (as fractions).
+    """
+    targets, _ = self.kriging.predict(pol_points)
+    return self.from_targets(targets)
+
+  def uncs(self, pol_points):
+    """ Predicted uncertainties [n, M] at the polarisation points and the
+        estimate of their relative errors [n, M] (zero for fixed parameters).
+    """
+    targets, stds = self.kriging.predict(pol_points)
+    n_free = len(self.free)
+    uncs = np.zeros((len(targets), len(self.par_names)))
+    errors = np.zeros_like(uncs)
+    uncs[:, self.free] = np.exp(targets[:, :n_free])
+    errors[:, self.free] = stds[:, :n_free]
+    return uncs, errors
+
+  def leave_one_out(self):
+    """ Relative errors [n_points, M] of the uncertainties predicted for each
+        point by the surrogate of the other points (None for fewer than three
+        points).
+    """
+    n_points = len(self.pol_points)
+    if n_points < 3:
+      return None
+    targets = self.targets(self.covs)
+    n_free = len(self.free)
+    errors = np.zeros((n_points, len(self.par_names)))
+    for i in range(n_points):
+      others = np.arange(n_points) != i
+      kriging = Kriging(self.pol_points[others], targets[others],
+                        self.length_scale)
+      predicted, _ = kriging.predict(self.pol_points[i])
+      errors[i, self.free] = np.exp(predicted[0, :n_free] -
+                                    targets[i, :n_free]) - 1.
+    return errors
+
+  def max_loo_error(self):
+    """ Largest absolute leave-one-out error of each parameter [M] (NaN if
+        it can't be validated).
+    """
+    if self.loo_errors is None:
+      return np.full(len(self.par_names), np.nan)
+    return np.amax(np.abs(self.loo_errors), axis=0)
+
+def family_key(key):
+  """ Key of the setup family: the setup key with the run setup name replaced
+      by its run scheme, i.e. (lumi, run_scheme, muacc_name, difparam_name,
+      WW_name).
+  """
+  return (key[0], run_scheme(key[1])) + tuple(key[2:])
+
+def from_reader(mrr, member="cov_mat_avg", exclude=default_exclude,
+                length_scale=1.):
+  """ Polarisation surrogates of all setup families of the reader (or result
+      server client) with at least two distinct polarisation points, as
+      dictionary by family key (see family_key).
+      Each family is interpolated in the parameters that all its setups have.
+  """
+  defaults = default_run_setups()
+  setup_results = [sr for sr in mrr.setup_results
+                   if not any([fnmatch.fnmatchcase(sr.run_setup.name, pattern)
+                               for pattern in exclude])]
+  summaries = mrr.result_summaries([sr.key() for sr in setup_results])
+
+  families = collections.OrderedDict()
+  for sr, summary in zip(setup_results, summaries):
+    if getattr(summary, member) is None:
+      continue
+    point = pol_point(sr.run_setup, defaults)
+    families.setdefault(family_key(sr.key()), []).append((point, summary))
+
+  surrogates = {}
+  for family, members in families.items():
+    points = [point for point, _ in members]
+    if len(set(points)) < 2:
+      continue
+    if len(set(points)) < len(points):
+      log.warning("Setups of {} share polarisation points, no polarisation "
+                  "surrogate.".format(family))
+      continue
+    par_names = members[0][1].par_names
+    in_all = np.all([summary.has_pars(par_names) for _, summary in members],
+                    axis=0)
+    shared = [str(par_name) for par_name in par_names[in_all]]
+    covs = []
+    for _, summary in members:
+      indices = summary.par_indices(shared)
+      covs.append(getattr(summary, member)[np.ix_(indices, indices)])
+    surrogates[family] = PolSurrogate(points, shared, covs, length_scale)
+  return surrogates
@@ -4,37 +4,102 @@ import numpy as np
 # Local modules
 import Analysis.CovMatrixCalc as ACMC
 import Analysis.NumpyHelp as ANH
+import Analysis.ParNameTable as APNT
+import IO.RunResultColumns as IORRC
+
+# Members of the summary that are arrays (None if not available) or scalars
+array_members = [
+  "par_vals", "par_avg", "par_min", "par_max", "cov_mat_calc", "cor_mat_calc",
+  "unc_vec_calc", "cov_mat_avg", "cor_mat_avg", "unc_vec_avg", "nll", 
+  "cov_status", "min_status", "fct_calls", "n_iters"
+]
+scalar_members = ["ndf", "n_toys"]
+
+# Possible status values of the covariance matrix and the minimisation
+cov_statuses = np.arange(-1,4)
+min_statuses = np.arange(-1,7)
+
+def array_str(value):
+  """ String of the value with all array entries on one line, without changing
+      the global numpy print options (so that it can be used in parallel).
+  """
+  if isinstance(value, np.ndarray):
+    return np.array2string(value, max_line_width=999999)
+  return str(value)
+
+def json_value(value):
+  """ JSON-compatible form of the value (lists of floats, None for NaN/inf).
+  """
+  if value is None:
+    return None
+  array = np.asarray(value, dtype=float)
+  return np.where(np.isfinite(array), array, None).tolist()
 
 class ResultSummary:
   """ Class that calculate a summary for a given run result.
+      If the run result only contains some of the per-toy fields (see the 
+      fields option of IO.MultiResultReader), only the members that can be 
+      calculated from them are filled, the others are None.
   """
   
   def __init__(self, run_result):
-    self.par_names = np.array(run_result.par_names)
+    self.par_names = APNT.par_name_table(run_result.par_names)
+    run_result = IORRC.from_run_result(run_result)
+    columns = run_result.columns
+    self.n_toys = run_result.n_toys
+    average = lambda field: (np.average(columns[field], axis=0) 
+                             if field in columns else None)
     
     # Parameter result range related things
-    self.par_vals = np.array([fr.pars_fin for fr in run_result.fit_results])
-    self.par_avg = np.average(self.par_vals, axis=0)
-    self.par_min = np.amin(self.par_vals, axis=0)
-    self.par_max = np.amax(self.par_vals, axis=0)
-    
-    # Covariance matrix related things
-    result_vals = np.array([fr.pars_fin for fr in run_result.fit_results])    
-    self.cov_mat_calc = ACMC.calc_cov_mat(result_vals) # TODO Check where this was used and replace everywhere!
-    self.cor_mat_calc = ACMC.calc_cor_mat(self.cov_mat_calc)
-    self.unc_vec_calc = ACMC.calc_std_dev(self.cov_mat_calc)
-    self.cov_mat_avg = np.average(np.array([fr.cov_matrix for fr in run_result.fit_results]), axis=0)
-    self.cor_mat_avg = np.average(np.array([fr.cor_matrix for fr in run_result.fit_results]), axis=0)
-    self.unc_vec_avg = np.average(np.array([fr.uncs_fin for fr in run_result.fit_results]), axis=0)
-    self.consistency_check()
+    self.par_vals = self.par_avg = self.par_min = self.par_max = None
+    self.cov_mat_calc = self.cor_mat_calc = self.unc_vec_calc = None
+    if "pars_fin" in columns:
+      self.par_vals = columns["pars_fin"]
+      self.par_avg = np.average(self.par_vals, axis=0)
+      self.par_min = np.amin(self.par_vals, axis=0)
+      self.par_max = np.amax(self.par_vals, axis=0)
+    
+      # Covariance matrix related things
+      self.cov_mat_calc = ACMC.calc_cov_mat(self.par_vals) # TODO Check where this was used and replace everywhere!
+      self.cor_mat_calc = ACMC.calc_cor_mat(self.cov_mat_calc)
+      self.unc_vec_calc = ACMC.calc_std_dev(self.cov_mat_calc)
+    self.cov_mat_avg = self.cor_mat_avg = None
+    if run_result.has("cov_matrix"):
+      # Average the packed matrices, only unpack the result
+      self.cov_mat_avg = ANH.sym_unpack(average("cov_matrix"))
+      self.cor_mat_avg = ANH.sym_unpack(
+                           np.average(run_result.packed_cor(), axis=0))
+    self.unc_vec_avg = average("uncs_fin")
+    if (self.cov_mat_calc is not None) and (self.unc_vec_avg is not None):
+      self.consistency_check()
     
     # Fit behaviour related things
-    self.ndf = run_result.fit_results[0].n_bins - run_result.fit_results[0].n_free_pars
-    self.nll = np.array([fr.chisq_fin for fr in run_result.fit_results])
-    self.cov_status = np.array([fr.cov_status for fr in run_result.fit_results])
-    self.min_status = np.array([fr.min_status for fr in run_result.fit_results])
-    self.fct_calls = np.array([fr.n_fct_calls for fr in run_result.fit_results])
-    self.n_iters = np.array([fr.n_iters for fr in run_result.fit_results])
+    self.ndf = None
+    if ("n_bins" in columns) and ("n_free_pars" in columns):
+      self.ndf = columns["n_bins"][0] - columns["n_free_pars"][0]
+    self.nll = columns.get("chisq_fin")
+    self.cov_status = columns.get("cov_status")
+    self.min_status = columns.get("min_status")
+    self.fct_calls = columns.get("n_fct_calls")
+    self.n_iters = columns.get("n_iters")
+    
+  @classmethod
+  def from_members(cls, par_names, members):
+    """ Create a summary from already calculated members (e.g. received from 
+        the result server), members that are not given are None.
+    """
+    summary = cls.__new__(cls)
+    summary.par_names = APNT.par_name_table(par_names)
+    for member in array_members + scalar_members:
+      setattr(summary, member, members.get(member))
+    return summary
+    
+  def __setstate__(self, state):
+    """ Use the shared parameter name table also after unpickling (e.g. when 
+        the summary was calculated in a worker process).
+    """
+    state["par_names"] = APNT.par_name_table(state["par_names"])
+    self.__dict__.update(state)
     
   def consistency_check(self):
     """ Perform some simple consistency check to see if calculated covariance 
@@ -54,42 +119,221 @@ class ResultSummary:
   def par_index(self, par_name):
     """ Return the index of the given parameter.
     """  
-    indices = np.where(self.par_names == par_name)[0]
-    if len(indices) == 0:
+    index = APNT.index_table(self.par_names).get(par_name)
+    if index is None:
       raise Exception("No parameter {} found.".format(par_name))
-    elif len(indices) > 1:
-      raise Exception("{} parmeters {} found.".format(par_name))
-    return indices[0]
+    return index
+    
+  def has_pars(self, par_names):
+    """ Boolean array whether each of the given parameters is in the result.
+    """
+    return APNT.alignment(self.par_names, par_names) >= 0
+    
+  def par_indices(self, par_names, allow_missing=False):
+    """ Return the indices of the given parameters, -1 for parameters that are
+        not in the result if allow_missing is set (else an exception is 
+        raised).
+    """
+    indices = APNT.alignment(self.par_names, par_names)
+    if (not allow_missing) and np.any(indices < 0):
+      raise Exception("No parameters {} found.".format(
+                        [par_name for par_name, i in zip(par_names, indices)
+                         if i < 0]))
+    return indices
+    
+  def require(self, member, field):
+    """ Return the given member, raise an exception if it couldn't be 
+        calculated because the needed field was not read.
+    """
+    value = getattr(self, member)
+    if value is None:
+      raise Exception("{} not available, needs fit result field {}".format(
+                        member, field))
+    return value
     
   def unc(self, par_name):
     """ Return the uncertainty for the given parameter.
     """
-    return self.unc_vec_calc[self.par_index(par_name)]
+    return self.require("unc_vec_calc", "pars_fin")[self.par_index(par_name)]
       
   def fit_unc(self, par_name):
     """ Return the uncertainty for the given parameter.
     """
-    return self.unc_vec_avg[self.par_index(par_name)]
+    return self.require("unc_vec_avg", "uncs_fin")[self.par_index(par_name)]
       
+  def select(self, member, field, par_names, fill=None):
+    """ Entries of the given vector member for the given parameters.
+        Parameters that are not in the result get the fill value (which can 
+        also be an array with one value per parameter), if no fill value is
+        given they raise an exception.
+    """
+    values = self.require(member, field)
+    indices = self.par_indices(par_names, allow_missing=fill is not None)
+    if fill is None:
+      return values[indices]
+    return np.where(indices >= 0, values[indices], fill)
+    
+  def uncs(self, par_names, fill=None):
+    """ Return the uncertainties for the given parameters.
+    """
+    return self.select("unc_vec_calc", "pars_fin", par_names, fill)
+    
+  def fit_uncs(self, par_names, fill=None):
+    """ Return the average fit uncertainties for the given parameters.
+    """
+    return self.select("unc_vec_avg", "uncs_fin", par_names, fill)
+    
+  def sub_cov(self, par_names):
+    """ Return the covariance matrix of the given parameters.
+    """
+    indices = self.par_indices(par_names)
+    return self.require("cov_mat_calc", "pars_fin")[np.ix_(indices, indices)]
+    
+  def fit_sub_cov(self, par_names):
+    """ Return the average fit covariance matrix of the given parameters.
+    """
+    indices = self.par_indices(par_names)
+    return self.require("cov_mat_avg", "cov_matrix")[np.ix_(indices,indices)]
+      
+  def status_counts(self, member, statuses):
+    """ Number of toys with each of the given status values.
+    """
+    values = getattr(self, member)
+    return [int((values == status).sum()) for status in statuses]
+    
   def __str__(self):
     """ Make this class printable.
     """
-    np.set_printoptions(linewidth=999999) # Avoid extra line breaks
-    out =  "Par. names  : {}\n".format(self.par_names)
-    out += "Par. results: {}\n".format(self.par_avg)
-    out += "Calc.    unc: {}\n".format(self.unc_vec_calc)
-    out += "Avg. fit unc: {}\n".format(self.unc_vec_avg)
-    out += "Avg. cor.mat.:\n{}\n".format(self.cor_mat_avg)
+    out =  "Par. names  : {}\n".format(array_str(self.par_names))
+    out += "Par. results: {}\n".format(array_str(self.par_avg))
+    out += "Calc.    unc: {}\n".format(array_str(self.unc_vec_calc))
+    out += "Avg. fit unc: {}\n".format(array_str(self.unc_vec_avg))
+    out += "Avg. cor.mat.:\n{}\n".format(array_str(self.cor_mat_avg))
     
+    if (self.nll is None) or (self.ndf is None) or (self.cov_status is None) or\
+       (self.min_status is None) or (self.fct_calls is None):
+      return out
     out += "Avg. NLL/ndf: {}\n".format(np.average(self.nll)/self.ndf)
     out += "Cov. status: "
-    for status in np.arange(-1,4):
-      out +="{}: {}, ".format(status,(self.cov_status == status).sum())
+    for status, n in zip(cov_statuses, 
+                         self.status_counts("cov_status", cov_statuses)):
+      out +="{}: {}, ".format(status,n)
     out += "\n"
     out += "Min. status: "
-    for status in np.arange(-1,7):
-      out +="{}: {}, ".format(status,(self.min_status == status).sum())
+    for status, n in zip(min_statuses, 
+                         self.status_counts("min_status", min_statuses)):
+      out +="{}: {}, ".format(status,n)
     out += "\n"
     out += "Avg. fct. calls: {}".format(np.average(self.fct_calls))
-    np.set_printoptions(linewidth=75) # Reset to default
-    return out
\ No newline at end of file
+    return out
+    
+  def to_dict(self):
+    """ JSON-compatible dictionary of the summary quantities, None for those
+        that couldn't be calculated.
+    """
+    counts = lambda member, statuses: None if getattr(self, member) is None \
+      else dict(zip([str(status) for status in statuses], 
+                    self.status_counts(member, statuses)))
+    nll_per_ndf = None
+    if (self.nll is not None) and (self.ndf is not None):
+      nll_per_ndf = np.average(self.nll)/self.ndf
+    return {
+      "par_names": list(self.par_names),
+      "n_toys": None if self.n_toys is None else int(self.n_toys),
+      "ndf": None if self.ndf is None else int(self.ndf),
+      "par_avg": json_value(self.par_avg),
+      "unc_calc": json_value(self.unc_vec_calc),
+      "unc_fit": json_value(self.unc_vec_avg),
+      "cor_mat_avg": json_value(self.cor_mat_avg),
+      "nll_per_ndf": json_value(nll_per_ndf),
+      "cov_status_counts": counts("cov_status", cov_statuses),
+      "min_status_counts": counts("min_status", min_statuses),
+      "avg_fct_calls": json_value(None if self.fct_calls is None 
+                                  else np.average(self.fct_calls))
+    }
+
+def align(summaries, member="unc_vec_avg", par_names=None, fill=np.nan):
+  """ Entries of the given vector member of several summaries aligned to the
+      same parameters: array [summary, parameter], with the fill value where a
+      summary doesn't have the parameter.
+      Uses the union of the parameters of all summaries if no parameter names
+      are given.
+      Returns the parameter names and the aligned array.
+  """
+  if par_names is None:
+    par_names = APNT.union([summary.par_names for summary in summaries])
+  aligned = np.full((len(summaries), len(par_names)), fill, dtype=float)
+  for row, summary in enumerate(summaries):
+    values = getattr(summary, member)
+    if values is None:
+      continue
+    indices = APNT.alignment(summary.par_names, par_names)
+    found = indices >= 0
+    aligned[row, found] = values[indices[found]]
+  return par_names, aligned
+
+def merge(summaries):
+  """ Merge the summaries of several parts of the toys of the same setup (e.g. 
+      from different shard files) without going back to the toys.
+      Averages are weighted with the number of toys, the covariance matrix of 
+      the results is combined from the partial covariance matrices and the 
+      spread of the partial averages, per-toy arrays are concatenated.
+  """
+  if len(summaries) == 1:
+    return summaries[0]
+  
+  first = summaries[0]
+  for summary in summaries[1:]:
+    if list(summary.par_names) != list(first.par_names):
+      raise Exception("Can't merge summaries with different parameters.")
+    if summary.ndf != first.ndf:
+      raise Exception("Can't merge summaries with different ndf.")
+  
+  n_toys = np.array([summary.n_toys for summary in summaries])
+  n_total = np.sum(n_toys)
+  
+  def members(member):
+    values = [getattr(summary, member) for summary in summaries]
+    return None if any([value is None for value in values]) else values
+  def weighted(member):
+    values = members(member)
+    return None if values is None else \
+           np.tensordot(n_toys, np.array(values), axes=1) / n_total
+  def concatenated(member):
+    values = members(member)
+    return None if values is None else np.concatenate(values)
+  
+  merged = ResultSummary.__new__(ResultSummary)
+  merged.par_names = first.par_names
+  merged.n_toys = n_total
+  
+  merged.par_vals = concatenated("par_vals")
+  merged.par_avg = weighted("par_avg")
+  merged.par_min = merged.par_max = None
+  merged.cov_mat_calc = merged.cor_mat_calc = merged.unc_vec_calc = None
+  if merged.par_avg is not None:
+    merged.par_min = np.amin(members("par_min"), axis=0)
+    merged.par_max = np.amax(members("par_max"), axis=0)
+    
+    # Scatter within each part plus scatter of the part averages
+    scatter = np.zeros_like(first.cov_mat_calc)
+    for n, summary in zip(n_toys, summaries):
+      diff = summary.par_avg - merged.par_avg
+      scatter += (n - 1.) * summary.cov_mat_calc + n * np.outer(diff, diff)
+    merged.cov_mat_calc = scatter / (n_total - 1.)
+    merged.cor_mat_calc = ACMC.calc_cor_mat(merged.cov_mat_calc)
+    merged.unc_vec_calc = ACMC.calc_std_dev(merged.cov_mat_calc)
+  merged.cov_mat_avg = weighted("cov_mat_avg")
+  merged.cor_mat_avg = weighted("cor_mat_avg")
+  merged.unc_vec_avg = weighted("unc_vec_avg")
+  if (merged.cov_mat_calc is not None) and (merged.unc_vec_avg is not None):
+    merged.consistency_check()
+  
+  merged.ndf = first.ndf
+  merged.nll = concatenated("nll")
+  merged.cov_status = concatenated("cov_status")
+  merged.min_status = concatenated("min_status")
+  merged.fct_calls = concatenated("fct_calls")
+  merged.n_iters = concatenated("n_iters")
+  return merged
+
@@ -0,0 +1,111 @@
+""" Declarative selection of the setups that are compared in a plot.
+
+    A setup table has one row per scenario (e.g. a collider configuration that
+    is drawn as bar) and one column per variant (e.g. a marker for the same
+    configuration with the luminosity fixed), each cell holds the key of a
+    setup (see IO.NamingConventions.setup_key). All setups of the table are
+    looked up at once, their missing summaries are calculated in one parallel
+    pass, and the plotted values are returned as aligned arrays:
+      values[scenario, variant, ...]
+"""
+
+import collections
+import numpy as np
+
+# Collider scenario: label, luminosity, run setup names by run variant (e.g.
+# "LPcnstr", "Lfixed", "Pfixed") and the difermion setup name
+Scenario = collections.namedtuple("Scenario", ["label", "lumi", "run_names",
+                                               "difparam_name"])
+
+# Variant of the scenarios: name, run variant, muon acceptance and WW setup
+Variant = collections.namedtuple("Variant", ["name", "run", "muacc_name",
+                                             "WW_name"])
+
+def collider_scenarios(pol_difparam_name=None, unpol_difparam_name=None):
+  """ The collider scenarios (beam polarisations and luminosities) that are
+      compared in the collider configuration comparisons.
+  """
+  def run_names(pol, P):
+    return { "LPcnstr": "{}_LPcnstr".format(pol),
+             "Lfixed": "{}_Lfixed_{}constr".format(pol, P),
+             "Pfixed": "{}_Lconstr_{}fixed".format(pol, P) }
+  return [
+    Scenario(r"$(80/0,30/0)$, $2$ab$^{-1}$", 2000, run_names("2polExt", "P"),
+             pol_difparam_name),
+    Scenario(r"$(80,30)$, $2$ab$^{-1}$", 2000, run_names("2pol", "P"),
+             pol_difparam_name),
+    Scenario(r"$(80,0)$, $2$ab$^{-1}$", 2000, run_names("1pol", "P"),
+             pol_difparam_name),
+    Scenario(r"$(0,0)$, $2$ab$^{-1}$", 2000, run_names("0pol", "P0"),
+             unpol_difparam_name),
+    Scenario(r"$(0,0)$, $10$ab$^{-1}$", 10000, run_names("0pol", "P0"),
+             unpol_difparam_name)
+  ]
+
+class SetupTable:
+  """ Table of setup keys: scenarios (rows) x variants (columns).
+  """
+
+  def __init__(self, scenarios, variants):
+    self.scenarios = scenarios
+    self.variants = variants
+    self.keys = [ [ (scenario.lumi, scenario.run_names[variant.run],
+                     variant.muacc_name, scenario.difparam_name,
+                     variant.WW_name)
+                    for variant in variants ]
+                  for scenario in scenarios ]
+
+  @property
+  def labels(self):
+    """ Labels of the scenarios.
+    """
+    return [scenario.label for scenario in self.scenarios]
+
+  def variant_index(self, name):
+    """ Column of the variant with the given name.
+    """
+    for i, variant in enumerate(self.variants):
+      if variant.name == name:
+        return i
+    raise Exception("Unknown variant {}".format(name))
+
+  def summaries(self, mrr, allow_missing=False):
+    """ Look up all setups of the table in the reader (or result server
+        client) and get their summaries, missing summaries are calculated (or
+        fetched) in a single parallel pass.
+        Returns a table (list of lists) of summaries, None for setups without
+        result if allow_missing is set (else an exception is raised).
+    """
+    keys = [key for row in self.keys for key in row]
+    missing = [key for key in keys if key not in mrr.results]
+    if missing and not allow_missing:
+      raise Exception("No setups found for {}".format(missing))
+    found = [key for key in keys if key in mrr.results]
+    summaries = dict(zip(found, mrr.result_summaries(found)))
+    return [ [summaries.get(key) for key in row] for row in self.keys ]
+
+  def values(self, mrr, fcts, allow_missing=False):
+    """ Values of the given function(s) of the summaries of all setups.
+        fcts is either a function of the result summary that returns an
+        array, or a list with one such function per scenario.
+        Returns an array [scenario, variant, ...] (NaN for missing setups).
+    """
+    if callable(fcts):
+      fcts = [fcts] * len(self.scenarios)
+    if len(fcts) != len(self.scenarios):
+      raise Exception("Need one function per scenario, got {} for {}".format(
+                        len(fcts), len(self.scenarios)))
+    summaries = self.summaries(mrr, allow_missing)
+    rows = [ [None if rs is None else np.asarray(fct(rs), dtype=float)
+              for rs in row] for fct, row in zip(fcts, summaries) ]
+    shapes = set([value.shape for row in rows for value in row
+                  if value is not None])
+    if len(shapes) > 1:
+      raise Exception("Values have different shapes: {}".format(shapes))
+    shape = shapes.pop() if shapes else ()
+    values = np.full((len(self.scenarios), len(self.variants)) + shape, np.nan)
+    for i, row in enumerate(rows):
+      for j, value in enumerate(row):
+        if value is not None:
+          values[i, j] = value
+    return values
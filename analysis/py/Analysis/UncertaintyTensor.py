@@ -0,0 +1,237 @@
+""" Uncertainties of all setups in one dense, labelled array.
+
+    The tensor is built once from the result summaries of a reader:
+      uncs[setup, parameter, kind]
+    with the setups sorted by their key (see IO.NamingConventions.setup_key),
+    the union of the parameters of all setups, and the kinds "calc" (spread of
+    the fitted values) and "fit" (average fit uncertainty). Parameters that a
+    setup doesn't have (or uncertainties that couldn't be calculated from the
+    read fields) are NaN.
+
+    Setups are selected with patterns for each setup dimension, e.g.
+      mrr.query(run_name="2pol_*", muacc_name="MuAccFree",
+                par_names="Delta-g1Z")
+    A pattern is "*" (anything, the default), a shell-style wildcard string,
+    a list of patterns (any of them), a function that returns whether the
+    value is selected, or a value that has to match exactly (None selects
+    setups without difermion / WW part).
+    The setups are sorted by key, so a selection is only returned as a view
+    (without copying) if its rows are evenly spaced. That is the case when
+    only leading dimensions are selected (e.g. lumi=2000, or lumi=2000 with
+    run_name="2pol_*"), because these rows are contiguous. All other pattern
+    selections copy the selected rows, e.g. run_name="2pol_*" for all
+    luminosities, which is one block of rows per luminosity.
+
+    Uncertainty ratios between two selections of setups are calculated for
+    all pairs at once, the pairing rule says which setup dimensions have to
+    be the same (and optionally which have to differ), e.g. the unpolarised
+    over polarised ratios for each luminosity, muon acceptance and WW setup:
+      mrr.ratios(dict(run_name="0pol_*"), dict(run_name=["1pol_*", "2pol*"]),
+                 same=["lumi", "muacc_name", "difparam_name", "WW_name"])
+"""
+
+import collections
+import fnmatch
+import numpy as np
+
+# Setup dimensions, in the order of the setup key
+dims = ["lumi", "run_name", "muacc_name", "difparam_name", "WW_name"]
+
+# Kinds of uncertainties and the summary member they come from
+kinds = ["calc", "fit"]
+kind_members = { "calc": "unc_vec_calc", "fit": "unc_vec_avg" }
+
+# Labelled selection of the tensor: setup keys, parameter names, kinds and the
+# values [setup, parameter, kind] (dimensions selected by a single name or
+# kind are dropped)
+TensorView = collections.namedtuple("TensorView", ["keys", "par_names",
+                                                   "kinds", "values"])
+
+# Ratios numerator / denominator: (numerator key, denominator key) of each
+# pair, parameter names, kind(s) and the values [pair, parameter, kind] (as in
+# TensorView), pair_index gives the row of each pair of keys
+RatioView = collections.namedtuple("RatioView", ["pairs", "par_names", "kinds",
+                                                 "values", "pair_index"])
+
+def sort_key(key):
+  """ Setup keys contain None's, which can't be compared to strings.
+  """
+  return tuple([(value is not None, value) for value in key])
+
+def matches(value, pattern):
+  """ Is the value selected by the pattern (see module description).
+  """
+  if isinstance(pattern, str):
+    if pattern == "*":
+      return True
+    return isinstance(value, str) and fnmatch.fnmatchcase(value, pattern)
+  if isinstance(pattern, (list, tuple, set)):
+    return any([matches(value, p) for p in pattern])
+  if callable(pattern):
+    return bool(pattern(value))
+  return value == pattern
+
+def as_slice(indices):
+  """ Evenly spaced indices as slice (so that indexing returns a view), other
+      indices are returned as they are.
+  """
+  if len(indices) == 0:
+    return slice(0, 0)
+  if len(indices) == 1:
+    return slice(indices[0], indices[0] + 1)
+  steps = np.diff(indices)
+  if np.all(steps == steps[0]):
+    return slice(indices[0], indices[-1] + 1, int(steps[0]))
+  return indices
+
+class UncertaintyTensor:
+  """ Uncertainties of all given setup results [setup, parameter, kind].
+  """
+
+  def __init__(self, setup_results, summaries):
+    order = sorted(range(len(setup_results)),
+                   key=lambda i: sort_key(setup_results[i].key()))
+    self.setup_results = [setup_results[i] for i in order]
+    summaries = [summaries[i] for i in order]
+    self.keys = [res.key() for res in self.setup_results]
+    self.key_index = { key: i for i, key in enumerate(self.keys) }
+
+    # Union of the parameters in order of first appearance
+    self.par_index = {}
+    for summary in summaries:
+      for par_name in summary.par_names:
+        self.par_index.setdefault(par_name, len(self.par_index))
+    self.par_names = list(self.par_index.keys())
+
+    self.uncs = np.full((len(self.keys), len(self.par_names), len(kinds)),
+                        np.nan)
+    for row, summary in enumerate(summaries):
+      cols = [self.par_index[par_name] for par_name in summary.par_names]
+      for k, kind in enumerate(kinds):
+        uncs = getattr(summary, kind_members[kind])
+        if uncs is not None:
+          self.uncs[row, cols, k] = uncs
+
+  def is_current(self, results):
+    """ Was the tensor built from exactly these results (dictionary by key).
+    """
+    return (len(results) == len(self.setup_results)) and \
+           all([results.get(res.key()) is res for res in self.setup_results])
+
+  def rows(self, **patterns):
+    """ Rows of the setups that match the patterns of the setup dimensions, as
+        slice if possible.
+    """
+    unknown = set(patterns.keys()) - set(dims)
+    if unknown:
+      raise Exception("Unknown setup dimensions {}, known: {}".format(
+                        list(unknown), dims))
+    selection = [patterns.get(dim, "*") for dim in dims]
+    indices = [i for i, key in enumerate(self.keys)
+               if all([matches(value, pattern)
+                       for value, pattern in zip(key, selection)])]
+    return as_slice(np.array(indices, dtype=int))
+
+  def columns(self, par_names):
+    """ Column(s) of the given parameter name(s), None for all.
+    """
+    if par_names is None:
+      return slice(None)
+    if isinstance(par_names, str):
+      if par_names not in self.par_index:
+        raise Exception("No parameter {} found.".format(par_names))
+      return self.par_index[par_names]
+    for par_name in par_names:
+      if par_name not in self.par_index:
+        raise Exception("No parameter {} found.".format(par_name))
+    return as_slice(np.array([self.par_index[par_name]
+                              for par_name in par_names], dtype=int))
+
+  def check_kind(self, kind):
+    """ Index of the given kind (None: slice of all kinds).
+    """
+    if (kind is not None) and (kind not in kinds):
+      raise Exception("Unknown uncertainty kind {}, known: {}".format(kind,
+                                                                      kinds))
+    return slice(None) if kind is None else kinds.index(kind)
+
+  def par_name_list(self, cols):
+    """ Parameter name(s) of the given column(s).
+    """
+    names = np.array(self.par_names, dtype=object)[cols]
+    return names if isinstance(cols, (int, np.integer)) else list(names)
+
+  def pairs(self, num, den, same=(), differ=(), rule=None):
+    """ Rows of the pairs of numerator and denominator setups.
+        num and den are the patterns of the setup dimensions (dictionaries) 
+        that select the numerator and denominator setups. Each numerator 
+        setup is paired with every denominator setup that has the same values
+        in the dimensions given in same, different values in those given in 
+        differ, and for which rule(num_key, den_key) is true (if given).
+        Returns two index arrays, numerator and denominator rows.
+    """
+    for dim in list(same) + list(differ):
+      if dim not in dims:
+        raise Exception("Unknown setup dimension {}, known: {}".format(dim,
+                                                                       dims))
+    same_dims = [dims.index(dim) for dim in same]
+    differ_dims = [dims.index(dim) for dim in differ]
+    rows = lambda patterns: np.arange(len(self.keys))[self.rows(**patterns)]
+
+    # Denominator setups grouped by the values that have to be the same
+    groups = collections.defaultdict(list)
+    for row in rows(den):
+      key = self.keys[row]
+      groups[tuple([key[d] for d in same_dims])].append(row)
+
+    num_rows, den_rows = [], []
+    for num_row in rows(num):
+      num_key = self.keys[num_row]
+      for den_row in groups.get(tuple([num_key[d] for d in same_dims]), []):
+        den_key = self.keys[den_row]
+        if any([num_key[d] == den_key[d] for d in differ_dims]) or \
+           (num_row == den_row):
+          continue
+        if (rule is not None) and not rule(num_key, den_key):
+          continue
+        num_rows.append(num_row)
+        den_rows.append(den_row)
+    return np.array(num_rows, dtype=int), np.array(den_rows, dtype=int)
+
+  def ratios(self, num, den, same=(), differ=(), rule=None, par_names=None,
+             kind="fit"):
+    """ Uncertainty ratios numerator / denominator of all pairs of setups 
+        (see pairs) for the given parameter(s) (None: all) and kind (None: 
+        both), calculated in one array operation.
+        Ratios involving parameters that one of the setups doesn't have are
+        NaN.
+        Returns a RatioView.
+    """
+    num_rows, den_rows = self.pairs(num, den, same, differ, rule)
+    cols = self.columns(par_names)
+    k = self.check_kind(kind)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      values = self.uncs[num_rows][:, cols][..., k] / \
+               self.uncs[den_rows][:, cols][..., k]
+    pairs = [(self.keys[i], self.keys[j]) for i, j in zip(num_rows, den_rows)]
+    return RatioView(pairs, self.par_name_list(cols), 
+                     kinds if kind is None else kind, values,
+                     { pair: i for i, pair in enumerate(pairs) })
+
+  def select(self, par_names=None, kind=None, **patterns):
+    """ Select the uncertainties of the matching setups for the given
+        parameter(s) (None: all) and kind (None: both).
+        Returns a TensorView, whose values are a view of the tensor only if
+        the selected rows are evenly spaced (see module description).
+    """
+    rows = self.rows(**patterns)
+    cols = self.columns(par_names)
+    k = self.check_kind(kind)
+
+    keys = self.keys[rows] if isinstance(rows, slice) else \
+           [self.keys[i] for i in rows]
+    # Slices (evenly spaced rows) and single indices give views, index lists
+    # (any other selection of rows) copy
+    values = self.uncs[rows][:, cols][..., k]
+    return TensorView(keys, self.par_name_list(cols), 
+                      kinds if kind is None else kind, values)
@@ -1,8 +1,6 @@
 import logging as log
-import multiprocessing as mp
-import numpy as np
+import os
 from pathlib import Path
-from tqdm import tqdm
 
 # Find and import the PrEW output reader
 import IO.SysHelp as IOSH
@@ -10,119 +8,375 @@ IOSH.find_PrOut()
 import PrOut
 
 # Local modules
-import MultiProc.ConfigHelp as MPCH
+import Analysis.ResultSummary as ARS
+import Analysis.UncertaintyTensor as AUT
+import MultiProc.SharedPool as MPSP
 import IO.NamingConventions as IONC
+import IO.ResultArchive as IORA
+import IO.ResultIntegrity as IORI
+import IO.RunResultColumns as IORRC
+import IO.RunManifest as IORM
 import IO.SetupResult as IOSR
 import Setups.DefaultSetups as SDS
 import Setups.DifParamSetup as IODPS
+import Setups.SetupGrid as SSG
 import Setups.WWSetup as IOWWS
 
          
+def read_result_file(file_path, fields=None, damaged="raise", recover=False):
+  """ Read all run results in the given result file (as columns, see 
+      IO.RunResultColumns).
+      If the file can't be read, the damaged option decides whether to raise 
+      an exception, skip it (-> no run results) or recover the completed toys 
+      (see IO.ResultIntegrity). Files that are known to be damaged can be 
+      recovered directly.
+  """
+  log.debug("Trying to read file " + file_path)
+  try:
+    if recover:
+      run_results = IORI.recover_run_results(file_path)
+    else:
+      reader = PrOut.Reader(file_path)
+      reader.read()
+      run_results = reader.run_results
+    if not run_results:
+      raise Exception("No run result found in {}".format(file_path))
+  except Exception as error:
+    if damaged == "raise":
+      raise
+    log.error("Failed reading {}: {}".format(file_path, error))
+    if (damaged == "skip") or recover:
+      return []
+    run_results = IORI.recover_run_results(file_path) or []
+  
+  # Only keep the (requested) columns in their compact form, the rest is 
+  # dropped with the reader
+  return [IORRC.from_run_result(run_result, fields) 
+          for run_result in run_results]
+
+def unmixed_files(file_names, warn=True):
+  """ The result files of one setup without mixing the file with all toys and
+      shard files: if there are shard files, only those are used (a file with
+      all toys next to them is from a different production, e.g. before the 
+      sharded rerun).
+  """
+  shards = [file_name for file_name in file_names
+            if IONC.shard_infile_pattern.match(file_name)]
+  if (not shards) or (len(shards) == len(file_names)):
+    return list(file_names)
+  if warn:
+    log.warning("Using only the shard files of {}, ignoring {}".format(
+                  shards, [file_name for file_name in file_names 
+                           if file_name not in shards]))
+  return shards
+
+def setup_files(result_dir, lumi_setup, run_setup, muacc_setup, 
+                difparam_setup, WW_setup):
+  """ Names of the existing result files of the given setup: the file with all 
+      toys and/or the shard files with parts of the toys.
+  """
+  file_name = IONC.infile_convention(lumi_setup, run_setup, muacc_setup, 
+                                     difparam_setup, WW_setup)
+  setup_name = IONC.setup_convention(lumi_setup, run_setup, muacc_setup, 
+                                     difparam_setup, WW_setup)
+  file_names = [file_name] if Path(result_dir, file_name).is_file() else []
+  shard_files = IONC.shard_files_by_setup(
+    [path.name for path in 
+     Path(result_dir).glob("fit_results_{}_shard*.out".format(setup_name))])
+  return unmixed_files(file_names + shard_files.get(setup_name, []))
+
 def find_setup_result(result_dir, lumi_setup, run_setup, muacc_setup, 
-                      difparam_setup, WW_setup):
+                      difparam_setup, WW_setup, fields=None, damaged="raise",
+                      file_names=None, recover_files=(), use_archive=True):
   """ Find the setup result for the given setup combination in the given result
       directory.
+      Setups that are in the result archive (see IO.ResultArchive) are read 
+      from there (unless use_archive is False, or the result files changed 
+      since archiving), otherwise from their result files (see setup_files, or
+      the given file names, for which the caller checked the archive). The 
+      toys of all files and all run results in them are merged into one run 
+      result.
+      If fields are given (see IO.RunResultColumns.toy_fields), only those 
+      per-toy fields of the fit results are kept.
+      Damaged files are handled as given by the damaged option, those in 
+      recover_files are directly recovered (see read_result_file).
   """
-  file_name = IONC.infile_convention(lumi_setup, run_setup, muacc_setup, 
-                                     difparam_setup, WW_setup)
-  file_path = result_dir + "/" + file_name
-  log.debug("Trying to read file " + file_path)
+  if damaged not in IORI.damaged_options:
+    raise Exception("Unknown damaged option {}, known: {}".format(
+                      damaged, IORI.damaged_options))
   
-  if not Path(file_path).is_file():
-    log.debug("File not found.")
-    return None
+  archived = None
+  if use_archive:
+    archived = IORA.read_setup(result_dir, lumi_setup, run_setup, muacc_setup,
+                               difparam_setup, WW_setup, fields)
+  if (archived is not None) and (file_names is None):
+    file_names = setup_files(result_dir, lumi_setup, run_setup, muacc_setup, 
+                             difparam_setup, WW_setup)
+    setup_name = IONC.setup_convention(lumi_setup, run_setup, muacc_setup, 
+                                       difparam_setup, WW_setup)
+    if not IORA.is_current(result_dir, setup_name, file_names, 
+                           IORM.read_manifest(result_dir)):
+      log.info("Result files of {} changed since archiving.".format(
+                 setup_name))
+      archived = None
+  if archived is not None:
+    return IOSR.SetupResult(archived, lumi_setup, run_setup, muacc_setup, 
+                            difparam_setup, WW_setup)
   
-  reader = PrOut.Reader(file_path)
-  reader.read()
+  if file_names is None:
+    file_names = setup_files(result_dir, lumi_setup, run_setup, muacc_setup, 
+                             difparam_setup, WW_setup)
   
-  if (len(reader.run_results) != 1):
-    raise Exception("Currently only able to read exactly 1 run setup per file,",
-                    " found ", len(reader.run_results))
-
-  result = reader.run_results[0]
+  run_results = []
+  for file_name in file_names:
+    run_results += read_result_file("{}/{}".format(result_dir, file_name), 
+                                    fields, damaged, file_name in recover_files)
   
-  return IOSR.SetupResult(result, lumi_setup, run_setup, muacc_setup, 
+  if len(run_results) == 0:
+    log.debug("No results found.")
+    return None
+  if len(run_results) > 1:
+    log.debug("Merging {} run results from {} files.".format(
+                len(run_results), len(file_names)))
+  try:
+    run_result = IORRC.merge(run_results)
+  except Exception as error:
+    # Can't be recovered (e.g. shards with the same toys), skip only this
+    # setup unless asked to raise
+    if damaged == "raise":
+      raise
+    log.error("Skipping setup with files {}: {}".format(file_names, error))
+    return None
+  
+  return IOSR.SetupResult(run_result, lumi_setup, run_setup, muacc_setup, 
                           difparam_setup, WW_setup)
 
+def grid_setups(grids):
+  """ All setups of the given grids by their setup key (setups that appear in 
+      multiple grids only once).
+  """
+  setups = {}
+  for grid in grids:
+    for setup in grid.combinations():
+      setups[IONC.setup_key(*setup)] = setup
+  return setups
+
 class MultiResultReader:
   """ Class that can read in the outputs produced from a large number of runs 
       with different setups.
+      The setups to read are given either as the options of a single grid, or
+      as a list of several grids (see Setups.SetupGrid) which are then all read
+      in a single parallel pass.
+      If fields are given (see IO.RunResultColumns.toy_fields), only those 
+      per-toy fields are read, the result summaries then only provide the 
+      members that can be calculated from them (see Analysis.ResultSummary).
+      Before reading, the result files are checked for damage (see 
+      IO.ResultIntegrity), damaged files are reported and then either skipped,
+      partially recovered or cause an exception (damaged option: "skip", 
+      "recover", "raise").
   """
   
-  def __init__(self, result_dir, lumi_setups, run_setups, muacc_setups, 
-               difparam_setups=[IODPS.DifParamSetup()], 
-               WW_setups=[IOWWS.WWSetup()]):
+  def __init__(self, result_dir, lumi_setups=None, run_setups=None, 
+               muacc_setups=None, difparam_setups=[IODPS.DifParamSetup()], 
+               WW_setups=[IOWWS.WWSetup()], grids=[], fields=None, 
+               damaged="skip"):
+    if damaged not in IORI.damaged_options:
+      raise Exception("Unknown damaged option {}, known: {}".format(
+                        damaged, IORI.damaged_options))
+    self.fields = fields
+    self.damaged = damaged
+    
+    # Results stored by setup key (see IO.NamingConventions.setup_key)
+    self.results = {}
     
+    # Only send the summaries when pickled (see sub_reader)
+    self.summaries_only = False
+    
+    grids = list(grids)
+    if lumi_setups is not None:
+      grids.append(SSG.SetupGrid(lumi_setups, run_setups, muacc_setups, 
+                                 difparam_setups, WW_setups))
+    self.read_grids(result_dir, grids)
+    
+  def read_grids(self, result_dir, grids):
+    """ Read all setups of the given grids from the result directory.
+        The files of all grids are read in one parallel pass.
+    """
     log.info("Reading in setup results.")
-    pool = mp.Pool(MPCH.get_n_cores()) # Read them in parallel for speed-up
-    setup_result_objects = []
-    for lumi_setup in lumi_setups:
-      for run_setup in run_setups:
-        for muacc_setup in muacc_setups:
-          for difparam_setup in difparam_setups:
-            for WW_setup in WW_setups:
-              # Run these in parallel 
-              setup_result_objects.append(
-                pool.apply_async(find_setup_result, 
-                  args=( result_dir, lumi_setup, run_setup, muacc_setup, 
-                         difparam_setup, WW_setup )))
-                         
-    # Find results (from objects used for parallel programming)
-    setup_results = np.array([o.get() for o in tqdm(setup_result_objects)])
-                              
-    # Let all processes finish
-    pool.close()
-    pool.join()
-    
-    # Remove those that were not found (-> None result)
-    self.setup_results = setup_results[setup_results!=None]
-     
-    n_found = len(self.setup_results)
-    n_possible = len(lumi_setups) * len(run_setups) * len(muacc_setups)\
-                 * len(difparam_setups) * len(WW_setups)
+    args_dict = { key: (result_dir,) + setup 
+                  for key, setup in grid_setups(grids).items() }
+    n_possible = len(args_dict)
+    
+    # If the run wrote a manifest, it is used to check the files
+    manifest = IORM.read_manifest(result_dir)
+    if manifest is not None:
+      IORM.check_naming(manifest)
+    archived = IORA.setup_names(result_dir)
+    
+    # List the directory once to find the result and shard files
+    existing = set(os.listdir(result_dir)) if os.path.isdir(result_dir) \
+               else set()
+    shard_files = IONC.shard_files_by_setup(
+                    existing | set(manifest.keys() if manifest else []))
+    
+    # Check the files of all setups that aren't archived (or whose files 
+    # changed since archiving) before reading them
+    file_names = {} # None for archived setups
+    n_stale = 0
+    for key, args in args_dict.items():
+      setup_name = IONC.setup_convention(*args[1:])
+      candidates = [IONC.infile_convention(*args[1:])] + \
+                   shard_files.get(setup_name, [])
+      if setup_name in archived:
+        if IORA.is_current(result_dir, setup_name, 
+                           [file_name for file_name in candidates 
+                            if file_name in existing], manifest):
+          file_names[key] = None
+          continue
+        n_stale += 1
+      file_names[key] = unmixed_files(
+        [file_name for file_name in candidates 
+         if (file_name in existing) or 
+            ((manifest is not None) and (file_name in manifest))])
+    if n_stale > 0:
+      log.info("Reading {} archived setups from their changed result "
+               "files.".format(n_stale))
+    statuses = IORI.scan(result_dir, 
+                         [file_name for setup_files in file_names.values() 
+                          if setup_files is not None
+                          for file_name in setup_files], 
+                         manifest)
+    damaged_files = IORI.report(statuses)
+    if damaged_files and (self.damaged == "raise"):
+      raise Exception("Found {} damaged result files.".format(
+                        len(damaged_files)))
+    
+    args_list = []
+    for key, args in args_dict.items():
+      if file_names[key] is None:
+        args_list.append(args + (self.fields, self.damaged, []))
+        continue
+      readable = [file_name for file_name in file_names[key] 
+                  if statuses[file_name] in IORI.readable_statuses]
+      recover_files = []
+      if self.damaged == "recover":
+        recover_files = [file_name for file_name in file_names[key] 
+                         if statuses[file_name] in IORI.recoverable_statuses]
+      if len(readable + recover_files) == 0:
+        continue
+      args_list.append(args + (self.fields, self.damaged, 
+                               readable + recover_files, recover_files, False))
+    
+    # Read them in parallel for speed-up (on the shared pool if there is one)
+    setup_results = MPSP.map_tasks(find_setup_result, args_list, task="io")
+    
+    # Skip those that were not found (-> None result)
+    n_found = 0
+    for setup_result in setup_results:
+      if setup_result is not None:
+        self.results[setup_result.key()] = setup_result
+        n_found += 1
+        
     log.info("Found and read {} out of {} possible setup results.".format(
               n_found, n_possible))
+              
+  @property
+  def setup_results(self):
+    """ List of all the setup results.
+    """
+    return list(self.results.values())
 
   def get(self, lumi, run_name, muacc_name, difparam_name=None, WW_name=None):
     """ Find a specific setup using the IDs for all the setup components.
     """
-    found = np.array([setup for setup in self.setup_results 
-              if setup.equals(lumi,run_name,muacc_name,difparam_name,WW_name)])
-    if len(found) == 0:
-      raise Exception("No setup found for {} {} {} {} {}".format(
-              lumi,run_name,muacc_name,difparam_name,WW_name))
-    if len(found) > 1:
-      raise Exception("{} setups found for {} {} {} {} {}".format(
-              len(found),lumi,run_name,muacc_name,difparam_name,WW_name))
-    return found[0]
+    key = (lumi, run_name, muacc_name, difparam_name, WW_name)
+    if key not in self.results:
+      raise Exception("No setup found for {} {} {} {} {}".format(*key))
+    return self.results[key]
   
+  def result_summaries(self, keys=None):
+    """ Get the result summaries of all setups (or of those with the given 
+        keys), those that were not yet calculated are calculated in parallel
+        (and kept with the results).
+    """
+    setup_results = self.setup_results if keys is None else \
+                    [self.results[key] for key in keys]
+    missing = list({ res.key(): res for res in setup_results 
+                     if res.summary is None }.values())
+    summaries = MPSP.map_tasks(ARS.ResultSummary, 
+                               [(res.run_result,) for res in missing])
+    for res, summary in zip(missing, summaries):
+      res.summary = summary
+    return [res.summary for res in setup_results]
+  
+  def uncertainty_tensor(self):
+    """ Uncertainties of all setups as one labelled array (see 
+        Analysis.UncertaintyTensor), built once and again only when the 
+        results changed.
+    """
+    tensor = getattr(self, "_tensor", None)
+    if (tensor is None) or not tensor.is_current(self.results):
+      setup_results = self.setup_results
+      tensor = AUT.UncertaintyTensor(setup_results, self.result_summaries())
+      self._tensor = tensor
+    return tensor
+    
+  def query(self, par_names=None, kind=None, **patterns):
+    """ Uncertainties of the setups that match the patterns of the setup 
+        dimensions (e.g. run_name="2pol_*"), see 
+        Analysis.UncertaintyTensor.UncertaintyTensor.select.
+    """
+    return self.uncertainty_tensor().select(par_names, kind, **patterns)
+    
+  def ratios(self, num, den, same=(), differ=(), rule=None, par_names=None,
+             kind="fit"):
+    """ Uncertainty ratios of all pairs of numerator and denominator setups 
+        (selected by patterns of the setup dimensions) that follow the pairing
+        rule, see Analysis.UncertaintyTensor.UncertaintyTensor.ratios.
+    """
+    return self.uncertainty_tensor().ratios(num, den, same, differ, rule,
+                                            par_names, kind)
+    
   def append(self, other_mrr):
     """ Add the results of another MultiResultReader to this one
     """
-    self.setup_results = np.concatenate([self.setup_results, 
-                                         other_mrr.setup_results])
+    self.results.update(other_mrr.results)
+    
+  def __getstate__(self):
+    state = dict(self.__dict__)
+    if self.summaries_only:
+      state["results"] = { key: res.summary_only() 
+                           for key, res in self.results.items() }
+    return state
+    
+def sub_reader(mrr, grids, summaries_only=False):
+  """ MultiResultReader that shares the results of the given reader (or result
+      server client) for the setups of the given grids, without reading again.
+      With summaries_only, pickling it (e.g. to send it to a worker process)
+      only sends the result summaries and not the run results.
+  """
+  reader = MultiResultReader.__new__(MultiResultReader)
+  reader.fields = getattr(mrr, "fields", None)
+  reader.damaged = getattr(mrr, "damaged", "skip")
+  reader.results = { key: mrr.results[key] for key in grid_setups(grids) 
+                     if key in mrr.results }
+  reader.summaries_only = summaries_only
+  return reader
     
 def get_default_pol_mrr(result_dir):
   """ Get the default MultiResultReader that contains are current results for 
       runs with beam polarisation.
   """
-  return MultiResultReader(result_dir, 
-    SDS.default_lumi_setups, SDS.default_pol_run_setups,
-    SDS.default_muacc_setups, SDS.default_pol_difparam_setups,
-    SDS.default_WW_setups)
+  return MultiResultReader(result_dir, grids=[SDS.default_pol_grid])
     
 def get_default_unpol_mrr(result_dir):
   """ Get the default MultiResultReader that contains are current results for 
       runs without beam polarisation.
   """
-  return MultiResultReader(result_dir, 
-    SDS.default_lumi_setups, SDS.default_unpol_run_setups,
-    SDS.default_muacc_setups, SDS.default_unpol_difparam_setups,
-    SDS.default_WW_setups)
+  return MultiResultReader(result_dir, grids=[SDS.default_unpol_grid])
     
 def get_default_mrr(result_dir):
   """ Get the default MultiResultReader that contains are current results.
   """
-  full_mrr = get_default_pol_mrr(result_dir) 
-  full_mrr.append(get_default_unpol_mrr(result_dir))
-  return full_mrr
\ No newline at end of file
+  return MultiResultReader(result_dir, grids=[SDS.default_pol_grid, 
+                                             SDS.default_unpol_grid])
\ No newline at end of file
@@ -1,6 +1,8 @@
 """ Naming conventions for files names, directories, etc.
 """
 
+import re
+
 import Setups.DifParamSetup as IODPS
 import Setups.WWSetup as IOWWS
 
@@ -16,6 +18,14 @@ def setup_convention(lumi_setup, run_setup, muacc_setup,
     name += "_" + WW_setup.name
   return name
 
+def setup_key(lumi_setup, run_setup, muacc_setup, 
+              difparam_setup=IODPS.DifParamSetup(), WW_setup=IOWWS.WWSetup()):
+  """ Key that identifies a specific setup, using the IDs of all the setup 
+      components: (lumi, run_name, muacc_name, difparam_name, WW_name)
+  """
+  return (lumi_setup, run_setup.name, muacc_setup.name, difparam_setup.name, 
+          WW_setup.name)
+
 def infile_convention(lumi_setup, run_setup, muacc_setup, 
                       difparam_setup=IODPS.DifParamSetup(), 
                       WW_setup=IOWWS.WWSetup()):
@@ -24,4 +34,31 @@ def infile_convention(lumi_setup, run_setup, muacc_setup,
   return "fit_results_{}.out".format(
            setup_convention(lumi_setup, run_setup, muacc_setup, difparam_setup, 
                             WW_setup))
-         
\ No newline at end of file
+
+def shard_infile_convention(lumi_setup, run_setup, muacc_setup, 
+                            difparam_setup=IODPS.DifParamSetup(), 
+                            WW_setup=IOWWS.WWSetup(), shard=0):
+  """ The convention for the file name of one shard of the toys of a setup 
+      (when the toys are produced in several jobs).
+  """
+  return "fit_results_{}_shard{}.out".format(
+           setup_convention(lumi_setup, run_setup, muacc_setup, difparam_setup, 
+                            WW_setup), shard)
+
+# Pattern of the shard file names, groups: setup name, shard index
+shard_infile_pattern = re.compile(r"^fit_results_(.+)_shard([0-9]+)\.out$")
+
+def shard_files_by_setup(file_names):
+  """ Sort the shard files among the given file names by their setup name 
+      (see setup_convention).
+      Returns a dictionary of the shard file names (sorted by shard index) by 
+      setup name.
+  """
+  shards = {}
+  for file_name in file_names:
+    match = shard_infile_pattern.match(file_name)
+    if match:
+      shards.setdefault(match.group(1), []).append(
+        (int(match.group(2)), file_name))
+  return { setup_name: [file_name for _, file_name in sorted(files)] 
+           for setup_name, files in shards.items() }
@@ -0,0 +1,258 @@
+""" Single-file archive that consolidates the fit results of many setups.
+
+    Reading thousands of small result files is dominated by the per-file
+    latency of the (network) file system. The archive is an uncompressed zip
+    file with one directory per setup (named by the setup convention), in which
+    each stored column of the run result (see IO.RunResultColumns, e.g. the 
+    covariance matrices as packed triangles) is stored as a .npy block:
+      <setup_name>/par_names.npy
+      <setup_name>/pars_fin.npy
+      ...
+    New setups can be appended and each setup can be read without touching
+    the others.
+    With each setup the signatures of the result files it was made from are
+    stored (size and checksum from the run manifest, or size and modification
+    time), so that the archive isn't used for a setup whose files changed or
+    got more shards since (e.g. after a rerun). Setups whose files were
+    removed after archiving are still read from the archive.
+
+    Consolidate a result directory with:
+      python -m IO.ResultArchive <result_dir>
+"""
+
+import json
+import logging as log
+import numpy as np
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import warnings
+import zipfile
+
+# Local modules
+import Analysis.NumpyHelp as ANH
+import IO.NamingConventions as IONC
+import IO.RunManifest as IORM
+import IO.RunResultColumns as IORRC
+
+archive_name = "fit_results_archive.zip"
+
+# Archives opened in this process: path -> (pid, (mtime, size), zip file)
+_open_archives = {}
+
+def archive_path(result_dir):
+  """ Path of the archive in the given result directory.
+  """
+  return "{}/{}".format(result_dir, archive_name)
+
+def _member_name(setup_name, column):
+  """ Name of the block of the given column of a setup within the archive.
+  """
+  return "{}/{}.npy".format(setup_name, column)
+
+def open_archive(result_dir):
+  """ Open the archive of the given result directory for reading, or return
+      None if there is none.
+      The archive stays open, so that the index is only read once per process
+      (reopened if the archive changed or after forking).
+  """
+  path = archive_path(result_dir)
+  if not Path(path).is_file():
+    return None
+
+  stat = os.stat(path)
+  version = (stat.st_mtime_ns, stat.st_size)
+  if path in _open_archives:
+    pid, archive_version, archive = _open_archives[path]
+    if pid == os.getpid() and archive_version == version:
+      return archive
+    if pid == os.getpid():
+      archive.close()
+
+  archive = zipfile.ZipFile(path, "r")
+  _open_archives[path] = (os.getpid(), version, archive)
+  return archive
+
+def setup_names(result_dir):
+  """ Set of the names (see IO.NamingConventions.setup_convention) of all
+      setups in the archive of the given result directory (empty if there is no
+      archive).
+  """
+  archive = open_archive(result_dir)
+  if archive is None:
+    return set()
+  return set([ name.split("/")[0] for name in archive.namelist()
+               if name.endswith("/par_names.npy") ])
+
+def file_signatures(result_dir, file_names, manifest=None):
+  """ Signatures of the existing given result files, by file name: size and
+      checksum of the manifest entry, or (for files that are not in the
+      manifest) size and modification time.
+  """
+  manifest = manifest or {}
+  signatures = {}
+  for file_name in file_names:
+    if file_name in manifest:
+      entry = manifest[file_name]
+      signatures[file_name] = ["crc32", entry["size"], entry["crc32"]]
+      continue
+    try:
+      stat = os.stat("{}/{}".format(result_dir, file_name))
+    except OSError:
+      continue
+    signatures[file_name] = ["mtime", stat.st_size, stat.st_mtime_ns]
+  return signatures
+
+def archived_sources(result_dir, setup_name):
+  """ Signatures of the result files from which the setup was archived (see
+      file_signatures), None if the archive doesn't have them (setups archived
+      before they were stored).
+  """
+  archive = open_archive(result_dir)
+  if archive is None:
+    return None
+  try:
+    with archive.open(_member_name(setup_name, "sources")) as block:
+      return json.loads(str(np.lib.format.read_array(block)))
+  except KeyError:
+    return None
+
+def is_current(result_dir, setup_name, file_names, manifest=None):
+  """ Is the archived setup up to date with its existing result files, i.e.
+      none of them is new or changed since archiving.
+  """
+  sources = archived_sources(result_dir, setup_name)
+  if sources is None:
+    return True
+  current = file_signatures(result_dir, file_names, manifest)
+  return all([sources.get(file_name) == signature
+              for file_name, signature in current.items()])
+
+def read_setup(result_dir, lumi_setup, run_setup, muacc_setup,
+               difparam_setup, WW_setup, fields=None):
+  """ Read the run result of the given setup from the archive.
+      If fields are given, only the blocks of those per-toy fields are read.
+      Returns the run result columns or None if the setup is not archived.
+  """
+  fields = IORRC.stored_fields(IORRC.toy_fields if fields is None else fields)
+
+  archive = open_archive(result_dir)
+  if archive is None:
+    return None
+
+  setup_name = IONC.setup_convention(lumi_setup, run_setup, muacc_setup,
+                                     difparam_setup, WW_setup)
+  try:
+    with archive.open(_member_name(setup_name, "par_names")) as block:
+      par_names = list(np.lib.format.read_array(block))
+  except KeyError:
+    return None
+
+  columns = {}
+  for column in fields:
+    with archive.open(_member_name(setup_name, column)) as block:
+      columns[column] = np.lib.format.read_array(block)
+  if ("cov_matrix" in columns) and (columns["cov_matrix"].ndim == 3):
+    # Archived before the covariance matrices were packed
+    columns["cov_matrix"] = ANH.sym_pack(columns["cov_matrix"])
+  return IORRC.RunResultColumns(par_names, columns)
+
+def remove_setups(result_dir, names):
+  """ Remove the setups with the given names from the archive by rewriting
+      it without their blocks (zip files can't delete members in place).
+  """
+  path = archive_path(result_dir)
+  with tempfile.NamedTemporaryFile(dir=result_dir, suffix=".zip",
+                                   delete=False) as tmp:
+    tmp_path = tmp.name
+  try:
+    with zipfile.ZipFile(path, "r") as old, \
+         zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as new:
+      for info in old.infolist():
+        if info.filename.split("/")[0] not in names:
+          with old.open(info) as src, new.open(info.filename, "w") as dst:
+            shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+def add_setups(result_dir, setup_results, replace=False):
+  """ Append the given setup results to the archive of the result directory
+      (created if it doesn't exist yet), together with the signatures of
+      their current result files.
+      Setups that are already in the archive are only written again if their
+      result files changed (see is_current) or if replace is set, the archive
+      is then rewritten without their old blocks.
+      Returns the number of added setups.
+  """
+  # Local import, the reader itself reads from the archive
+  import IO.MultiResultReader as IOMRR
+  present = setup_names(result_dir)
+  manifest = IORM.read_manifest(result_dir)
+
+  to_add = []
+  for setup_result in setup_results:
+    setup = (setup_result.lumi_setup, setup_result.run_setup,
+             setup_result.muacc_setup, setup_result.difparam_setup,
+             setup_result.WW_setup)
+    setup_name = IONC.setup_convention(*setup)
+    file_names = IOMRR.setup_files(result_dir, *setup)
+    if (setup_name in present) and (not replace) and \
+       is_current(result_dir, setup_name, file_names, manifest):
+      log.debug("Setup {} already archived.".format(setup_name))
+      continue
+    to_add.append((setup_name, setup_result,
+                   file_signatures(result_dir, file_names, manifest)))
+
+  replaced = set([setup_name for setup_name, _, _ in to_add]) & present
+  if replaced:
+    log.info("Replacing {} archived setups.".format(len(replaced)))
+    remove_setups(result_dir, replaced)
+
+  path = archive_path(result_dir)
+  n_added = 0
+  with zipfile.ZipFile(path, "a", compression=zipfile.ZIP_STORED) as archive:
+    for setup_name, setup_result, sources in to_add:
+      run_result = IORRC.from_run_result(setup_result.run_result)
+      stored_fields = IORRC.stored_fields(IORRC.toy_fields)
+      if set(run_result.columns.keys()) != set(stored_fields):
+        raise Exception("Can only archive complete results, {} has {}".format(
+                          setup_name, list(run_result.columns.keys())))
+      blocks = dict(run_result.columns)
+      blocks["sources"] = np.array(json.dumps(sources))
+      blocks["par_names"] = np.array(run_result.par_names)
+      # par_names last: only setups for which it exists count as archived
+      for column in stored_fields + ["sources", "par_names"]:
+        with warnings.catch_warnings(): # Same setup given more than once
+          warnings.simplefilter("ignore", UserWarning)
+          with archive.open(_member_name(setup_name, column), "w") as block:
+            np.lib.format.write_array(block, np.asarray(blocks[column]),
+                                      allow_pickle=False)
+      n_added += 1
+  return n_added
+
+def consolidate(result_dir, grids):
+  """ Read all result files of the given setup grids in the result directory
+      and add them to its archive.
+  """
+  # Local import, the reader itself reads from the archive
+  import IO.MultiResultReader as IOMRR
+  mrr = IOMRR.MultiResultReader(result_dir, grids=grids)
+  n_added = add_setups(result_dir, mrr.setup_results)
+  log.info("Added {} setups to {}".format(n_added, archive_path(result_dir)))
+  return n_added
+
+def main():
+  """ Consolidate the default setups of the given result directory.
+  """
+  import Setups.DefaultSetups as SDS
+  log.basicConfig(level=log.INFO)
+  if len(sys.argv) != 2:
+    raise Exception("Usage: python -m IO.ResultArchive <result_dir>")
+  consolidate(sys.argv[1], [SDS.default_pol_grid, SDS.default_unpol_grid])
+
+if __name__ == "__main__":
+  main()
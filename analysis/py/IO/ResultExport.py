@@ -0,0 +1,206 @@
+""" Export of the results of all setups as Arrow / Parquet tables, so that
+    other tools can load the whole grid without parsing text.
+
+    Two tables are written, both in long format with the setup dimensions
+    (lumi, run_name, muacc_name, difparam_name, WW_name) as columns:
+      result_summary.{parquet,arrow}  one row per setup and parameter with
+                                      the summary quantities (averages,
+                                      uncertainties, NLL/ndf, status counts)
+      result_toys.{parquet,arrow}     one row per setup, toy and parameter
+                                      with the per-toy fit values
+    Quantities that weren't read (see the fields of IO.MultiResultReader) are
+    null. The setups are written as their summaries are calculated, one record
+    batch per setup, in the order of their keys.
+
+    The .arrow files are Arrow IPC files, which can be memory mapped, e.g.
+      table = IORE.load_table(output_dir, "summary")
+    Needs the pyarrow package.
+"""
+
+import logging as log
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local modules
+import Analysis.ResultSummary as ARS
+import Analysis.UncertaintyTensor as AUT
+import IO.RunResultColumns as IORRC
+import IO.SysHelp as IOSH
+import MultiProc.SharedPool as MPSP
+
+table_names = { "summary": "result_summary", "toys": "result_toys" }
+formats = ["parquet", "arrow"]
+
+def status_column(name, status):
+  """ Name of the column with the number of toys with the given status.
+  """
+  return "n_{}_{}".format(name, status).replace("-", "m")
+
+setup_schema = [
+  pa.field("lumi", pa.int64()),
+  pa.field("run_name", pa.string()),
+  pa.field("muacc_name", pa.string()),
+  pa.field("difparam_name", pa.string()),
+  pa.field("WW_name", pa.string())
+]
+
+summary_schema = pa.schema(setup_schema + [
+  pa.field("par_name", pa.string()),
+  pa.field("n_toys", pa.int64()),
+  pa.field("par_avg", pa.float64()),
+  pa.field("par_min", pa.float64()),
+  pa.field("par_max", pa.float64()),
+  pa.field("unc_calc", pa.float64()),
+  pa.field("unc_fit", pa.float64()),
+  pa.field("nll_per_ndf", pa.float64()),
+  pa.field("avg_fct_calls", pa.float64())
+] + [pa.field(status_column("cov_status", status), pa.int64())
+     for status in ARS.cov_statuses]
+  + [pa.field(status_column("min_status", status), pa.int64())
+     for status in ARS.min_statuses])
+
+# Per-toy fields and their column type in the toy table
+toy_columns = [
+  ("pars_fin", pa.float64()),
+  ("uncs_fin", pa.float64()),
+  ("chisq_fin", pa.float64()),
+  ("cov_status", pa.int32()),
+  ("min_status", pa.int32()),
+  ("n_fct_calls", pa.int64()),
+  ("n_iters", pa.int64())
+]
+# Fields with one value per parameter (the others have one per toy)
+par_fields = ["pars_fin", "uncs_fin"]
+
+toys_schema = pa.schema(setup_schema + [
+  pa.field("toy", pa.int32()),
+  pa.field("par_name", pa.string())
+] + [pa.field(field, field_type) for field, field_type in toy_columns])
+
+def setup_arrays(key, n_rows):
+  """ Columns of the setup dimensions (the same value in each row).
+  """
+  return [pa.repeat(pa.scalar(value, field.type), n_rows)
+          for value, field in zip(key, setup_schema)]
+
+def column(values, field_type, n_rows):
+  """ Arrow column from the numpy values (without copying where possible), or
+      null if the values are not available.
+  """
+  if values is None:
+    return pa.nulls(n_rows, field_type)
+  return pa.array(np.ascontiguousarray(values), type=field_type)
+
+def summary_batch(key, summary):
+  """ Record batch with the summary table rows of a setup.
+  """
+  n_pars = len(summary.par_names)
+  per_setup = lambda value: None if value is None else np.full(n_pars, value)
+  nll_per_ndf = None
+  if (summary.nll is not None) and (summary.ndf is not None):
+    nll_per_ndf = np.average(summary.nll) / summary.ndf
+  avg_fct_calls = None
+  if summary.fct_calls is not None:
+    avg_fct_calls = np.average(summary.fct_calls)
+
+  values = [list(summary.par_names), per_setup(summary.n_toys),
+            summary.par_avg, summary.par_min, summary.par_max,
+            summary.unc_vec_calc, summary.unc_vec_avg,
+            per_setup(nll_per_ndf), per_setup(avg_fct_calls)]
+  for member, statuses in [("cov_status", ARS.cov_statuses),
+                           ("min_status", ARS.min_statuses)]:
+    if getattr(summary, member) is None:
+      values += [None] * len(statuses)
+    else:
+      values += [per_setup(n) 
+                 for n in summary.status_counts(member, statuses)]
+
+  fields = list(summary_schema)[len(setup_schema):]
+  arrays = setup_arrays(key, n_pars) + \
+           [pa.array(values[0], pa.string())] + \
+           [column(value, field.type, n_pars)
+            for value, field in zip(values[1:], fields[1:])]
+  return pa.RecordBatch.from_arrays(arrays, schema=summary_schema)
+
+def toys_batch(key, run_result):
+  """ Record batch with the per-toy table rows of a setup.
+  """
+  run_result = IORRC.from_run_result(run_result)
+  columns = run_result.columns
+  n_pars, n_toys = len(run_result.par_names), run_result.n_toys
+  n_rows = n_pars * n_toys
+
+  # Rows are ordered by toy, then parameter
+  arrays = setup_arrays(key, n_rows) + [
+    pa.array(np.repeat(np.arange(n_toys, dtype=np.int32), n_pars)),
+    pa.array(list(run_result.par_names), pa.string()).take(
+      pa.array(np.tile(np.arange(n_pars, dtype=np.int32), n_toys)))]
+  for field, field_type in toy_columns:
+    values = columns.get(field)
+    if (values is not None) and (field not in par_fields):
+      values = np.repeat(values, n_pars)
+    arrays.append(column(None if values is None else np.reshape(values, -1),
+                         field_type, n_rows))
+  return pa.RecordBatch.from_arrays(arrays, schema=toys_schema)
+
+class TableWriter:
+  """ Writes record batches of a table into a file per format.
+  """
+
+  def __init__(self, output_dir, table, schema, out_formats=formats):
+    self.writers = []
+    for out_format in out_formats:
+      path = "{}/{}.{}".format(output_dir, table_names[table], out_format)
+      if out_format == "parquet":
+        self.writers.append(pq.ParquetWriter(path, schema))
+      elif out_format == "arrow":
+        self.writers.append(pa.ipc.new_file(path, schema))
+      else:
+        raise Exception("Unknown format {}, known: {}".format(out_format,
+                                                              formats))
+
+  def write(self, batch):
+    for writer in self.writers:
+      writer.write_batch(batch)
+
+  def close(self):
+    for writer in self.writers:
+      writer.close()
+
+def export(mrr, output_dir, toys=True, out_formats=formats):
+  """ Write the summary table (and the per-toy table if toys is set) of all
+      setups of the reader into the output directory.
+      Missing summaries are calculated in parallel and each setup is written
+      as soon as its summary is there.
+  """
+  IOSH.create_dir(output_dir)
+  setup_results = sorted(mrr.setup_results,
+                         key=lambda res: AUT.sort_key(res.key()))
+  missing = [res for res in setup_results if res.summary is None]
+  summaries = MPSP.iter_tasks(ARS.ResultSummary,
+                              [(res.run_result,) for res in missing])
+
+  summary_writer = TableWriter(output_dir, "summary", summary_schema,
+                               out_formats)
+  toys_writer = TableWriter(output_dir, "toys", toys_schema, out_formats) \
+                if toys else None
+  try:
+    for res in setup_results:
+      if res.summary is None:
+        res.summary = next(summaries) # Same order as the missing results
+      summary_writer.write(summary_batch(res.key(), res.summary))
+      if toys_writer is not None:
+        toys_writer.write(toys_batch(res.key(), res.run_result))
+  finally:
+    summary_writer.close()
+    if toys_writer is not None:
+      toys_writer.close()
+  log.info("Exported {} setups to {}".format(len(setup_results), output_dir))
+
+def load_table(output_dir, table="summary"):
+  """ Load the exported table from its Arrow file (memory mapped, without
+      reading the whole file).
+  """
+  path = "{}/{}.arrow".format(output_dir, table_names[table])
+  return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
@@ -0,0 +1,192 @@
+""" Integrity checks for the result files, and recovery of the completed toys
+    from damaged (e.g. truncated) files.
+
+    Jobs that are killed (e.g. at the runtime limit of the batch system) can
+    leave truncated result files behind. The pre-scan finds these without
+    parsing the files:
+      - Files listed in the run manifest (see IO.RunManifest) are checked
+        against the size and checksum recorded when they were written.
+      - Files that are not in the manifest (e.g. written before the manifest
+        existed, or by a run without manifest) only get a structural check:
+        the output is written as JSON, so a completely written file ends with
+        the closing bracket of its top level and all its brackets are closed
+        (counted without parsing). Files that pass but then fail to parse are
+        handled when reading them.
+"""
+
+import logging as log
+import numpy as np
+import os
+from pathlib import Path
+import tempfile
+import types
+import zlib
+
+# Find and import the PrEW output reader
+import IO.SysHelp as IOSH
+IOSH.find_PrOut()
+import PrOut
+
+# Local modules
+import IO.RunResultColumns as IORRC
+import MultiProc.SharedPool as MPSP
+
+# Status of a checked file
+ok_status = "ok" # Matches the manifest entry
+unverified_status = "unverified" # No manifest, structure looks complete
+absent_status = "absent" # Neither file nor manifest entry (wasn't run)
+missing_status = "missing" # In manifest, but file doesn't exist
+unindexed_status = "unindexed" # Not in the existing manifest, structure
+                               # looks complete
+truncated_status = "truncated" # Smaller than in manifest or incomplete
+corrupt_status = "corrupt" # Size or checksum differs from manifest
+
+# Status of files that can be read as they are
+readable_statuses = [ok_status, unverified_status, unindexed_status]
+
+# Status of files that are damaged, but may be partially recoverable
+recoverable_statuses = [truncated_status, corrupt_status]
+
+# Options how to deal with damaged files
+damaged_options = ["raise", "skip", "recover"]
+
+def crc32(file_path, chunk_size=1<<20):
+  """ CRC-32 checksum of the file (same as written by the run).
+  """
+  crc = 0
+  with open(file_path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      crc = zlib.crc32(chunk, crc)
+  return crc & 0xFFFFFFFF
+
+def is_complete_json(file_path, chunk_size=1<<20):
+  """ Does the (non-empty) file look like completely written JSON: ends with
+      a closing bracket and has as many opening as closing brackets.
+  """
+  depth = 0
+  last = b""
+  with open(file_path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      depth += chunk.count(b"{") - chunk.count(b"}") + \
+               chunk.count(b"[") - chunk.count(b"]")
+      stripped = chunk.rstrip()
+      if stripped:
+        last = stripped[-1:]
+  return (depth == 0) and (last in [b"}", b"]"])
+
+def check_file(file_path, entry=None, has_manifest=False,
+               verify_checksum=True):
+  """ Check the result file against its manifest entry (if any) without
+      parsing it, returns its status.
+  """
+  if not Path(file_path).is_file():
+    return absent_status if entry is None else missing_status
+
+  size = os.path.getsize(file_path)
+  if entry is None:
+    if (size == 0) or not is_complete_json(file_path):
+      return truncated_status
+    return unindexed_status if has_manifest else unverified_status
+
+  if size < entry["size"]:
+    return truncated_status
+  if size != entry["size"]:
+    return corrupt_status
+  if verify_checksum and (crc32(file_path) != entry["crc32"]):
+    return corrupt_status
+  return ok_status
+
+def scan(result_dir, file_names, manifest=None, verify_checksums=True):
+  """ Check the given files of the result directory (in parallel).
+      Returns a dictionary with the status of each file.
+  """
+  has_manifest = manifest is not None
+  manifest = manifest or {}
+  args_list = [("{}/{}".format(result_dir, file_name),
+                manifest.get(file_name), has_manifest, verify_checksums)
+               for file_name in file_names]
+  statuses = MPSP.map_tasks(check_file, args_list, task="io")
+  return dict(zip(file_names, statuses))
+
+def report(statuses):
+  """ Log the damaged files and return their names.
+  """
+  damaged = [file_name for file_name, status in statuses.items()
+             if status not in readable_statuses + [absent_status]]
+  for file_name in damaged:
+    log.warning("Damaged result file ({}): {}".format(statuses[file_name],
+                                                      file_name))
+  if damaged:
+    log.warning("{} out of {} checked result files are damaged.".format(
+                  len(damaged), len(statuses)))
+  return damaged
+
+def is_complete_toy(fit_result, n_pars):
+  """ Check that the fit result of a toy has all values (and no NaN's).
+  """
+  try:
+    shapes = [(np.shape(fit_result.pars_fin), (n_pars,)),
+              (np.shape(fit_result.uncs_fin), (n_pars,)),
+              (np.shape(fit_result.cov_matrix), (n_pars, n_pars)),
+              (np.shape(fit_result.cor_matrix), (n_pars, n_pars))]
+    if any([shape != expected for shape, expected in shapes]):
+      return False
+    return all([np.all(np.isfinite(getattr(fit_result, field)))
+                for field in IORRC.toy_fields])
+  except (AttributeError, TypeError, ValueError):
+    return False
+
+def parse_lines(lines):
+  """ Try to parse the given lines of a result file, returns the run results
+      or None if they can't be parsed.
+  """
+  with tempfile.NamedTemporaryFile("w", suffix=".out", delete=False) as tmp:
+    tmp.writelines(lines)
+  try:
+    reader = PrOut.Reader(tmp.name)
+    reader.read()
+    return reader.run_results if len(reader.run_results) > 0 else None
+  except Exception:
+    return None
+  finally:
+    os.remove(tmp.name)
+
+def recover_run_results(file_path):
+  """ Recover the completely written toys of a damaged result file.
+      Finds the longest parsable beginning of the file by removing lines from
+      its end (first in growing steps, then by bisection), and keeps the toys
+      that are complete.
+      Returns the recovered run results (as IO.RunResultColumns) or None.
+  """
+  with open(file_path) as f:
+    lines = f.readlines()
+
+  n_drop, n_failed = 0, -1
+  run_results = parse_lines(lines)
+  while run_results is None:
+    n_failed, n_drop = n_drop, max(1, 2 * n_drop)
+    if n_drop >= len(lines):
+      log.error("Nothing to recover in {}".format(file_path))
+      return None
+    run_results = parse_lines(lines[:-n_drop])
+
+  # Drop as few lines as possible
+  while n_drop - n_failed > 1:
+    n_try = (n_drop + n_failed) // 2
+    results_try = parse_lines(lines[:len(lines)-n_try])
+    if results_try is None:
+      n_failed = n_try
+    else:
+      n_drop, run_results = n_try, results_try
+
+  recovered = []
+  for run_result in run_results:
+    n_pars = len(run_result.par_names)
+    toys = [fr for fr in run_result.fit_results if is_complete_toy(fr, n_pars)]
+    if len(toys) > 0:
+      recovered.append(IORRC.from_run_result(types.SimpleNamespace(
+        par_names=run_result.par_names, fit_results=toys)))
+
+  log.warning("Recovered {} toys from {}".format(
+                sum([rr.n_toys for rr in recovered]), file_path))
+  return recovered if recovered else None
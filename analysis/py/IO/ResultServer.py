@@ -0,0 +1,438 @@
+""" Resident server that keeps the read results in memory and serves them over
+    a local (Unix) socket, so that scripts and notebooks don't have to read
+    all results again.
+
+    Start the server (from the py directory) with:
+      python -m IO.ResultServer <result_dir> [<socket_path>]
+    and get the results in a script with:
+      mrr = IORSV.get_mrr(result_dir, grids=grids)
+    which returns a client with the same interface as the MultiResultReader
+    (get, results, setup_results, result_summaries) if the server is running
+    and serves all needed setups, else a normal MultiResultReader. If the
+    result files changed since the server read them, the server reads them
+    again first.
+
+    Protocol: each message is a JSON header line, followed by the raw bytes
+    of the arrays that are described in the header (no pickling).
+"""
+
+import getpass
+import json
+import logging as log
+import numpy as np
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+
+# Local modules
+import Analysis.ResultSummary as ARS
+import Analysis.UncertaintyTensor as AUT
+import IO.MultiResultReader as IOMRR
+import IO.ResultArchive as IORA
+import IO.RunManifest as IORM
+import IO.RunResultColumns as IORRC
+import IO.SetupResult as IOSR
+import MultiProc.SharedPool as MPSP
+import Setups.DifParamSetup as IODPS
+import Setups.MuAccSetup as IOMAS
+import Setups.RunSetup as IORS
+import Setups.WWSetup as IOWWS
+
+def default_socket_path():
+  """ Default path of the server socket: in the temporary directory, one per
+      user (can be set with the RESULT_SERVER_SOCKET environment variable).
+  """
+  if "RESULT_SERVER_SOCKET" in os.environ:
+    return os.environ["RESULT_SERVER_SOCKET"]
+  return "{}/PrEWMultiSetupTest_results_{}.sock".format(tempfile.gettempdir(),
+                                                         getpass.getuser())
+
+def directory_signatures(result_dir):
+  """ Signatures of the result files, the manifest and the archive in the
+      result directory (see IO.ResultArchive.file_signatures), to find out
+      whether the results changed since they were read.
+  """
+  if not os.path.isdir(result_dir):
+    return {}
+  file_names = [ file_name for file_name in sorted(os.listdir(result_dir))
+                 if file_name.endswith(".out") or
+                    file_name in [IORM.manifest_name, IORA.archive_name] ]
+  return IORA.file_signatures(result_dir, file_names,
+                              IORM.read_manifest(result_dir))
+
+# ------------------------------------------------------------------------------
+# Message transfer
+
+def send_message(sock, header, arrays={}):
+  """ Send the header (JSON-compatible dictionary) and the given arrays.
+  """
+  arrays = { name: np.ascontiguousarray(array)
+             for name, array in arrays.items() }
+  header = dict(header)
+  header["arrays"] = [ { "name": name, "dtype": array.dtype.str,
+                         "shape": list(array.shape) }
+                       for name, array in arrays.items() ]
+  sock.sendall((json.dumps(header) + "\n").encode())
+  for array in arrays.values():
+    sock.sendall(memoryview(array.reshape(-1).view(np.uint8)))
+
+def receive_message(rfile):
+  """ Receive a header and its arrays from the (binary) socket file.
+      Returns the header and a dictionary of the arrays, or (None, None) if the
+      connection was closed.
+  """
+  line = rfile.readline()
+  if not line:
+    return None, None
+  header = json.loads(line)
+  arrays = {}
+  for spec in header["arrays"]:
+    dtype = np.dtype(spec["dtype"])
+    buffer = bytearray(int(np.prod(spec["shape"])) * dtype.itemsize)
+    if rfile.readinto(buffer) != len(buffer):
+      raise Exception("Connection closed while receiving arrays.")
+    arrays[spec["name"]] = np.frombuffer(buffer, dtype).reshape(spec["shape"])
+  return header, arrays
+
+def to_key(key):
+  """ Setup key from its JSON form.
+  """
+  return tuple(key)
+
+def summary_message(summary, prefix=""):
+  """ Header entries and arrays that describe the summary, the array names get
+      the given prefix.
+  """
+  arrays = { prefix + member: getattr(summary, member)
+             for member in ARS.array_members
+             if getattr(summary, member) is not None }
+  scalars = { member: int(getattr(summary, member))
+              for member in ARS.scalar_members
+              if getattr(summary, member) is not None }
+  return { "par_names": list(summary.par_names), "scalars": scalars }, arrays
+
+def summary_from_message(header, arrays, prefix=""):
+  """ Summary from its header entries and arrays (see summary_message).
+  """
+  members = { name[len(prefix):]: array for name, array in arrays.items()
+              if name.startswith(prefix) }
+  members.update(header["scalars"])
+  return ARS.ResultSummary.from_members(header["par_names"], members)
+
+# ------------------------------------------------------------------------------
+# Server
+
+class ResultRequestHandler(socketserver.StreamRequestHandler):
+  """ Handles the requests of a single client connection.
+  """
+
+  def handle(self):
+    while True:
+      request, _ = receive_message(self.rfile)
+      if request is None:
+        return
+      try:
+        header, arrays = self.server.answer(request)
+      except Exception as error:
+        header, arrays = { "error": str(error) }, {}
+      send_message(self.request, header, arrays)
+
+class ResultServer(socketserver.ThreadingUnixStreamServer):
+  """ Server that keeps the results of the given setup grids in memory.
+  """
+  daemon_threads = True
+
+  def __init__(self, result_dir, grids, socket_path=None):
+    self.result_dir = result_dir
+    self.grids = grids
+    self.socket_path = socket_path or default_socket_path()
+    self.lock = threading.Lock()
+    self.read()
+
+    if os.path.exists(self.socket_path):
+      os.remove(self.socket_path) # Left over from a server that was killed
+    super().__init__(self.socket_path, ResultRequestHandler)
+    os.chmod(self.socket_path, 0o600)
+
+  def read(self):
+    """ (Re-)read the results and calculate their summaries.
+    """
+    # Taken before reading, so that changes while reading are seen later
+    signatures = directory_signatures(self.result_dir)
+    with MPSP.shared_pool():
+      mrr = IOMRR.MultiResultReader(self.result_dir, grids=self.grids)
+      mrr.result_summaries()
+    with self.lock:
+      self.mrr = mrr
+      self.signatures = signatures
+
+  def setup_result(self, key):
+    """ The setup result with the given key.
+    """
+    if key not in self.mrr.results:
+      raise Exception("No setup found for {} {} {} {} {}".format(*key))
+    return self.mrr.results[key]
+
+  def answer(self, request):
+    """ Answer a request, returns the header and the arrays to send.
+    """
+    op = request["op"]
+    if op == "info":
+      return { "result_dir": os.path.realpath(self.result_dir),
+               "setups": list(IOMRR.grid_setups(self.grids).keys()),
+               "signatures": self.signatures }, {}
+    elif op == "keys":
+      return { "keys": list(self.mrr.results.keys()) }, {}
+    elif op == "summary":
+      res = self.setup_result(to_key(request["key"]))
+      with self.lock:
+        summary = res.result_summary()
+      return summary_message(summary)
+    elif op == "summaries":
+      # Several summaries in one message, array names prefixed by "<index>/"
+      headers, arrays = [], {}
+      for i, key in enumerate(request["keys"]):
+        res = self.setup_result(to_key(key))
+        with self.lock:
+          summary = res.result_summary()
+        header, summary_arrays = summary_message(summary, "{}/".format(i))
+        headers.append(header)
+        arrays.update(summary_arrays)
+      return { "summaries": headers }, arrays
+    elif op == "run_result":
+      res = self.setup_result(to_key(request["key"]))
+      run_result = IORRC.from_run_result(res.run_result, request.get("fields"))
+      return { "par_names": list(run_result.par_names) }, run_result.columns
+    elif op == "reload":
+      self.read()
+      return { "n_results": len(self.mrr.results) }, {}
+    raise Exception("Unknown request {}".format(op))
+
+  def server_close(self):
+    super().server_close()
+    if os.path.exists(self.socket_path):
+      os.remove(self.socket_path)
+
+# ------------------------------------------------------------------------------
+# Client
+
+class RemoteSetupResult(IOSR.SetupResult):
+  """ Setup result whose run result and summary are only fetched from the
+      server when needed.
+  """
+  __slots__ = ("client",)
+
+  def __init__(self, client, key):
+    self.client = client
+    super().__init__(None, key[0], IORS.RunSetup(key[1]),
+                     IOMAS.MuAccSetup(key[2]), IODPS.DifParamSetup(key[3]),
+                     IOWWS.WWSetup(key[4]))
+
+  @property
+  def run_result(self):
+    run_result = IOSR.SetupResult.run_result.__get__(self)
+    if run_result is None:
+      run_result = self.client.run_result(self.key())
+      IOSR.SetupResult.run_result.__set__(self, run_result)
+    return run_result
+
+  @run_result.setter
+  def run_result(self, run_result):
+    IOSR.SetupResult.run_result.__set__(self, run_result)
+
+  def result_summary(self):
+    if self.summary is None:
+      self.summary = self.client.summary(self.key())
+    return self.summary
+
+  def __reduce__(self):
+    """ Sockets can't be pickled, send a normal setup result instead.
+    """
+    setup_result = IOSR.SetupResult(self.run_result, self.lumi_setup,
+                                    self.run_setup, self.muacc_setup,
+                                    self.difparam_setup, self.WW_setup)
+    setup_result.summary = self.summary
+    return setup_result.__reduce__()
+
+class ResultClient:
+  """ Client that provides the results of the result server with the interface
+      of the MultiResultReader.
+  """
+
+  def __init__(self, socket_path=None):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(socket_path or default_socket_path())
+    self.rfile = self.sock.makefile("rb")
+    self.results = { key: RemoteSetupResult(self, key)
+                     for key in self.keys() }
+
+  def request(self, op, **kwargs):
+    """ Send a request to the server and return its answer.
+    """
+    request = dict(kwargs)
+    request["op"] = op
+    send_message(self.sock, request)
+    header, arrays = receive_message(self.rfile)
+    if header is None:
+      raise Exception("Result server closed the connection.")
+    if "error" in header:
+      raise Exception(header["error"])
+    return header, arrays
+
+  def info(self):
+    """ The result directory, all setups of the grids of the server and the
+        signatures of the result files when the server read them (see
+        directory_signatures).
+    """
+    header, _ = self.request("info")
+    return header["result_dir"], [to_key(key) for key in header["setups"]], \
+           header["signatures"]
+
+  def keys(self):
+    """ The keys of all setups that the server has results for.
+    """
+    header, _ = self.request("keys")
+    return [to_key(key) for key in header["keys"]]
+
+  def summary(self, key):
+    """ Get the result summary of the setup with the given key.
+    """
+    header, arrays = self.request("summary", key=list(key))
+    return summary_from_message(header, arrays)
+
+  def run_result(self, key, fields=None):
+    """ Get the run result (as columns) of the setup with the given key.
+    """
+    header, arrays = self.request("run_result", key=list(key), fields=fields)
+    return IORRC.RunResultColumns(header["par_names"], arrays)
+
+  def reload(self):
+    """ Let the server read the results again.
+    """
+    self.request("reload")
+    self.results = { key: RemoteSetupResult(self, key)
+                     for key in self.keys() }
+
+  @property
+  def setup_results(self):
+    """ List of all the setup results.
+    """
+    return list(self.results.values())
+
+  def get(self, lumi, run_name, muacc_name, difparam_name=None, WW_name=None):
+    """ Find a specific setup using the IDs for all the setup components.
+    """
+    key = (lumi, run_name, muacc_name, difparam_name, WW_name)
+    if key not in self.results:
+      raise Exception("No setup found for {} {} {} {} {}".format(*key))
+    return self.results[key]
+
+  def result_summaries(self, keys=None):
+    """ Get the result summaries of all setups (or of those with the given
+        keys), those that were not yet fetched are fetched in one request.
+    """
+    setup_results = self.setup_results if keys is None else \
+                    [self.results[key] for key in keys]
+    missing = list({ res.key(): res for res in setup_results
+                     if res.summary is None }.values())
+    if missing:
+      header, arrays = self.request("summaries",
+                                    keys=[list(res.key()) for res in missing])
+      for i, (res, summary_header) in enumerate(zip(missing,
+                                                    header["summaries"])):
+        res.summary = summary_from_message(summary_header, arrays,
+                                           "{}/".format(i))
+    return [res.result_summary() for res in setup_results]
+
+  def uncertainty_tensor(self):
+    """ Uncertainties of all setups as one labelled array (see 
+        Analysis.UncertaintyTensor), built once and again only when the 
+        results changed.
+    """
+    tensor = getattr(self, "_tensor", None)
+    if (tensor is None) or not tensor.is_current(self.results):
+      setup_results = self.setup_results
+      tensor = AUT.UncertaintyTensor(setup_results, self.result_summaries())
+      self._tensor = tensor
+    return tensor
+
+  def query(self, par_names=None, kind=None, **patterns):
+    """ Uncertainties of the setups that match the patterns of the setup 
+        dimensions (e.g. run_name="2pol_*"), see 
+        Analysis.UncertaintyTensor.UncertaintyTensor.select.
+    """
+    return self.uncertainty_tensor().select(par_names, kind, **patterns)
+
+  def ratios(self, num, den, same=(), differ=(), rule=None, par_names=None,
+             kind="fit"):
+    """ Uncertainty ratios of all pairs of numerator and denominator setups 
+        (selected by patterns of the setup dimensions) that follow the pairing
+        rule, see Analysis.UncertaintyTensor.UncertaintyTensor.ratios.
+    """
+    return self.uncertainty_tensor().ratios(num, den, same, differ, rule,
+                                            par_names, kind)
+
+  def close(self):
+    self.rfile.close()
+    self.sock.close()
+
+def get_mrr(result_dir, grids, socket_path=None, **kwargs):
+  """ Get the results of the given grids from the result server if it is
+      running for the same result directory and has all the setups, else read
+      them with a MultiResultReader (with the additional keyword arguments).
+      If the result files changed since the server read them, the server
+      reads them again; if they also change while it reads them, or if the
+      server doesn't answer properly, the results are read here.
+  """
+  socket_path = socket_path or default_socket_path()
+  if os.path.exists(socket_path):
+    client = None
+    try:
+      client = ResultClient(socket_path)
+      server_dir, server_setups, signatures = client.info()
+      needed = set(IOMRR.grid_setups(grids).keys())
+      if (server_dir == os.path.realpath(result_dir)) and \
+         needed.issubset(server_setups):
+        if signatures != directory_signatures(result_dir):
+          log.info("Result files changed, result server reads them again.")
+          client.reload()
+          _, _, signatures = client.info()
+        if signatures == directory_signatures(result_dir):
+          log.info("Using results from result server {}".format(socket_path))
+          return client
+        log.info("Result files changed while the result server read them.")
+      else:
+        log.info("Result server doesn't serve the needed setups.")
+      client.close()
+    except Exception as error:
+      # Also if the server closed the connection or answered with an error
+      log.info("Result server not usable: {}".format(error))
+      if client is not None:
+        client.close()
+  return IOMRR.MultiResultReader(result_dir, grids=grids, **kwargs)
+
+def main():
+  """ Serve the default setups of the given result directory.
+  """
+  import Setups.DefaultSetups as SDS
+  log.basicConfig(level=log.INFO)
+  if len(sys.argv) not in [2, 3]:
+    raise Exception("Usage: python -m IO.ResultServer <result_dir> "
+                    "[<socket_path>]")
+  socket_path = sys.argv[2] if len(sys.argv) == 3 else None
+  server = ResultServer(sys.argv[1],
+                        [SDS.default_pol_grid, SDS.default_unpol_grid],
+                        socket_path)
+  log.info("Serving results on {}".format(server.socket_path))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    log.info("Stopping result server.")
+  finally:
+    server.server_close()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,251 @@
+""" Watch mode that reads the results while the production is still running.
+
+    The result directory is polled in regular intervals. New or changed result
+    files of the expected setups are read as soon as they are completely
+    written, and the setup results and their summaries are updated. New shard
+    files (see IO.NamingConventions) of an already read setup are merged into
+    the existing result and summary without reading the other files again.
+    Only the setups that the multi-setup run (source/main.cpp) produces are
+    expected, setups of the grids that it skips are left out.
+    Optionally, all setups are added to the result archive (see
+    IO.ResultArchive) once they are complete, so that later reading is fast.
+
+    Watch the default setups with:
+      python -m IO.ResultWatcher <result_dir> [<poll interval in s>]
+"""
+
+import logging as log
+import os
+import sys
+import time
+
+# Local modules
+import Analysis.ResultSummary as ARS
+import IO.MultiResultReader as IOMRR
+import IO.NamingConventions as IONC
+import IO.ResultArchive as IORA
+import IO.RunManifest as IORM
+import IO.RunResultColumns as IORRC
+import IO.SetupResult as IOSR
+import MultiProc.SharedPool as MPSP
+
+def is_produced(setup):
+  """ Does the multi-setup run produce the given setup (same skip rules as in
+      source/main.cpp): it needs a difermion or a WW part, and without
+      difermion part the LPfixed runs need a free WW parameter.
+  """
+  lumi_setup, run_setup, muacc_setup, difparam_setup, WW_setup = setup
+  if difparam_setup.name is not None:
+    return True
+  if WW_setup.name is None:
+    return False
+  return not ((WW_setup.name == "WW_xs0Fixd_AFixd") and
+              ("LPfixed" in run_setup.name))
+
+def read_and_summarise(result_dir, setup, fields, damaged, file_names):
+  """ Read the given result files of a setup and calculate the summary of
+      their toys.
+      Returns (setup result, summary), or None if nothing could be read.
+      The summary is None if it can't be calculated from these toys alone.
+  """
+  setup_result = IOMRR.find_setup_result(result_dir, *setup, fields=fields,
+                                         damaged=damaged, file_names=file_names,
+                                         use_archive=False)
+  if setup_result is None:
+    return None
+  summary = None
+  if setup_result.run_result.n_toys > 1:
+    summary = setup_result.result_summary()
+  return setup_result, summary
+
+class ResultWatcher:
+  """ Class that keeps a MultiResultReader up to date with the result files
+      that appear in the result directory.
+      Files are considered completely written when they are in the run
+      manifest with their final size, or (without manifest) when they didn't
+      change for settle_time seconds or since the last poll.
+  """
+
+  def __init__(self, result_dir, grids, fields=None, damaged="skip",
+               archive=False, expected_toys=None, settle_time=60.):
+    if archive and (fields is not None):
+      raise Exception("Can only archive results that were read completely.")
+
+    self.result_dir = result_dir
+    self.setups = { key: setup for key, setup
+                    in IOMRR.grid_setups(grids).items() if is_produced(setup) }
+    self.mrr = IOMRR.MultiResultReader(result_dir, grids=[], fields=fields,
+                                       damaged=damaged)
+    self.archive = archive
+    self.expected_toys = expected_toys
+    self.settle_time = settle_time
+
+    # Signatures (size, modification time) of the files by setup key, as they
+    # were when they were read
+    self.read_files = {}
+    # Signatures of all files at the last poll
+    self.seen_files = {}
+    # Setups for which mixed result and shard files were reported
+    self.mixed = set()
+
+  def ready_files(self):
+    """ Signatures of all completely written result files of the expected
+        setups, by setup key.
+    """
+    existing = set(os.listdir(self.result_dir)) \
+               if os.path.isdir(self.result_dir) else set()
+    manifest = IORM.read_manifest(self.result_dir)
+    shard_files = IONC.shard_files_by_setup(existing)
+
+    ready, seen = {}, {}
+    for key, setup in self.setups.items():
+      candidates = [file_name for file_name 
+                    in [IONC.infile_convention(*setup)] + 
+                       shard_files.get(IONC.setup_convention(*setup), [])
+                    if file_name in existing]
+      unmixed = IOMRR.unmixed_files(candidates, warn=key not in self.mixed)
+      if len(unmixed) < len(candidates):
+        self.mixed.add(key)
+      for file_name in unmixed:
+        try:
+          stat = os.stat("{}/{}".format(self.result_dir, file_name))
+        except OSError: # Removed in the meantime
+          continue
+        signature = (stat.st_size, stat.st_mtime_ns)
+        seen[file_name] = signature
+
+        if manifest is not None:
+          entry = manifest.get(file_name)
+          complete = (entry is not None) and (entry["size"] == stat.st_size)
+        else:
+          complete = (self.seen_files.get(file_name) == signature) or \
+                     (time.time() - stat.st_mtime > self.settle_time)
+        if complete:
+          ready.setdefault(key, {})[file_name] = signature
+
+    self.seen_files = seen
+    return ready
+
+  def poll(self):
+    """ Read all new or changed result files (in parallel).
+        Returns the keys of the setups that were updated.
+    """
+    jobs = [] # (key, incremental update?, files to read, all ready files)
+    for key, files in self.ready_files().items():
+      previous = self.read_files.get(key, {})
+      if files == previous:
+        continue
+      # Only new files -> read only those and merge them into the result
+      incremental = (key in self.mrr.results) and \
+                    all([files.get(file_name) == signature
+                         for file_name, signature in previous.items()])
+      to_read = [file_name for file_name in files
+                 if not (incremental and file_name in previous)]
+      jobs.append((key, incremental, to_read, files))
+    if not jobs:
+      return []
+
+    log.info("Reading {} new or changed setups.".format(len(jobs)))
+    outputs = MPSP.map_tasks(read_and_summarise,
+                             [(self.result_dir, self.setups[key],
+                               self.mrr.fields, self.mrr.damaged, to_read)
+                              for key, _, to_read, _ in jobs],
+                             task="io")
+
+    updated = []
+    for (key, incremental, _, files), output in zip(jobs, outputs):
+      self.read_files[key] = files # Only read again when changed
+      if output is None:
+        continue
+      setup_result, summary = output
+      if incremental:
+        previous = self.mrr.results[key]
+        try:
+          run_result = IORRC.merge([previous.run_result, 
+                                    setup_result.run_result])
+        except Exception as error:
+          if self.mrr.damaged == "raise":
+            raise
+          log.error("Not adding the new files of {}: {}".format(key, error))
+          continue
+        setup_result = IOSR.SetupResult(run_result, *self.setups[key])
+        if (previous.summary is not None) and (summary is not None):
+          summary = ARS.merge([previous.summary, summary])
+        else:
+          summary = None # Recalculated when needed
+      setup_result.summary = summary
+      self.mrr.results[key] = setup_result
+      updated.append(key)
+
+    self.report()
+    return updated
+
+  def n_complete(self):
+    """ Number of expected setups that are complete (have results, and the
+        expected number of toys if given).
+    """
+    return len([key for key in self.setups if key in self.mrr.results and
+                (self.expected_toys is None or
+                 self.mrr.results[key].run_result.n_toys >= self.expected_toys)])
+
+  def is_complete(self):
+    """ Are all expected setups complete.
+    """
+    return self.n_complete() == len(self.setups)
+
+  def report(self):
+    """ Log the current completion of the expected setups.
+    """
+    n_toys = sum([res.run_result.n_toys for res in self.mrr.setup_results])
+    log.info("Complete: {} / {} setups ({} with results, {} toys)".format(
+               self.n_complete(), len(self.setups), len(self.mrr.results),
+               n_toys))
+
+  def watch(self, interval=60., timeout=None, callback=None):
+    """ Poll the result directory every interval seconds until all expected
+        setups are complete, the timeout (in seconds) is reached or it is
+        interrupted (Ctrl+C).
+        After each poll with updates, callback(watcher, updated_keys) is
+        called (e.g. to redo plots).
+        If archiving, the setups are added to the archive once all are
+        complete (not when stopped before, the setups may still change).
+        Returns the MultiResultReader with the results.
+    """
+    start = time.time()
+    with MPSP.shared_pool():
+      try:
+        while True:
+          updated = self.poll()
+          if updated and (callback is not None):
+            callback(self, updated)
+          if self.is_complete():
+            log.info("All expected setups complete.")
+            if self.archive:
+              IORA.add_setups(self.result_dir, self.mrr.setup_results,
+                              replace=True)
+            break
+          if (timeout is not None) and (time.time() - start > timeout):
+            log.info("Stopped watching after timeout.")
+            break
+          time.sleep(interval)
+      except KeyboardInterrupt:
+        log.info("Stopped watching.")
+    return self.mrr
+
+def main():
+  """ Watch the default setups in the given result directory and archive them
+      as they come in.
+  """
+  import Setups.DefaultSetups as SDS
+  log.basicConfig(level=log.INFO)
+  if len(sys.argv) not in [2, 3]:
+    raise Exception("Usage: python -m IO.ResultWatcher <result_dir> "
+                    "[<poll interval in s>]")
+  interval = float(sys.argv[2]) if len(sys.argv) == 3 else 60.
+  watcher = ResultWatcher(sys.argv[1],
+                          [SDS.default_pol_grid, SDS.default_unpol_grid],
+                          archive=True)
+  watcher.watch(interval)
+
+if __name__ == "__main__":
+  main()
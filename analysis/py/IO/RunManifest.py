@@ -0,0 +1,96 @@
+""" Reading the manifest that the multi-setup run writes next to its output 
+    files (see source/Helpers/RunManifest.h).
+    Each line of the manifest describes one completely written output file:
+      {"file": ..., "setup": {<all setup options>}, "n_toys": ..., 
+       "size": ..., "crc32": ...}
+"""
+
+import json
+import logging as log
+from pathlib import Path
+
+# Local modules
+import IO.NamingConventions as IONC
+import Setups.DifParamSetup as IODPS
+import Setups.MuAccSetup as IOMAS
+import Setups.RunSetup as IORS
+import Setups.WWSetup as IOWWS
+
+manifest_name = "fit_results_manifest.jsonl"
+
+def manifest_path(result_dir):
+  """ Path of the manifest in the given result directory.
+  """
+  return "{}/{}".format(result_dir, manifest_name)
+
+def read_manifest(result_dir):
+  """ Read the manifest of the given result directory.
+      Returns a dictionary of the entries by file name, or None if the 
+      directory has no manifest.
+      If a file was written multiple times, the last entry is used.
+      The manifest is appended by running jobs, so lines that are still being
+      written (no trailing newline) or that are damaged (e.g. interleaved
+      writes) are skipped with a warning, their files count as unindexed.
+  """
+  path = manifest_path(result_dir)
+  if not Path(path).is_file():
+    return None
+  
+  entries = {}
+  with open(path) as manifest:
+    for i, line in enumerate(manifest):
+      if not line.strip():
+        continue
+      if not line.endswith("\n"):
+        log.warning("Skipping incomplete last line of manifest {}".format(
+                      path))
+        continue
+      try:
+        entry = json.loads(line)
+        entries[entry["file"]] = entry
+      except (ValueError, KeyError, TypeError):
+        log.warning("Skipping damaged line {} of manifest {}".format(
+                      i + 1, path))
+  log.debug("Found {} files in manifest {}".format(len(entries), path))
+  return entries
+
+def entry_setups(entry):
+  """ Translate the setup options of a manifest entry into the setup 
+      components used in the analysis code:
+        (lumi_setup, run_setup, muacc_setup, difparam_setup, WW_setup)
+  """
+  options = entry["setup"]
+  
+  muacc_name = "MuAccFixd" if options["fix_mu_acc"] else "MuAccFree"
+  
+  difparam_name = options["mumu_par_name"] if options["use_mumu"] else None
+  
+  WW_name = None
+  if options["use_WW"]:
+    WW_name = "WW{}_xs0{}_A{}".format(
+      "cTGCs" if options["use_WW_TGCs"] else "",
+      "Fixd" if options["fix_WW_xs0"] else "Free",
+      "Fixd" if options["fix_WW_A"] else "Free")
+  
+  return (options["lumi"], IORS.RunSetup(options["run_name"]), 
+          IOMAS.MuAccSetup(muacc_name), IODPS.DifParamSetup(difparam_name), 
+          IOWWS.WWSetup(WW_name))
+
+def check_naming(entries):
+  """ Check that the file names written by the run agree with the naming 
+      conventions of the analysis code.
+      Returns the list of file names that don't agree.
+  """
+  mismatches = []
+  for file_name, entry in entries.items():
+    shard = entry["setup"].get("shard")
+    if shard is None:
+      expected_name = IONC.infile_convention(*entry_setups(entry))
+    else:
+      expected_name = IONC.shard_infile_convention(*entry_setups(entry), 
+                                                   shard=shard)
+    if expected_name != file_name:
+      log.error("Manifest file {} expected to be called {}".format(
+                  file_name, expected_name))
+      mismatches.append(file_name)
+  return mismatches
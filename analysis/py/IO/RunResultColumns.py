@@ -0,0 +1,151 @@
+""" Column-wise representation of a PrEW run result: one array per fit result 
+    field, with the toys along the first axis.
+    The symmetric covariance matrices are stored as packed upper triangles 
+    (see Analysis.NumpyHelp.sym_pack), the correlation matrices are not stored 
+    but derived from them when needed.
+"""
+
+import numpy as np
+import types
+
+# Local modules
+import Analysis.CovMatrixCalc as ACMC
+import Analysis.NumpyHelp as ANH
+
+# The per-toy fields of the PrEW fit results
+toy_fields = [
+  "pars_fin", "uncs_fin", "cov_matrix", "cor_matrix", "chisq_fin", 
+  "cov_status", "min_status", "n_fct_calls", "n_iters", "n_bins", 
+  "n_free_pars"
+]
+
+def check_fields(fields):
+  """ Check that the given fields are known per-toy fields and return them as 
+      list.
+  """
+  unknown = [field for field in fields if field not in toy_fields]
+  if unknown:
+    raise Exception("Unknown fit result fields {}, known: {}".format(
+                      unknown, toy_fields))
+  return list(fields)
+
+def stored_fields(fields):
+  """ The fields that need to be stored to provide the given fields (the 
+      correlation matrices are derived from the covariance matrices).
+  """
+  stored = []
+  for field in check_fields(fields):
+    field = "cov_matrix" if field == "cor_matrix" else field
+    if field not in stored:
+      stored.append(field)
+  return stored
+
+class RunResultColumns:
+  """ Class that stores a run result as arrays.
+      Provides the same interface as the PrOut run results (par_names and 
+      fit_results), so that it can be used wherever those are used.
+  """
+  def __init__(self, par_names, columns):
+    self.par_names = par_names
+    self.columns = columns
+    
+  def has(self, field):
+    """ Can the given per-toy field be provided.
+    """
+    return stored_fields([field])[0] in self.columns
+    
+  def packed_cov(self):
+    """ Per-toy covariance matrices as packed upper triangles.
+    """
+    return self.columns["cov_matrix"]
+    
+  def packed_cor(self, dtype=np.float64):
+    """ Per-toy correlation matrices as packed upper triangles, optionally in 
+        lower precision (e.g. np.float32).
+    """
+    return ACMC.calc_packed_cor_mat(self.packed_cov(), dtype)
+    
+  @property
+  def n_toys(self):
+    """ Number of toy fits in this run result.
+    """
+    return len(next(iter(self.columns.values())))
+    
+  @property
+  def fit_results(self):
+    """ Per-toy view on the columns, like the PrOut fit results.
+    """
+    columns = dict(self.columns)
+    if "cov_matrix" in columns:
+      columns["cov_matrix"] = ANH.sym_unpack(self.packed_cov())
+      columns["cor_matrix"] = ANH.sym_unpack(self.packed_cor())
+    return [types.SimpleNamespace(
+              **{field: column[i] for field, column in columns.items()})
+            for i in range(self.n_toys)]
+
+def from_run_result(run_result, fields=None):
+  """ Get the column representation of the given (PrOut) run result.
+      If fields are given, only those per-toy fields are kept.
+  """
+  fields = None if fields is None else stored_fields(fields)
+  
+  if isinstance(run_result, RunResultColumns):
+    if fields is None:
+      return run_result
+    return RunResultColumns(run_result.par_names, 
+                            { field: run_result.columns[field] 
+                              for field in fields })
+    
+  columns = {}
+  for field in stored_fields(toy_fields) if fields is None else fields:
+    if field == "cov_matrix":
+      # Pack toy by toy to never hold all full matrices
+      columns[field] = np.array([ANH.sym_pack(np.asarray(fr.cov_matrix))
+                                 for fr in run_result.fit_results])
+    else:
+      columns[field] = np.array([getattr(fr, field) 
+                                 for fr in run_result.fit_results])
+  return RunResultColumns(list(run_result.par_names), columns)
+
+def n_shared_toys(run_results):
+  """ Number of toys that appear identically in more than one of the run 
+      results (as columns), which happens if the jobs that produced them used
+      the same toy seeds.
+  """
+  field = "pars_fin" if "pars_fin" in run_results[0].columns else \
+          sorted(run_results[0].columns.keys())[0]
+  seen, n_shared = set(), 0
+  for run_result in run_results:
+    values = np.ascontiguousarray(run_result.columns[field])
+    toys = set([toy.tobytes() for toy in values.reshape(len(values), -1)])
+    n_shared += len(toys & seen)
+    seen |= toys
+  return n_shared
+
+def merge(run_results):
+  """ Merge the toys of several run results of the same setup (e.g. from 
+      several shard files) into one run result (as columns).
+      All run results need to have the same parameters and fields, and their
+      toys have to be independent (no identical toys in different results).
+  """
+  run_results = [from_run_result(run_result) for run_result in run_results]
+  if len(run_results) == 1:
+    return run_results[0]
+  
+  par_names = list(run_results[0].par_names)
+  fields = set(run_results[0].columns.keys())
+  for run_result in run_results[1:]:
+    if list(run_result.par_names) != par_names:
+      raise Exception("Can't merge run results with different parameters: "
+                      "{} vs {}".format(par_names, list(run_result.par_names)))
+    if set(run_result.columns.keys()) != fields:
+      raise Exception("Can't merge run results with different fields.")
+  n_shared = n_shared_toys(run_results)
+  if n_shared > 0:
+    raise Exception("Can't merge run results that share {} identical toys, "
+                    "the jobs used the same toy seeds.".format(n_shared))
+  
+  columns = { field: np.concatenate([run_result.columns[field] 
+                                     for run_result in run_results])
+              for field in run_results[0].columns }
+  return RunResultColumns(par_names, columns)
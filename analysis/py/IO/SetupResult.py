@@ -4,10 +4,17 @@ IOSH.find_PrOut()
 import PrOut
 
 import Analysis.ResultSummary as ARS
+import IO.NamingConventions as IONC
 
 class SetupResult:
   """ Class that stores the results and metadata of a single fit setup.
+      Results are hashable and compare equal if they describe the same setup 
+      (see key()).
+      The result summary is calculated once when first needed and then kept.
   """
+  __slots__ = ("run_result", "lumi_setup", "run_setup", "muacc_setup", 
+               "difparam_setup", "WW_setup", "summary")
+  
   def __init__(self, run_result, lumi_setup, run_setup, muacc_setup, 
                difparam_setup, WW_setup):
     self.run_result = run_result
@@ -16,6 +23,41 @@ class SetupResult:
     self.muacc_setup = muacc_setup
     self.difparam_setup = difparam_setup
     self.WW_setup = WW_setup
+    self.summary = None
+    
+  def key(self):
+    """ The key that identifies the setup of this result (see 
+        IO.NamingConventions.setup_key).
+    """
+    return IONC.setup_key(self.lumi_setup, self.run_setup, self.muacc_setup, 
+                          self.difparam_setup, self.WW_setup)
+    
+  def __eq__(self, other):
+    return isinstance(other, SetupResult) and (self.key() == other.key())
+    
+  def __hash__(self):
+    return hash(self.key())
+    
+  def __reduce__(self):
+    """ Pickle via the constructor arguments (setups get interned again when
+        unpickled), an already calculated summary is kept.
+    """
+    return (self.__class__, (self.run_result, self.lumi_setup, self.run_setup,
+                             self.muacc_setup, self.difparam_setup, 
+                             self.WW_setup), self.summary)
+    
+  def __setstate__(self, summary):
+    self.summary = summary
+    
+  def summary_only(self):
+    """ Copy of this result that only keeps the (calculated) summary and not
+        the run result, e.g. to send it to a worker process cheaply.
+    """
+    setup_result = SetupResult(None, self.lumi_setup, self.run_setup, 
+                               self.muacc_setup, self.difparam_setup, 
+                               self.WW_setup)
+    setup_result.summary = self.result_summary()
+    return setup_result
     
   def equals(self, lumi, run_name, muacc_name, difparam_name, WW_name):
     """ Is this result described by the given ID's for all the setup options.
@@ -29,4 +71,6 @@ class SetupResult:
   def result_summary(self):
     """ Get the result summary for this setup.
     """
-    return ARS.ResultSummary(self.run_result)
\ No newline at end of file
+    if self.summary is None:
+      self.summary = ARS.ResultSummary(self.run_result)
+    return self.summary
\ No newline at end of file
@@ -1,18 +1,163 @@
 """ Functions and classes to help with configuring the multiprocessing setup.
 """
 
+import logging as log
 import multiprocessing as mp
 import numpy as np
 import os
+import re
 
-def get_n_cores():
-  """ Return the number of cores that is supposed to be used.
+# Budgets for the different kinds of tasks that are run in parallel:
+#   workers per allocated cpu, expected memory per worker [MB]
+# Reading the result files is mostly waiting for the (network) file system,
+# plotting is CPU- and memory-hungry (matplotlib figures).
+task_budgets = {
+  "io":  (2.0,  500),
+  "cpu": (1.0, 1500)
+}
+
+# Share of the cores used when running interactively on a shared machine
+# (i.e. when no batch system or container limits the available cores)
+interactive_share = 1./3.
+
+# Environment variables in which batch systems announce the allocated cpus
+batch_cpu_env_vars = [
+  "SLURM_CPUS_PER_TASK", # Slurm
+  "NSLOTS", # SGE
+  "PBS_NUM_PPN", # PBS/Torque
+  "LSB_DJOB_NUMPROC" # LSF
+]
+
+def read_file(path):
+  """ Return the content of the given file, or None if it can't be read.
+  """
+  try:
+    with open(path) as f:
+      return f.read()
+  except (OSError, IOError):
+    return None
+
+def read_classad_value(ad_path, attribute):
+  """ Read a numerical attribute (e.g. "RequestCpus") from a HTCondor ClassAd
+      file. Returns None if not found.
+  """
+  content = read_file(ad_path) if ad_path else None
+  if content is None:
+    return None
+  match = re.search(r"^\s*{}\s*=\s*([0-9.]+)\s*$".format(attribute), content,
+                    flags=re.MULTILINE | re.IGNORECASE)
+  return float(match.group(1)) if match else None
+
+def affinity_cpus():
+  """ Number of cpus this process is allowed to run on (respects taskset,
+      numactl, ...).
+  """
+  if hasattr(os, "sched_getaffinity"):
+    return len(os.sched_getaffinity(0))
+  return mp.cpu_count()
+
+def cgroup_cpus():
+  """ Cpu limit set by the cgroup CPU quota (e.g. in a container or a HTCondor
+      slot with cgroup enforcement), or None if no quota is set.
+  """
+  # cgroup v2: "<quota> <period>" or "max <period>"
+  content = read_file("/sys/fs/cgroup/cpu.max")
+  if content:
+    quota, period = content.split()[:2]
+    if quota != "max":
+      return float(quota) / float(period)
+    return None
+
+  # cgroup v1
+  quota = read_file("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+  period = read_file("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+  if quota and period and int(quota) > 0:
+    return float(quota) / float(period)
+  return None
+
+def batch_cpus():
+  """ Number of cpus allocated by the batch system, or None if not running in
+      a batch job.
+  """
+  # HTCondor describes the slot in the machine ad and the job in the job ad
+  for ad_var, attribute in [("_CONDOR_MACHINE_AD", "Cpus"),
+                            ("_CONDOR_JOB_AD", "RequestCpus")]:
+    value = read_classad_value(os.environ.get(ad_var), attribute)
+    if value:
+      return value
+
+  for env_var in batch_cpu_env_vars:
+    if env_var in os.environ:
+      try:
+        return float(os.environ[env_var])
+      except ValueError:
+        log.warning("Can't interpret {}={}".format(env_var,
+                                                   os.environ[env_var]))
+  return None
+
+def available_cpus():
+  """ Return the number of cpus that this process can actually use, respecting
+      the cpu affinity, cgroup quotas and the batch system allocation.
+      When running interactively (no quota, no batch allocation) only a share
+      of the machine is used to leave room for others.
+  """
+  n_cpus = affinity_cpus()
+  limits = [l for l in [cgroup_cpus(), batch_cpus()] if l is not None]
+  if limits:
+    n_cpus = min([n_cpus] + limits)
+  else:
+    n_cpus = n_cpus * interactive_share
+  return max(1, int(np.ceil(n_cpus)))
+
+def available_memory():
+  """ Return the memory [MB] available to this process, respecting the cgroup
+      memory limit and the batch system request. Returns None if unknown.
+  """
+  limits = []
+
+  meminfo = read_file("/proc/meminfo")
+  if meminfo:
+    match = re.search(r"^MemAvailable:\s*([0-9]+)\s*kB", meminfo,
+                      flags=re.MULTILINE)
+    if match:
+      limits.append(float(match.group(1)) / 1024.)
+
+  for cgroup_file in ["/sys/fs/cgroup/memory.max",
+                      "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+    content = read_file(cgroup_file)
+    if content and content.strip().isdigit():
+      limits.append(float(content) / 1024.**2)
+
+  request = read_classad_value(os.environ.get("_CONDOR_JOB_AD"),
+                               "RequestMemory")
+  if request:
+    limits.append(request)
+
+  return min(limits) if limits else None
+
+def get_n_cores(task="cpu"):
+  """ Return the number of cores that is supposed to be used for the given kind
+      of task ("io" for reading files, "cpu" for calculations and plotting).
       Can be defined anywhere else by setting the USE_N_CORES variable with e.g.
         os.environ["USE_N_CORES"] = "7"
-      default: 1/3 of available cores (rounded up)
+      default: the available cpus (see available_cpus) scaled by the task
+               budget, limited by the available memory per worker
   """
-  n_cores = np.ceil(mp.cpu_count() / 3)
   if "USE_N_CORES" in os.environ:
-    n_cores = os.environ["USE_N_CORES"]
-  return int(n_cores)
+    return int(os.environ["USE_N_CORES"])
+
+  if task not in task_budgets:
+    raise Exception("Unknown task type {}, known: {}".format(
+                      task, list(task_budgets.keys())))
+  workers_per_cpu, mem_per_worker = task_budgets[task]
+
+  n_cores = int(np.ceil(available_cpus() * workers_per_cpu))
+
+  memory = available_memory()
+  if memory is not None:
+    n_mem = int(memory // mem_per_worker)
+    if n_mem < n_cores:
+      log.debug("Only enough memory for {} {} workers.".format(n_mem, task))
+      n_cores = n_mem
 
+  return max(1, n_cores)
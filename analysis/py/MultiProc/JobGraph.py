@@ -0,0 +1,142 @@
+""" Parallel execution of jobs that depend on each other (a directed acyclic
+    graph of jobs) on the shared worker pool (see MultiProc.SharedPool).
+
+    Each job is started as soon as all the jobs it requires are done, so that
+    e.g. a plot can be made while the summaries of other setups are still
+    being calculated. As in map_tasks, at most get_n_cores(task) jobs of each
+    task type run at the same time.
+"""
+
+import collections
+import logging as log
+import queue
+from tqdm import tqdm
+
+# Local modules
+import MultiProc.ConfigHelp as MPCH
+import MultiProc.SharedPool as MPSP
+
+# A job runs fct(*args) in a worker after the jobs named in requires are done.
+# The args can also be a function that returns them, it is called in the main
+# process when the job is started (and can use what the required jobs did).
+# If given, done(result) is called in the main process with the result.
+Job = collections.namedtuple("Job", ["name", "fct", "args", "requires", "task",
+                                     "done"],
+                             defaults=[(), (), "cpu", None])
+
+def check_jobs(jobs):
+  """ Check that the job names are unique, all required jobs exist and that
+      there are no cycles.
+      Returns the jobs by name and the names of the jobs requiring each job.
+  """
+  jobs_by_name = collections.OrderedDict()
+  for job in jobs:
+    if job.name in jobs_by_name:
+      raise Exception("Duplicate job {}".format(job.name))
+    jobs_by_name[job.name] = job
+
+  dependents = { name: [] for name in jobs_by_name }
+  for job in jobs:
+    for required in set(job.requires):
+      if required not in jobs_by_name:
+        raise Exception("Job {} requires unknown job {}".format(job.name,
+                                                                required))
+      dependents[required].append(job.name)
+
+  # Topological sort, jobs left over are in a cycle
+  n_open = { job.name: len(set(job.requires)) for job in jobs }
+  ready = [name for name, n in n_open.items() if n == 0]
+  n_sorted = 0
+  while ready:
+    name = ready.pop()
+    n_sorted += 1
+    for dependent in dependents[name]:
+      n_open[dependent] -= 1
+      if n_open[dependent] == 0:
+        ready.append(dependent)
+  if n_sorted != len(jobs_by_name):
+    cyclic = [name for name, n in n_open.items() if n > 0]
+    raise Exception("Jobs have cyclic requirements: {}".format(cyclic))
+
+  return jobs_by_name, dependents
+
+def descendants(name, dependents):
+  """ Names of all jobs that (directly or indirectly) require the given job.
+  """
+  found, to_check = set(), list(dependents[name])
+  while to_check:
+    dependent = to_check.pop()
+    if dependent not in found:
+      found.add(dependent)
+      to_check += dependents[dependent]
+  return found
+
+def run_jobs(jobs):
+  """ Run the given jobs in parallel on the shared pool, each after the jobs it
+      requires.
+      Jobs that fail are logged and the jobs requiring them are skipped, an
+      exception listing them is raised after all other jobs finished.
+      Returns the results of the jobs by name.
+  """
+  jobs_by_name, dependents = check_jobs(jobs)
+  limits = { task: MPCH.get_n_cores(task)
+             for task in set([job.task for job in jobs]) }
+  n_open = { job.name: len(set(job.requires)) for job in jobs }
+  ready = collections.deque([job.name for job in jobs
+                             if n_open[job.name] == 0])
+
+  # Results are put here by the pool's result thread: (name, success, result)
+  finished = queue.Queue()
+  n_running = collections.Counter()
+  results, failed, skipped = {}, collections.OrderedDict(), set()
+
+  with MPSP.shared_pool() as pool, tqdm(total=len(jobs)) as progress:
+    n_left = len(jobs)
+    while n_left > 0:
+      # Start every ready job for which its task type has a free slot
+      waiting = collections.deque()
+      while ready:
+        job = jobs_by_name[ready.popleft()]
+        if n_running[job.task] >= limits[job.task]:
+          waiting.append(job.name)
+          continue
+        n_running[job.task] += 1
+        try:
+          args = job.args() if callable(job.args) else job.args
+        except Exception as error:
+          finished.put((job.name, False, error))
+          continue
+        pool.apply_async(
+          job.fct, args,
+          callback=lambda result, name=job.name:
+                     finished.put((name, True, result)),
+          error_callback=lambda error, name=job.name:
+                           finished.put((name, False, error)))
+      ready = waiting
+
+      # Wait for the next job to finish
+      name, success, result = finished.get()
+      job = jobs_by_name[name]
+      n_running[job.task] -= 1
+      n_left -= 1
+      progress.update()
+      if success:
+        results[name] = result
+        if job.done is not None:
+          job.done(result)
+        for dependent in dependents[name]:
+          n_open[dependent] -= 1
+          if n_open[dependent] == 0:
+            ready.append(dependent)
+      else:
+        log.error("Job {} failed: {}".format(name, result))
+        failed[name] = result
+        to_skip = descendants(name, dependents) - skipped
+        skipped |= to_skip
+        n_left -= len(to_skip)
+        progress.update(len(to_skip))
+
+  if failed:
+    raise Exception("{} jobs failed ({}), skipped {} jobs requiring them."
+                    .format(len(failed), list(failed.keys()), len(skipped)))
+  return results
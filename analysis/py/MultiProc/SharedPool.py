@@ -0,0 +1,103 @@
+""" A process-wide worker pool that is shared by all parallel steps (reading,
+    summarising, plotting), so that the workers are only started once.
+
+    Usage:
+      with MPSP.shared_pool():
+        mrr = IOMRR.get_default_mrr(result_dir) # Reads with the shared pool
+        ...                                     # Plots with the same workers
+
+    Outside of a shared_pool context every parallel step starts (and stops)
+    its own pool, as before.
+"""
+
+import atexit
+import collections
+import contextlib
+import logging as log
+import multiprocessing as mp
+from tqdm import tqdm
+
+# Local modules
+import MultiProc.ConfigHelp as MPCH
+
+# The currently active pool and the number of contexts using it
+_pool = None
+_n_users = 0
+
+def _init_worker():
+  """ Do the expensive imports once per worker instead of once per task.
+  """
+  import matplotlib
+  matplotlib.use("Agg") # Workers never show plots
+  import matplotlib.pyplot
+
+def pool_size():
+  """ The shared pool needs to be able to serve every task type, the number of
+      tasks of each type running at the same time is limited in map_tasks.
+  """
+  return max([MPCH.get_n_cores(task) for task in MPCH.task_budgets])
+
+def _terminate():
+  """ Make sure no workers are left over when the program exits.
+  """
+  global _pool
+  if _pool is not None:
+    _pool.terminate()
+    _pool = None
+
+atexit.register(_terminate)
+
+@contextlib.contextmanager
+def shared_pool():
+  """ Context in which all parallel steps use the same worker pool.
+      Contexts can be nested, the pool is closed when the outermost one exits.
+  """
+  global _pool, _n_users
+  if _pool is None:
+    n_workers = pool_size()
+    log.debug("Starting shared pool with {} workers.".format(n_workers))
+    _pool = mp.Pool(n_workers, initializer=_init_worker)
+  _n_users += 1
+  try:
+    yield _pool
+  finally:
+    _n_users -= 1
+    if _n_users == 0:
+      _pool.close()
+      _pool.join()
+      _pool = None
+
+def iter_tasks(fct, args_list, task="cpu"):
+  """ Run fct(*args) for each args in the list on the shared pool and yield 
+      the results in the same order, each as soon as it (and all before it) 
+      is done, so that they can be processed while the others still run.
+      At most get_n_cores(task) of these tasks run at the same time, so that
+      e.g. memory hungry plotting doesn't use all workers of the pool.
+  """
+  if len(args_list) == 0:
+    return # No need to start a pool (e.g. in a worker process)
+  if mp.current_process().daemon:
+    # Pool workers can't start a pool themselves, run the tasks right here
+    for args in args_list:
+      yield fct(*args)
+    return
+  n_in_flight = MPCH.get_n_cores(task)
+  with shared_pool() as pool:
+    pending = collections.deque()
+    with tqdm(total=len(args_list)) as progress:
+      for args in args_list:
+        if len(pending) >= n_in_flight:
+          result = pending.popleft().get()
+          progress.update()
+          yield result
+        pending.append(pool.apply_async(fct, args=args))
+      while pending:
+        result = pending.popleft().get()
+        progress.update()
+        yield result
+
+def map_tasks(fct, args_list, task="cpu"):
+  """ Run fct(*args) for each args in the list on the shared pool and return
+      the results in the same order (see iter_tasks).
+  """
+  return list(iter_tasks(fct, args_list, task))
@@ -234,4 +234,10 @@ def plot_res_summary(res_summary, output_dir, extensions=["pdf","png"]):
   plot_cov_status(res_summary, output_dir, extensions)
   plot_min_status(res_summary, output_dir, extensions)
   plot_fit_calls(res_summary, output_dir, extensions)
-  
\ No newline at end of file
+    
+def plot_setup_result(setup_result, output_dir, extensions=["pdf","png"]):
+  """ Summarise the given setup result and create all its summary plots.
+      (Meant to be run in a worker process, so that the summary is calculated 
+       where it is plotted.)
+  """
+  plot_res_summary(setup_result.result_summary(), output_dir, extensions)
@@ -2,23 +2,38 @@ from decimal import Decimal
 import logging as log
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
 import Analysis.ResultSummary as ARS
-import IO.MultiResultReader as IOMRR
+import Analysis.SetupTable as AST
 import IO.NamingConventions as IONC
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Plotting.SetupPlotting as PSP
 import Setups.DifParamSetup as IODPS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 
 #-------------------------------------------------------------------------------
 
+# Variants of each collider scenario that are drawn (as bar or markers)
+variants = [
+  AST.Variant("base", "LPcnstr", "MuAccFree", None),
+  AST.Variant("L fixed", "Lfixed", "MuAccFree", None),
+  AST.Variant("P fixed", "Pfixed", "MuAccFree", None),
+  AST.Variant("MuAcc fixed", "LPcnstr", "MuAccFixd", None)
+]
+setup_table = AST.SetupTable(
+  AST.collider_scenarios("mumu_free", "mumu_unpol"), variants)
+
+# Marker and marker position of the variants that are drawn as markers
+variant_markers = [ ("L fixed", "o", 1), ("P fixed", "X", 2), 
+                    ("MuAcc fixed", "*", 3) ]
+
 def draw_setups(mrr, ax, x, y_fcts):
   """ This part should be common for all physics and nuisance histograms:
       The drawing of the different setups
@@ -27,60 +42,15 @@ def draw_setups(mrr, ax, x, y_fcts):
   marker_shifts = np.linspace(-bar_width/2,bar_width/2,5,endpoint=True)
   ms = 8 # marker size
   
-  _x = x+x_shifts[0]
-  y = y_fcts[0](mrr.get(2000, "2polExt_LPcnstr", "MuAccFree", "mumu_free").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(80/0,30/0)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  y = y_fcts[0](mrr.get(2000, "2polExt_Lfixed_Pconstr", "MuAccFree", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3)      
-  y = y_fcts[0](mrr.get(2000, "2polExt_Lconstr_Pfixed", "MuAccFree", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3)      
-  y = y_fcts[0](mrr.get(2000, "2polExt_LPcnstr", "MuAccFixd", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-  
-  _x = x+x_shifts[1]
-  y = y_fcts[1](mrr.get(2000, "2pol_LPcnstr", "MuAccFree", "mumu_free").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(80,30)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  y = y_fcts[1](mrr.get(2000, "2pol_Lfixed_Pconstr", "MuAccFree", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3)      
-  y = y_fcts[1](mrr.get(2000, "2pol_Lconstr_Pfixed", "MuAccFree", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3)      
-  y = y_fcts[1](mrr.get(2000, "2pol_LPcnstr", "MuAccFixd", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-
-  _x = x+x_shifts[2]
-  y = y_fcts[2](mrr.get(2000, "1pol_LPcnstr", "MuAccFree", "mumu_free").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(80,0)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  y = y_fcts[2](mrr.get(2000, "1pol_Lfixed_Pconstr", "MuAccFree", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3)      
-  y = y_fcts[2](mrr.get(2000, "1pol_Lconstr_Pfixed", "MuAccFree", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3)      
-  y = y_fcts[2](mrr.get(2000, "1pol_LPcnstr", "MuAccFixd", "mumu_free").result_summary())
-  ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-
-  _x = x+x_shifts[3]
-  y = y_fcts[3](mrr.get(2000, "0pol_LPcnstr", "MuAccFree", "mumu_unpol").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(0,0)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  y = y_fcts[3](mrr.get(2000, "0pol_Lfixed_P0constr", "MuAccFree", "mumu_unpol").result_summary())
-  ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3) 
-  y = y_fcts[3](mrr.get(2000, "0pol_Lconstr_P0fixed", "MuAccFree", "mumu_unpol").result_summary())
-  ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3) 
-  y = y_fcts[3](mrr.get(2000, "0pol_LPcnstr", "MuAccFixd", "mumu_unpol").result_summary())
-  ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-
-  _x = x+x_shifts[4]
-  y = y_fcts[4](mrr.get(10000, "0pol_LPcnstr", "MuAccFree", "mumu_unpol").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(0,0)$, $10$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  y = y_fcts[4](mrr.get(10000, "0pol_Lfixed_P0constr", "MuAccFree", "mumu_unpol").result_summary())
-  ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3) 
-  y = y_fcts[4](mrr.get(10000, "0pol_Lconstr_P0fixed", "MuAccFree", "mumu_unpol").result_summary())
-  ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3) 
-  y = y_fcts[4](mrr.get(10000, "0pol_LPcnstr", "MuAccFixd", "mumu_unpol").result_summary())
-  ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
+  # Values of all setups of the table at once: [scenario, variant, x]
+  y = setup_table.values(mrr, y_fcts)
+  
+  for i, label in enumerate(setup_table.labels):
+    _x = x+x_shifts[i]
+    bar = ax.bar(_x, y[i,0], width=bar_width, align='center', zorder=2, label=label)
+    color = bar.patches[0].get_facecolor()
+    for variant, marker, shift in variant_markers:
+      ax.plot(_x+marker_shifts[shift], y[i,setup_table.variant_index(variant)], mec="black", ls="", marker=marker, ms=ms, color=color, zorder=3)
 
 def markers_to_legend_handles(ax):
   """ Add extra entries to legend that describe the markers for different tested 
@@ -98,7 +68,7 @@ def markers_to_legend_handles(ax):
 #-------------------------------------------------------------------------------
 
 def make_fit_function(x_par_names, par_norm):
-  return lambda rs: np.array([rs.fit_unc(par) if par in rs.par_names else -0.3 for par in x_par_names]) / par_norm
+  return lambda rs: rs.fit_uncs(x_par_names, -0.3) / par_norm
 
 #-------------------------------------------------------------------------------
 
@@ -198,14 +168,15 @@ def nuisance_par_plot(mrr, output_dir, scale):
 
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["uncs_fin"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   pol_lumi_setups = [ 2000 ]
   unpol_lumi_setups = [ 2000, 10000 ]
   pol_run_setups = [
@@ -235,20 +206,35 @@ def main():
     IODPS.DifParamSetup("mumu_unpol", "free", "fixed", "fixed", "free->AFB", "free->k0", "fixed")
   ]
   
-  mrr = IOMRR.MultiResultReader(fit_output_base, pol_lumi_setups, 
-                                pol_run_setups, muacc_setups, 
-                                pol_difparam_setups)
-  mrr.append(IOMRR.MultiResultReader(fit_output_base, unpol_lumi_setups, 
-                                     unpol_run_setups, muacc_setups, 
-                                     unpol_difparam_setups))
+  return [
+    SSG.SetupGrid(pol_lumi_setups, pol_run_setups, muacc_setups,
+                  difparam_setups=pol_difparam_setups),
+    SSG.SetupGrid(unpol_lumi_setups, unpol_run_setups, muacc_setups,
+                  difparam_setups=unpol_difparam_setups)
+  ]
 
-  # Output directories
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/ColliderConfigComparison/Difermion".format(output_base)
 
   scale = 1.e-4
-  difermion_par_plot(mrr, output_dir, "81to101", "return-to-Z", scale)
-  difermion_par_plot(mrr, output_dir, "180to275", r"high-$\sqrt{s*}$", scale)
-  nuisance_par_plot(mrr, output_dir, scale)
+  return [
+    ("difermion_81to101", difermion_par_plot, (mrr, output_dir, "81to101", "return-to-Z", scale)),
+    ("difermion_180to275", difermion_par_plot, (mrr, output_dir, "180to275", r"high-$\sqrt{s*}$", scale)),
+    ("nuisance", nuisance_par_plot, (mrr, output_dir, scale))
+  ]
+
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
@@ -2,20 +2,21 @@ from decimal import Decimal
 import logging as log
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
 import Analysis.ResultSummary as ARS
-import IO.MultiResultReader as IOMRR
+import Analysis.SetupTable as AST
 import IO.NamingConventions as IONC
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Plotting.SetupPlotting as PSP
 import Setups.DifParamSetup as IODPS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 import Setups.WWSetup as IOWWS
 
 #-------------------------------------------------------------------------------
@@ -26,6 +27,22 @@ def adjust_ebar(ebar, ls):
   ebar[-1][0].set_linestyle(ls)
   return ebar
 
+# Variants of each collider scenario that are drawn (as bar, markers or 
+# errorbar)
+variants = [
+  AST.Variant("base", "LPcnstr", "MuAccFree", "WWcTGCs_xs0Free_AFixd"),
+  AST.Variant("L fixed", "Lfixed", "MuAccFree", "WWcTGCs_xs0Free_AFixd"),
+  AST.Variant("P fixed", "Pfixed", "MuAccFree", "WWcTGCs_xs0Free_AFixd"),
+  AST.Variant("MuAcc fixed", "LPcnstr", "MuAccFixd", "WWcTGCs_xs0Free_AFixd"),
+  AST.Variant("xs0 fixed", "LPcnstr", "MuAccFree", "WWcTGCs_xs0Fixd_AFixd"),
+  AST.Variant("ALR free", "LPcnstr", "MuAccFree", "WWcTGCs_xs0Free_AFree")
+]
+setup_table = AST.SetupTable(AST.collider_scenarios(), variants)
+
+# Marker and marker position of the variants that are drawn as markers
+variant_markers = [ ("L fixed", "o", 2), ("P fixed", "X", 3), 
+                    ("MuAcc fixed", "*", 4), ("xs0 fixed", "^", 1) ]
+
 def draw_setups(mrr, ax, x, y_fcts, draw_markers=True):
   """ This part should be common for all physics and nuisance histograms:
       The drawing of the different setups
@@ -43,85 +60,18 @@ def draw_setups(mrr, ax, x, y_fcts, draw_markers=True):
   ebar_width = 3
   ebar_cap = 5
   
-  _x = x+x_shifts[0]
-  y = y_fcts[0](mrr.get(2000, "2polExt_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(80/0,30/0)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  if draw_markers:
-    y = y_fcts[0](mrr.get(2000, "2polExt_Lfixed_Pconstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3)      
-    y = y_fcts[0](mrr.get(2000, "2polExt_Lconstr_Pfixed", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3)      
-    y = y_fcts[0](mrr.get(2000, "2polExt_LPcnstr", "MuAccFixd", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[4], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-    y = y_fcts[0](mrr.get(2000, "2polExt_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Fixd_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="^", ms=ms, color=color, zorder=3)      
-  y = ebar_prep(y_fcts[0](mrr.get(2000, "2polExt_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()))
-  adjust_ebar(ax.errorbar(_x+ebar_shifts[1], eps_zeros, yerr=y, color=color, capsize=ebar_cap, capthick=ebar_width, elinewidth=ebar_width), ls="--")
+  # Values of all setups of the table at once: [scenario, variant, x]
+  y = setup_table.values(mrr, y_fcts)
   
-  _x = x+x_shifts[1]
-  y = y_fcts[1](mrr.get(2000, "2pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(80,30)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  if draw_markers:
-    y = y_fcts[1](mrr.get(2000, "2pol_Lfixed_Pconstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3)      
-    y = y_fcts[1](mrr.get(2000, "2pol_Lconstr_Pfixed", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3)      
-    y = y_fcts[1](mrr.get(2000, "2pol_LPcnstr", "MuAccFixd", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[4], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-    y = y_fcts[1](mrr.get(2000, "2pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Fixd_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="^", ms=ms, color=color, zorder=3) 
-  y = ebar_prep(y_fcts[1](mrr.get(2000, "2pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()))
-  adjust_ebar(ax.errorbar(_x+ebar_shifts[1], eps_zeros, yerr=y, color=color, capsize=ebar_cap, capthick=ebar_width, elinewidth=ebar_width), ls="--")
-
-  _x = x+x_shifts[2]
-  y = y_fcts[2](mrr.get(2000, "1pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(80,0)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  if draw_markers:
-    y = y_fcts[2](mrr.get(2000, "1pol_Lfixed_Pconstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3)      
-    y = y_fcts[2](mrr.get(2000, "1pol_Lconstr_Pfixed", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3)      
-    y = y_fcts[2](mrr.get(2000, "1pol_LPcnstr", "MuAccFixd", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[4], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-    y = y_fcts[2](mrr.get(2000, "1pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Fixd_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="^", ms=ms, color=color, zorder=3) 
-  y = ebar_prep(y_fcts[2](mrr.get(2000, "1pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()))
-  adjust_ebar(ax.errorbar(_x+ebar_shifts[1], eps_zeros, yerr=y, color=color, capsize=ebar_cap, capthick=ebar_width, elinewidth=ebar_width), ls="--")
-
-  _x = x+x_shifts[3]
-  y = y_fcts[3](mrr.get(2000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(0,0)$, $2$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  if draw_markers:
-    y = y_fcts[3](mrr.get(2000, "0pol_Lfixed_P0constr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3) 
-    y = y_fcts[3](mrr.get(2000, "0pol_Lconstr_P0fixed", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3) 
-    y = y_fcts[3](mrr.get(2000, "0pol_LPcnstr", "MuAccFixd", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[4], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-    y = y_fcts[3](mrr.get(2000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Fixd_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="^", ms=ms, color=color, zorder=3) 
-  y = ebar_prep(y_fcts[3](mrr.get(2000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()))
-  adjust_ebar(ax.errorbar(_x+ebar_shifts[1], eps_zeros, yerr=y, color=color, capsize=ebar_cap, capthick=ebar_width, elinewidth=ebar_width), ls="--")
-
-  _x = x+x_shifts[4]
-  y = y_fcts[4](mrr.get(10000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-  bar = ax.bar(_x, y, width=bar_width, align='center', zorder=2, label=r"$(0,0)$, $10$ab$^{-1}$")
-  color = bar.patches[0].get_facecolor()
-  if draw_markers:
-    y = y_fcts[4](mrr.get(10000, "0pol_Lfixed_P0constr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[2], y, mec="black", ls="", marker="o", ms=ms, color=color, zorder=3) 
-    y = y_fcts[4](mrr.get(10000, "0pol_Lconstr_P0fixed", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[3], y, mec="black", ls="", marker="X", ms=ms, color=color, zorder=3) 
-    y = y_fcts[4](mrr.get(10000, "0pol_LPcnstr", "MuAccFixd", WW_name="WWcTGCs_xs0Free_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[4], y, mec="black", ls="", marker="*", ms=ms, color=color, zorder=3)      
-    y = y_fcts[4](mrr.get(10000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Fixd_AFixd").result_summary())
-    ax.plot(_x+marker_shifts[1], y, mec="black", ls="", marker="^", ms=ms, color=color, zorder=3) 
-  y = ebar_prep(y_fcts[4](mrr.get(10000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()))
-  adjust_ebar(ax.errorbar(_x+ebar_shifts[1], eps_zeros, yerr=y, color=color, capsize=ebar_cap, capthick=ebar_width, elinewidth=ebar_width), ls="--")
+  for i, label in enumerate(setup_table.labels):
+    _x = x+x_shifts[i]
+    bar = ax.bar(_x, y[i,0], width=bar_width, align='center', zorder=2, label=label)
+    color = bar.patches[0].get_facecolor()
+    if draw_markers:
+      for variant, marker, shift in variant_markers:
+        ax.plot(_x+marker_shifts[shift], y[i,setup_table.variant_index(variant)], mec="black", ls="", marker=marker, ms=ms, color=color, zorder=3)
+    y_ebar = ebar_prep(y[i,setup_table.variant_index("ALR free")])
+    adjust_ebar(ax.errorbar(_x+ebar_shifts[1], eps_zeros, yerr=y_ebar, color=color, capsize=ebar_cap, capthick=ebar_width, elinewidth=ebar_width), ls="--")
 
 def markers_to_legend_handles(ax, draw_markers=True):
   """ Add extra entries to legend that describe the markers for different tested 
@@ -154,12 +104,9 @@ def markers_to_legend_handles(ax, draw_markers=True):
 
 def make_fit_function(x_par_names, par_norm):
   # Needs some weird special treatment to make sure xs0 marker is drawn when fix
-  return lambda rs: (np.array([rs.fit_unc(par) if par in rs.par_names 
-                                              else -0.3 
-                              for par in x_par_names]) + \
-                     np.array([0.3 if (par in ["ScaleTotChiXS_WW_muminus", "ScaleTotChiXS_WW_muplus"] and par not in rs.par_names) 
-                                   else 0
-                              for par in x_par_names])) / par_norm 
+  fill = np.where(np.isin(x_par_names, ["ScaleTotChiXS_WW_muminus", 
+                                        "ScaleTotChiXS_WW_muplus"]), 0, -0.3)
+  return lambda rs: rs.fit_uncs(x_par_names, fill) / par_norm 
 
 #-------------------------------------------------------------------------------
 
@@ -294,14 +241,15 @@ def nuisance_par_plot(mrr, output_dir, scale):
 
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["uncs_fin"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   pol_lumi_setups = [ 2000 ]
   unpol_lumi_setups = [ 2000, 10000 ]
   pol_run_setups = [
@@ -330,21 +278,36 @@ def main():
     IOWWS.WWSetup("WWcTGCs_xs0Fixd_AFixd")
   ]
   
-  mrr = IOMRR.MultiResultReader(fit_output_base, pol_lumi_setups, 
-                                pol_run_setups, muacc_setups, 
-                                WW_setups=WW_setups)
-  mrr.append(IOMRR.MultiResultReader(fit_output_base, unpol_lumi_setups, 
-                                     unpol_run_setups, muacc_setups, 
-                                     WW_setups=WW_setups))
-
-  # Output directories
+  return [
+    SSG.SetupGrid(pol_lumi_setups, pol_run_setups, muacc_setups,
+                  WW_setups=WW_setups),
+    SSG.SetupGrid(unpol_lumi_setups, unpol_run_setups, muacc_setups,
+                  WW_setups=WW_setups)
+  ]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/ColliderConfigComparison/WW".format(output_base)
 
   scale = 1.e-4
-  TGC_par_plot(mrr, output_dir, scale)
-  TGC_par_plot(mrr, output_dir, scale, set_ylim=False)
-  WW_par_plot(mrr, output_dir, scale)
-  nuisance_par_plot(mrr, output_dir, scale)
+  return [
+    ("TGC", TGC_par_plot, (mrr, output_dir, scale)),
+    ("TGC_noylim", TGC_par_plot, (mrr, output_dir, scale, False)),
+    ("WW", WW_par_plot, (mrr, output_dir, scale)),
+    ("nuisance", nuisance_par_plot, (mrr, output_dir, scale))
+  ]
+
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
   main()
@@ -1,18 +1,20 @@
 import logging as log
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import IO.MultiResultReader as IOMRR
+import Analysis.Combination as ACB
+import Analysis.ErrorPropagation as AEP
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Plotting.Statistics as PS
 import Setups.DifParamSetup as IODPS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 
 #-------------------------------------------------------------------------------
 
@@ -80,17 +82,7 @@ def cov_to_relative(cov, mass_label):
   """
   Ae_true = truth_vals[mass_label]["Ae"]
   Af_true = truth_vals[mass_label]["Af"]
-  scaling = np.array([ [Ae_true**2, Ae_true*Af_true],
-                       [Ae_true*Af_true, Af_true**2] ])
-  return cov / scaling
-
-#-------------------------------------------------------------------------------
-
-def add_indep_Ae_to_cov(cov, unc_Ae):
-  """ Add the an independent Ae measurement to the given covariance matrix.
-  """
-  inv_taupol_cov = np.array([[1/unc_Ae**2, 0], [0, 0]])
-  return np.linalg.inv(np.linalg.inv(cov) + inv_taupol_cov)
+  return AEP.propagate_linear(np.diag([1./Ae_true, 1./Af_true]), cov)
 
 #-------------------------------------------------------------------------------
 
@@ -114,14 +106,13 @@ def draw_ellipse(ax, rs, Ae_name, Af_name, mass_label, mumu_only=True,
   i_Ae = rs.par_index(Ae_name)
   i_Af = rs.par_index(Af_name)
   full_cov = rs.cov_mat_avg
-  AeAf_cov = np.array([[full_cov[i_Ae,i_Ae],full_cov[i_Af,i_Ae]],
-                       [full_cov[i_Ae,i_Af],full_cov[i_Af,i_Af]]])
                        
+  constraints = []
   if not mumu_only:
     # Add the ALR measurement from other 2f final states 
     stat_scale = np.sqrt(3.36/(80.0-3.36)) # 3.36% mumu VS 80% visible Z decays
-    unc_ALR_other = stat_scale * np.sqrt(AeAf_cov[0][0])
-    AeAf_cov = add_indep_Ae_to_cov(AeAf_cov, unc_ALR_other)
+    unc_ALR_other = stat_scale * np.sqrt(full_cov[i_Ae,i_Ae])
+    constraints.append(ACB.independent(Ae_name, unc_ALR_other))
     
   if use_taupol and (mass_label=="return-to-Z"):
     # Add the Ae measurement from tau polarisation
@@ -129,8 +120,11 @@ def draw_ellipse(ax, rs, Ae_name, Af_name, mass_label, mumu_only=True,
     N_tautau = lumi * truth_vals[mass_label]["sigma0"]
     # TODO HERE: Correct for different Ae val
     unc_Ae_taupol = Ae_from_taupol_LEPextrap(N_tautau, mass_label)
+    constraints.append(ACB.independent(Ae_name, unc_Ae_taupol))
     
-    AeAf_cov = add_indep_Ae_to_cov(AeAf_cov, unc_Ae_taupol)
+  # Combine on the full covariance matrix, then project onto Ae-Af
+  full_cov = ACB.combine(full_cov, rs.par_names, constraints)
+  AeAf_cov = full_cov[np.ix_([i_Ae, i_Af], [i_Ae, i_Af])]
                        
   AeAf_cov = cov_to_relative(AeAf_cov, mass_label)
   PS.confidence_ellipse(AeAf_cov, 1, 1, ax, n_std=1.0, **kwargs)
@@ -173,13 +167,12 @@ def draw_unpol_ellipse(ax, unc_AFB, unc_Ae, mass_label, scale=1.0, **kwargs):
   ef = truth_vals[mass_label]["ef"]
   AFB = 3./8. * (ef + 2 * Ae * Af)
   
-  # Transform the covariance matrix from AFB:Ae to Amu:Ae
+  # Transform the covariance matrix from Ae:AFB to Ae:Amu
   cov_AeAFB = np.array([[unc_Ae**2, 0.],
                         [0.,        unc_AFB**2]])
-  transf_mat = np.array([
-    [1.,                                            0.               ],
-    [- 1./(2.*Ae**2) * (8./3. * AFB - ef),          8/3 * 1./(2.*Ae) ] ])
-  cov_AeAf = np.matmul(np.matmul(transf_mat, cov_AeAFB), transf_mat.T) 
+  AeAf = AEP.Observable(["Ae", "AFB"], 
+                        lambda Ae, AFB: [Ae, Af_fromAFB(AFB, Ae, ef)])
+  _, cov_AeAf = AeAf.propagate([Ae, AFB], cov_AeAFB)
   cov_AeAf = cov_AeAf * scale**2
   
   # print(np.sqrt(cov_AeAf))
@@ -251,7 +244,8 @@ def draw_ILC_GigaZ(ax, scale=1.0, mumu_only=False, **kwargs):
   if not mumu_only:                 
     N_tautau = 1.6e8
     unc_Ae_taupol = Ae_from_taupol_LEPextrap(N_tautau)
-    cov_AeAf = add_indep_Ae_to_cov(cov_AeAf, unc_Ae_taupol)
+    cov_AeAf = ACB.combine(cov_AeAf, ["Ae", "Af"], 
+                           [ACB.independent("Ae", unc_Ae_taupol)])
                   
   # Transform to the covariance matrix on the relative Ae/Ae_true : Amu/Amu_true
   cov_AeAf = cov_AeAf * scale**2
@@ -523,14 +517,15 @@ def AeAf_comparison_plot(mrr, output_dir, mass_range, label, draw_colliders=Fals
 
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["pars_fin", "uncs_fin", "cov_matrix"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   pol_lumi_setups = [ 2000 ]
   unpol_lumi_setups = [ 2000, 10000 ]
   pol_run_setups = [
@@ -551,20 +546,34 @@ def main():
     IODPS.DifParamSetup("mumu_unpol", "free", "fixed", "fixed", "free->AFB", "free->k0", "fixed")
   ]
   
-  mrr = IOMRR.MultiResultReader(fit_output_base, pol_lumi_setups, 
-                                pol_run_setups, muacc_setups, 
-                                pol_difparam_setups)
-  mrr.append(IOMRR.MultiResultReader(fit_output_base, unpol_lumi_setups, 
-                                     unpol_run_setups, muacc_setups, 
-                                     unpol_difparam_setups))
+  return [
+    SSG.SetupGrid(pol_lumi_setups, pol_run_setups, muacc_setups,
+                  difparam_setups=pol_difparam_setups),
+    SSG.SetupGrid(unpol_lumi_setups, unpol_run_setups, muacc_setups,
+                  difparam_setups=unpol_difparam_setups)
+  ]
 
-  # Output directories
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/DifermionPlaneComparison".format(output_base)
+  return [
+    ("AeAf_81to101", AeAf_comparison_plot, (mrr, output_dir, "81to101", "return-to-Z")),
+    ("AeAf_81to101_colliders_mumu", AeAf_comparison_plot, (mrr, output_dir, "81to101", "return-to-Z", True, True)),
+    ("AeAf_81to101_colliders", AeAf_comparison_plot, (mrr, output_dir, "81to101", "return-to-Z", True, False)),
+    ("AeAf_180to275", AeAf_comparison_plot, (mrr, output_dir, "180to275", r"high-$\sqrt{s*}$"))
+  ]
 
-  AeAf_comparison_plot(mrr, output_dir, "81to101", "return-to-Z")
-  AeAf_comparison_plot(mrr, output_dir, "81to101", "return-to-Z", draw_colliders=True, mumu_only=True)
-  AeAf_comparison_plot(mrr, output_dir, "81to101", "return-to-Z", draw_colliders=True, mumu_only=False)
-  AeAf_comparison_plot(mrr, output_dir, "180to275", r"high-$\sqrt{s*}$")
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
@@ -0,0 +1,115 @@
+import logging as log
+import matplotlib.pyplot as plt
+import numpy as np
+import sys
+
+# Local modules
+sys.path.append("..") # Use the modules in the top level directory
+import Analysis.FixedEmulation as AFE
+import IO.ResultServer as IORSV
+import IO.SysHelp as IOSH
+import Plotting.DefaultFormat as PDF
+import Setups.DefaultSetups as SDS
+
+""" Compare the setups with fixed parameters that were run with their
+    emulation from the setups in which the parameters are free (see
+    Analysis.FixedEmulation).
+"""
+
+#-------------------------------------------------------------------------------
+
+def key_str(key):
+  """ Readable setup key.
+  """
+  return " ".join([str(value) for value in key if value is not None])
+
+def write_validation_table(validations, output_dir):
+  """ Write the deviations of each emulated setup and of each variant.
+  """
+  IOSH.create_dir(output_dir)
+  with open("{}/fixed_emulation.txt".format(output_dir), "w") as out_file:
+    out_file.write("# variant | free setup -> fixed setup | "
+                   "max |emulated/fitted - 1| | max |cor. diff.|\n")
+    for val in validations:
+      deviation = np.amax(np.abs(val.emulated / val.fitted - 1.), initial=0.)
+      out_file.write("{} | {} -> {} | {:.4f} | {:.4f}\n".format(
+        val.variant, key_str(val.free_key), key_str(val.fixed_key), deviation,
+        val.max_cor_diff))
+
+    out_file.write("\n# variant | n setups | median / max "
+                   "|emulated/fitted - 1|\n")
+    for variant in sorted(set([val.variant for val in validations])):
+      deviations = np.abs(np.concatenate(
+        [val.emulated / val.fitted for val in validations
+         if val.variant == variant]) - 1.)
+      n_setups = len([val for val in validations if val.variant == variant])
+      out_file.write("{} | {} | {:.4f} / {:.4f}\n".format(
+        variant, n_setups, np.median(deviations), np.amax(deviations)))
+
+def validation_plot(mrr, output_dir):
+  """ Plot the ratio emulated / fitted uncertainty of all parameters of all
+      fixed setups for which the free setup exists, by variant.
+  """
+  validations = AFE.validate(mrr)
+  if not validations:
+    log.warning("No fixed setups with free counterpart found.")
+    return
+  write_validation_table(validations, output_dir)
+
+  variants = sorted(set([val.variant for val in validations]))
+  fig = plt.figure(figsize=(10,6.5), tight_layout=True)
+  ax = plt.gca()
+  rng = np.random.default_rng(0) # Fixed jitter
+  for x, variant in enumerate(variants):
+    ratios = np.concatenate([val.emulated / val.fitted
+                             for val in validations if val.variant == variant])
+    jitter = rng.uniform(-0.25, 0.25, len(ratios))
+    ax.plot(x + 0.5 + jitter, ratios, ls="", marker=".", alpha=0.5)
+
+  x = np.arange(len(variants))+0.5
+  plt.xticks(x, variants, size='large', rotation=30)
+  ax.set_xlim(0, len(variants))
+  ax.plot(ax.get_xlim(), [1,1], color="black", zorder=1)
+  ax.set_ylabel("Emulated / fitted uncertainty")
+
+  for out_format in ["pdf","png"]:
+    format_dir = "{}/{}".format(output_dir,out_format)
+    IOSH.create_dir(format_dir)
+    fig.savefig("{}/fixed_emulation.{}".format(format_dir,out_format),
+                transparent=True)
+  plt.close(fig)
+
+#-------------------------------------------------------------------------------
+
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the emulation needs (see IO.RunResultColumns)
+fields = ["uncs_fin", "cov_matrix"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
+  return [SDS.default_pol_grid, SDS.default_unpol_grid]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
+  output_dir = "{}/plots/FixedEmulation".format(output_base)
+  return [
+    ("fixed_emulation", validation_plot, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
+
+if __name__ == "__main__":
+  main()
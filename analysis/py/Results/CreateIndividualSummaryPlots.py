@@ -1,61 +1,66 @@
 import logging as log
-import multiprocessing as mp
-import os
 import sys
-from tqdm import tqdm
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import Analysis.ResultSummary as ARS
-import MultiProc.ConfigHelp as MPCH
+import MultiProc.SharedPool as MPSP
 import IO.MultiResultReader as IOMRR
 import IO.NamingConventions as IONC
 import Plotting.DefaultFormat as PDF
 import Plotting.SetupPlotting as PSP
+import Setups.DefaultSetups as SDS
 
 """ Create the individual summary plots for each result, e.g. the covariance 
     matrix, the fit behavious, the individual parameter plots, ...
 """
 
-log.basicConfig(level=log.INFO) # Set logging level
-os.environ["USE_N_CORES"] = "10"
-
 output_base = "../../../output"
 fit_output_base = "{}/run_outputs".format(output_base)
-msr = IOMRR.get_default_mrr(fit_output_base)
-
-# Output directories
-plot_base = "{}/plots".format(output_base)
 
-# Set the default matplotlib formatting
-PDF.set_default_mpl_format()
+# Per-toy fields that the plots need (None: all)
+fields = None
 
-# Create summary plots for each result (using parallel programming)
-os.environ["USE_N_CORES"] = "4" # Reduce the number of cores (goes crazy else)
-pool = mp.Pool(MPCH.get_n_cores())
-result_objects = []
+def setup_grids():
+  """ The setup grids whose results are plotted.
+  """
+  return [SDS.default_pol_grid, SDS.default_unpol_grid]
 
-log.info("Starting processes to create plots for each setup.")
-for res in tqdm(msr.setup_results):
-  setup_out_name = IONC.setup_convention(res.lumi_setup, res.run_setup, 
-                                         res.muacc_setup, res.difparam_setup,
-                                         res.WW_setup)
-  log.debug("Checking: {}".format(setup_out_name))
-  
-  # Calculate a summary of the result (e.g. cor matrix, unc., ...)
-  res_summary = ARS.ResultSummary(res.run_result)
-  
-  # Create all the summary plots for this setup (in parallel process)
-  plot_dir = "{}/SingleSetup/{}".format(plot_base,setup_out_name)
-  result_objects.append(
-    pool.apply_async(PSP.plot_res_summary, args=(res_summary,plot_dir)))
-  
-# "get" the result to get a tqdm counter of them finishing
-log.info("Running processes.")
-for r in tqdm(result_objects):
-  _ = r.get()
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), one for
+      each setup, so that they can also be run by the Results runner.
+  """
+  # Output directories
+  plot_base = "{}/plots".format(output_base)
   
-# Let all processes finish
-pool.close()
-pool.join()
-log.info("Done!")
\ No newline at end of file
+  jobs = []
+  for res in mrr.setup_results:
+    setup_out_name = IONC.setup_convention(res.lumi_setup, res.run_setup, 
+                                           res.muacc_setup, res.difparam_setup,
+                                           res.WW_setup)
+    log.debug("Checking: {}".format(setup_out_name))
+    plot_dir = "{}/SingleSetup/{}".format(plot_base,setup_out_name)
+    jobs.append((setup_out_name, PSP.plot_setup_result, (res, plot_dir)))
+  return jobs
+
+def main():
+  log.basicConfig(level=log.INFO) # Set logging level
+
+  # Set the default matplotlib formatting
+  PDF.set_default_mpl_format()
+
+  # Reading, summarising and plotting all use the same worker processes
+  with MPSP.shared_pool():
+    msr = IOMRR.get_default_mrr(fit_output_base)
+    
+    # Calculate a summary of each result (e.g. cor matrix, unc., ...) and create
+    # all the summary plots for it in a parallel process
+    # -> Plotting is memory hungry, the "cpu" budget accounts for that
+    log.info("Creating plots for each setup.")
+    MPSP.map_tasks(PSP.plot_setup_result, 
+                   [args for _, _, args in plot_jobs(msr, output_base)],
+                   task="cpu")
+    
+  log.info("Done!")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,154 @@
+import logging as log
+import matplotlib.pyplot as plt
+import numpy as np
+import sys
+
+# Local modules
+sys.path.append("..") # Use the modules in the top level directory
+import Analysis.LumiScaling as ALS
+import IO.ResultServer as IORSV
+import IO.SysHelp as IOSH
+import Plotting.DefaultFormat as PDF
+import Setups.DefaultSetups as SDS
+import Setups.DifParamSetup as IODPS
+import Setups.MuAccSetup as IOMAS
+import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
+import Setups.WWSetup as IOWWS
+
+""" Luminosity scans of the uncertainties from the luminosity surrogate (see 
+    Analysis.LumiScaling), with the leave-one-out validation of each fit.
+"""
+
+#-------------------------------------------------------------------------------
+
+# Collider configurations (setup families without the luminosity) and labels
+configurations = [
+  (("2polExt_LPcnstr", "MuAccFree", "mumu_free", "WWcTGCs_xs0Free_AFixd"), 
+   "$(80/0,30/0)$"),
+  (("2pol_LPcnstr", "MuAccFree", "mumu_free", "WWcTGCs_xs0Free_AFixd"), 
+   "$(80,30)$"),
+  (("1pol_LPcnstr", "MuAccFree", "mumu_free", "WWcTGCs_xs0Free_AFixd"), 
+   "$(80,0)$"),
+  (("0pol_LPcnstr", "MuAccFree", "mumu_unpol", "WWcTGCs_xs0Free_AFixd"), 
+   "$(0,0)$")
+]
+
+par_names = [ "Delta-g1Z", "Delta-kappa_gamma", "Delta-lambda_gamma" ]
+par_labels = [ "$g_{1}^{Z}$", "$\kappa_{\gamma}$", "$\lambda_{\gamma}$" ]
+
+def write_validation(surrogates, output_dir):
+  """ Write the largest leave-one-out error of each parameter of each family.
+  """
+  IOSH.create_dir(output_dir)
+  with open("{}/lumi_scaling_validation.txt".format(output_dir), 
+            "w") as out_file:
+    out_file.write("# Largest relative leave-one-out error of the predicted "
+                   "uncertainties\n")
+    for family, surrogate in sorted(surrogates.items(), key=lambda item: 
+                                    [str(value) for value in item[0]]):
+      out_file.write("{} (L = {})\n".format(
+        " ".join([value for value in family if value is not None]),
+        ", ".join(["{:g}".format(lumi) for lumi in surrogate.lumis])))
+      for par_name, error in zip(surrogate.par_names, 
+                                 surrogate.max_loo_error()):
+        out_file.write("  {}: {:.4f}\n".format(par_name, error))
+
+def lumi_scan_plot(mrr, output_dir):
+  """ Plot the predicted uncertainties of the TGCs as function of the 
+      luminosity for the collider configurations, with the fitted points.
+  """
+  surrogates = ALS.from_reader(mrr)
+  write_validation(surrogates, output_dir)
+  
+  lumis = np.geomspace(500, 20000, 200)
+  colors =  plt.rcParams['axes.prop_cycle'].by_key()['color']
+  fig, axes = plt.subplots(1, len(par_names), figsize=(7 * len(par_names), 6),
+                           tight_layout=True)
+  for (family, label), color in zip(configurations, colors):
+    if family not in surrogates:
+      log.warning("No luminosity surrogate for {}".format(family))
+      continue
+    surrogate = surrogates[family]
+    cols = [surrogate.par_names.index(par_name) for par_name in par_names]
+    predicted = surrogate.uncs(lumis)[:, cols]
+    fitted = np.sqrt(np.diagonal(surrogate.covs, axis1=1, axis2=2))[:, cols]
+    for i, ax in enumerate(axes):
+      ax.plot(lumis, predicted[:, i], color=color, label=label)
+      ax.plot(surrogate.lumis, fitted[:, i], color=color, ls="", marker="o")
+  
+  for ax, par_label in zip(axes, par_labels):
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("Luminosity [fb$^{-1}$]")
+    ax.set_ylabel("Uncertainty on {}".format(par_label))
+  axes[0].legend()
+
+  for out_format in ["pdf","png"]:
+    format_dir = "{}/{}".format(output_dir,out_format)
+    IOSH.create_dir(format_dir)
+    fig.savefig("{}/TGC_lumi_scan.{}".format(format_dir,out_format), 
+                transparent=True)
+  plt.close(fig)
+
+#-------------------------------------------------------------------------------
+
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["cov_matrix"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
+  lumi_setups = SDS.default_lumi_setups
+  pol_run_setups = [
+    IORS.RunSetup("2polExt_LPcnstr"),
+    IORS.RunSetup("2pol_LPcnstr"),
+    IORS.RunSetup("1pol_LPcnstr"),
+  ]
+  unpol_run_setups = [
+    IORS.RunSetup("0pol_LPcnstr"),
+  ]
+  muacc_setups = [
+    IOMAS.MuAccSetup("MuAccFree"),
+  ]
+  pol_difparam_setups = [
+    IODPS.DifParamSetup("mumu_free"),
+  ]
+  unpol_difparam_setups = [
+    IODPS.DifParamSetup("mumu_unpol"),
+  ]
+  WW_setups = [
+    IOWWS.WWSetup("WWcTGCs_xs0Free_AFixd"),
+  ]
+    
+  return [
+    SSG.SetupGrid(lumi_setups, pol_run_setups, muacc_setups,
+                  difparam_setups=pol_difparam_setups, WW_setups=WW_setups),
+    SSG.SetupGrid(lumi_setups, unpol_run_setups, muacc_setups,
+                  difparam_setups=unpol_difparam_setups, WW_setups=WW_setups)
+  ]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
+  output_dir = "{}/plots/LumiScaling".format(output_base)
+  return [
+    ("TGC_lumi_scan", lumi_scan_plot, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
+  
+if __name__ == "__main__":
+  main()
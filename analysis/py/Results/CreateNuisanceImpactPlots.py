@@ -0,0 +1,146 @@
+import logging as log
+import matplotlib.pyplot as plt
+import numpy as np
+import sys
+
+# Local modules
+sys.path.append("..") # Use the modules in the top level directory
+import Analysis.NuisanceImpact as ANI
+import IO.ResultServer as IORSV
+import IO.SysHelp as IOSH
+import Plotting.DefaultFormat as PDF
+import Setups.DifParamSetup as IODPS
+import Setups.MuAccSetup as IOMAS
+import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
+import Setups.WWSetup as IOWWS
+
+""" Rank the nuisance parameters by their impact on the physics parameters of
+    each setup (see Analysis.NuisanceImpact).
+"""
+
+#-------------------------------------------------------------------------------
+
+# Collider configurations that are compared and their labels
+configurations = [
+  ("2polExt_LPcnstr", "$(80/0,30/0)$"),
+  ("2pol_LPcnstr", "$(80,30)$"),
+  ("1pol_LPcnstr", "$(80,0)$"),
+  ("0pol_LPcnstr", "$(0,0)$")
+]
+
+def write_rankings(impacts, output_dir):
+  """ Write the nuisance groups ordered by their impact for each parameter of
+      each setup.
+  """
+  IOSH.create_dir(output_dir)
+  with open("{}/nuisance_impacts.txt".format(output_dir), "w") as out_file:
+    for row, key in enumerate(impacts.keys):
+      out_file.write("{}\n".format(" ".join([str(value) for value in key 
+                                             if value is not None])))
+      for col, par_name in enumerate(impacts.par_names):
+        if np.isnan(impacts.uncs[row, col]):
+          continue
+        ranking = impacts.ranking(key, par_name)
+        out_file.write("  {}: {}\n".format(par_name, ", ".join(
+          ["{} {:.1f}%".format(group, 100. * rel) 
+           for group, _, rel in ranking])))
+      out_file.write("\n")
+
+def impact_plot(mrr, output_dir):
+  """ Plot the relative uncertainty reduction of each physics parameter if 
+      each nuisance group were known, for the compared collider 
+      configurations.
+  """
+  impacts = ANI.from_reader(mrr)
+  write_rankings(impacts, output_dir)
+  relative = impacts.relative()
+  
+  fig, axes = plt.subplots(1, len(configurations), sharey=True,
+                           figsize=(6 * len(configurations), 12), 
+                           tight_layout=True)
+  for ax, (run_name, label) in zip(axes, configurations):
+    rows = impacts.select(lumi=2000, run_name=run_name, 
+                          muacc_name="MuAccFree", difparam_name="mumu_*",
+                          WW_name="WWcTGCs_xs0Free_AFixd")
+    if len(rows) != 1:
+      raise Exception("Expected one setup for {}, found {}".format(run_name,
+                                                                   len(rows)))
+    image = ax.imshow(relative[rows[0]], vmin=0, vmax=1, cmap="viridis", 
+                      aspect="auto")
+    ax.set_xticks(np.arange(len(impacts.groups)))
+    ax.set_xticklabels(impacts.groups, rotation=60, ha="right")
+    ax.set_title(label)
+  axes[0].set_yticks(np.arange(len(impacts.par_names)))
+  axes[0].set_yticklabels(impacts.par_names, size="small")
+  fig.colorbar(image, ax=axes[-1], 
+               label="Unc. reduction if nuisance known")
+
+  for out_format in ["pdf","png"]:
+    format_dir = "{}/{}".format(output_dir,out_format)
+    IOSH.create_dir(format_dir)
+    fig.savefig("{}/nuisance_impacts.{}".format(format_dir,out_format), 
+                transparent=True)
+  plt.close(fig)
+
+#-------------------------------------------------------------------------------
+
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["cov_matrix"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
+  lumi_setups = [ 2000 ]
+  pol_run_setups = [
+    IORS.RunSetup("2polExt_LPcnstr"),
+    IORS.RunSetup("2pol_LPcnstr"),
+    IORS.RunSetup("1pol_LPcnstr"),
+  ]
+  unpol_run_setups = [
+    IORS.RunSetup("0pol_LPcnstr"),
+  ]
+  muacc_setups = [
+    IOMAS.MuAccSetup("MuAccFree"),
+  ]
+  pol_difparam_setups = [
+    IODPS.DifParamSetup("mumu_free"),
+  ]
+  unpol_difparam_setups = [
+    IODPS.DifParamSetup("mumu_unpol"),
+  ]
+  WW_setups = [
+    IOWWS.WWSetup("WWcTGCs_xs0Free_AFixd"),
+  ]
+    
+  return [
+    SSG.SetupGrid(lumi_setups, pol_run_setups, muacc_setups,
+                  difparam_setups=pol_difparam_setups, WW_setups=WW_setups),
+    SSG.SetupGrid(lumi_setups, unpol_run_setups, muacc_setups,
+                  difparam_setups=unpol_difparam_setups, WW_setups=WW_setups)
+  ]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
+  output_dir = "{}/plots/NuisanceImpacts".format(output_base)
+  return [
+    ("nuisance_impacts", impact_plot, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
+  
+if __name__ == "__main__":
+  main()
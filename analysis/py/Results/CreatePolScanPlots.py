@@ -0,0 +1,150 @@
+import logging as log
+import matplotlib.pyplot as plt
+import numpy as np
+import sys
+
+# Local modules
+sys.path.append("..") # Use the modules in the top level directory
+import Analysis.PolSurrogate as APS
+import IO.ResultServer as IORSV
+import IO.SysHelp as IOSH
+import Plotting.DefaultFormat as PDF
+import Setups.DefaultSetups as SDS
+import Setups.DifParamSetup as IODPS
+import Setups.MuAccSetup as IOMAS
+import Setups.SetupGrid as SSG
+import Setups.WWSetup as IOWWS
+
+""" Scans of the uncertainties over the beam polarisations from the
+    polarisation surrogate (see Analysis.PolSurrogate), with the leave-one-out
+    validation of each family.
+"""
+
+#-------------------------------------------------------------------------------
+
+# Setup family (see Analysis.PolSurrogate.family_key) without the luminosity
+configuration = ("LPcnstr", "MuAccFree", None, "WWcTGCs_xs0Free_AFixd")
+
+par_names = [ "Delta-g1Z", "Delta-kappa_gamma", "Delta-lambda_gamma" ]
+par_labels = [ "$g_{1}^{Z}$", "$\kappa_{\gamma}$", "$\lambda_{\gamma}$" ]
+
+# Scanned polarisations (as fractions)
+PeM_values = np.linspace(0, 0.9, 91)
+PeP_values = np.linspace(0, 0.6, 61)
+
+def write_validation(surrogates, output_dir):
+  """ Write the largest leave-one-out error of each parameter of each family.
+  """
+  IOSH.create_dir(output_dir)
+  with open("{}/pol_surrogate_validation.txt".format(output_dir),
+            "w") as out_file:
+    out_file.write("# Largest relative leave-one-out error of the predicted "
+                   "uncertainties\n")
+    for family, surrogate in sorted(surrogates.items(), key=lambda item:
+                                    [str(value) for value in item[0]]):
+      out_file.write("{} (PeM/PeP = {})\n".format(
+        " ".join([str(value) for value in family if value is not None]),
+        ", ".join(["{:g}/{:g}".format(100 * PeM, 100 * PeP)
+                   for PeM, PeP in surrogate.pol_points])))
+      for par_name, error in zip(surrogate.par_names,
+                                 surrogate.max_loo_error()):
+        out_file.write("  {}: {:.4f}\n".format(par_name, error))
+
+def pol_scan_plot(surrogate, lumi, output_dir):
+  """ Plot the predicted uncertainties of the TGCs over the polarisation
+      plane with the contours of their estimated relative errors and the
+      polarisations that were run.
+  """
+  points = APS.pol_grid(PeM_values, PeP_values)
+  cols = [surrogate.par_names.index(par_name) for par_name in par_names]
+  uncs, errors = surrogate.uncs(points)
+  shape = (len(PeM_values), len(PeP_values))
+
+  fig, axes = plt.subplots(1, len(par_names), figsize=(7 * len(par_names), 6),
+                           tight_layout=True)
+  for ax, col, par_label in zip(axes, cols, par_labels):
+    mesh = ax.pcolormesh(100 * PeM_values, 100 * PeP_values,
+                         uncs[:, col].reshape(shape).T, shading="auto")
+    contours = ax.contour(100 * PeM_values, 100 * PeP_values,
+                          errors[:, col].reshape(shape).T,
+                          levels=[0.05, 0.1, 0.2], colors="white")
+    ax.clabel(contours, fmt="%.2f")
+    ax.plot(100 * surrogate.pol_points[:, 0], 100 * surrogate.pol_points[:, 1],
+            ls="", marker="o", color="red", clip_on=False)
+    fig.colorbar(mesh, ax=ax, label="Uncertainty on {}".format(par_label))
+    ax.set_xlabel("$|P_{e^-}|$ [%]")
+    ax.set_ylabel("$|P_{e^+}|$ [%]")
+    ax.set_title("L = {} fb$^{{-1}}$".format(lumi))
+
+  for out_format in ["pdf","png"]:
+    format_dir = "{}/{}".format(output_dir,out_format)
+    IOSH.create_dir(format_dir)
+    fig.savefig("{}/TGC_pol_scan_L{}.{}".format(format_dir,lumi,out_format),
+                transparent=True)
+  plt.close(fig)
+
+def pol_scan_plots(mrr, output_dir):
+  """ Polarisation scans for each luminosity of the configuration.
+  """
+  surrogates = APS.from_reader(mrr)
+  write_validation(surrogates, output_dir)
+  for lumi in SDS.default_lumi_setups:
+    family = (lumi,) + configuration
+    if family not in surrogates:
+      log.warning("No polarisation surrogate for {}".format(family))
+      continue
+    pol_scan_plot(surrogates[family], lumi, output_dir)
+
+#-------------------------------------------------------------------------------
+
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["cov_matrix"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
+  lumi_setups = SDS.default_lumi_setups
+  pol_run_setups = [ rs for rs in SDS.default_pol_run_setups
+                     if rs.name in ["2pol_LPcnstr", "1pol_LPcnstr"] ]
+  unpol_run_setups = [ rs for rs in SDS.default_unpol_run_setups
+                       if rs.name == "0pol_LPcnstr" ]
+  muacc_setups = [
+    IOMAS.MuAccSetup("MuAccFree"),
+  ]
+  difparam_setups = [
+    IODPS.DifParamSetup(), # Without mumu, same parameters for all points
+  ]
+  WW_setups = [
+    IOWWS.WWSetup("WWcTGCs_xs0Free_AFixd"),
+  ]
+
+  return [
+    SSG.SetupGrid(lumi_setups, pol_run_setups + unpol_run_setups,
+                  muacc_setups, difparam_setups=difparam_setups,
+                  WW_setups=WW_setups)
+  ]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
+  output_dir = "{}/plots/PolScan".format(output_base)
+  return [
+    ("TGC_pol_scan", pol_scan_plots, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
+
+if __name__ == "__main__":
+  main()
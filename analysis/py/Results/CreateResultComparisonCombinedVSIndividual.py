@@ -1,17 +1,17 @@
 import logging as log
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import IO.MultiResultReader as IOMRR
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Setups.DifParamSetup as IODPS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 import Setups.WWSetup as IOWWS
 
 #-------------------------------------------------------------------------------
@@ -20,10 +20,8 @@ def get_ratios(par_names, rs_comb, rs_indv):
   """ Get the combined/individual fit uncertainty ratios for all parameters 
       (if they're available).
   """
-  return np.array([rs_comb.fit_unc(par)/rs_indv.fit_unc(par) 
-                    if par in rs_indv.par_names 
-                   else -0.3 
-                   for par in par_names ]) 
+  ratios = rs_comb.fit_uncs(par_names) / rs_indv.fit_uncs(par_names, np.nan)
+  return np.where(rs_indv.has_pars(par_names), ratios, -0.3)
 
 def draw_ratio(ax, x, par_names, rs_comb, rs_indv, **kwargs):
   """ Draw the uncertainty ratio combined / individual for the given parameters.
@@ -167,16 +165,22 @@ def get_relevant_results(mrr):
     "0pol_4f": mrr.get(2000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary(),
   }
   
+def ratio_plot(mrr, output_dir):
+  """ Plot the uncertainty ratios between the combined and individual fits.
+  """
+  plot_ratios(get_relevant_results(mrr), output_dir)
+  
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["uncs_fin"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   lumi_setups = [ 2000 ]
   pol_run_setups = [
     IORS.RunSetup("2polExt_LPcnstr"),
@@ -202,21 +206,31 @@ def main():
     IOWWS.WWSetup()
   ]
     
-  mrr = IOMRR.MultiResultReader(fit_output_base, lumi_setups, 
-                                pol_run_setups, muacc_setups, 
-                                difparam_setups=pol_difparam_setups, 
-                                WW_setups=WW_setups)
-  mrr.append(IOMRR.MultiResultReader(fit_output_base, lumi_setups, 
-                                     unpol_run_setups, muacc_setups, 
-                                     difparam_setups=unpol_difparam_setups, 
-                                     WW_setups=WW_setups))
-
-  rs_dict = get_relevant_results(mrr)
-
-  # Output directories
+  return [
+    SSG.SetupGrid(lumi_setups, pol_run_setups, muacc_setups,
+                  difparam_setups=pol_difparam_setups, WW_setups=WW_setups),
+    SSG.SetupGrid(lumi_setups, unpol_run_setups, muacc_setups,
+                  difparam_setups=unpol_difparam_setups, WW_setups=WW_setups)
+  ]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/CombinedVSIndividual".format(output_base)
+  return [
+    ("ratios", ratio_plot, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
 
-  plot_ratios(rs_dict, output_dir)
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
   main()
@@ -0,0 +1,27 @@
+import logging as log
+import sys
+
+# Local modules
+sys.path.append("..") # Use the modules in the top level directory
+import IO.MultiResultReader as IOMRR
+import IO.ResultExport as IORE
+import MultiProc.SharedPool as MPSP
+
+""" Export the summaries and per-toy fit results of all setups as Arrow and 
+    Parquet tables (see IO.ResultExport), e.g. for analyses outside of this 
+    framework.
+"""
+
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+def main():
+  log.basicConfig(level=log.INFO) # Set logging level
+  
+  # Reading and summarising use the same worker processes
+  with MPSP.shared_pool():
+    mrr = IOMRR.get_default_mrr(fit_output_base)
+    IORE.export(mrr, "{}/summary".format(output_base))
+
+if __name__ == "__main__":
+  main()
@@ -1,43 +1,115 @@
+import json
 import logging as log
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import Analysis.ResultSummary as ARS
+import Analysis.UncertaintyTensor as AUT
 import IO.MultiResultReader as IOMRR
 import IO.NamingConventions as IONC
 import IO.SysHelp as IOSH
+import MultiProc.SharedPool as MPSP
+import Setups.DefaultSetups as SDS
 
-""" Create a summary file that contains the a readable summary for each setup.
+""" Create a summary file that contains the a readable summary for each setup,
+    and a JSON file with the same information for other programs.
 """
 
-log.basicConfig(level=log.INFO) # Set logging level
-os.environ["USE_N_CORES"] = "7"
-
 output_base = "../../../output"
 fit_output_base = "{}/run_outputs".format(output_base)
-msr = IOMRR.get_default_mrr(fit_output_base)
 
-# Output directory
-summary_dir = "{}/summary".format(output_base)
+# Per-toy fields that the summaries need (None: all)
+fields = None
 
-# Open a file to write out the uncertainties and cor matrix summary
-IOSH.create_dir(summary_dir)
-file = open(summary_dir + "/result_summary.txt", "w")
+def setup_grids():
+  """ The setup grids whose results are summarised.
+  """
+  return [SDS.default_pol_grid, SDS.default_unpol_grid]
 
-# Write each result
-for res in msr.setup_results:
-  setup_out_name = IONC.setup_convention(res.lumi_setup, res.run_setup, 
-                                         res.muacc_setup, res.difparam_setup, 
-                                         res.WW_setup)
-  log.info("Checking: {}".format(setup_out_name))
-  
-  # Calculate a summary of the result (e.g. cor matrix, unc., ...)
-  res_summary = ARS.ResultSummary(res.run_result)
+def setup_name(res):
+  """ Name of the setup of the result.
+  """
+  return IONC.setup_convention(res.lumi_setup, res.run_setup, res.muacc_setup,
+                               res.difparam_setup, res.WW_setup)
+
+def summary_entry(res):
+  """ Summarise the setup result (if not yet done) and format the summary.
+      (Meant to be run in a worker process.)
+      Returns the text and the JSON entry of the setup, and the summary so
+      that it can be kept with the result.
+  """
+  setup_out_name = setup_name(res)
+  log.debug("Checking: {}".format(setup_out_name))
+  res_summary = res.result_summary()
   
-  # Write summary to the output file
-  file.write(setup_out_name + "\n")
-  file.write(str(res_summary) + "\n\n")
+  entry = dict(zip(AUT.dims, res.key()))
+  entry["setup"] = setup_out_name
+  entry.update(res_summary.to_dict())
+  return "{}\n{}\n\n".format(setup_out_name, res_summary), entry, res_summary
+
+def sorted_results(mrr):
+  """ The setup results of the reader, ordered by setup.
+  """
+  return sorted(mrr.setup_results, key=lambda res: AUT.sort_key(res.key()))
+
+def worker_result(res):
+  """ The setup result to send to a worker: without the toys if the summary
+      is already calculated.
+  """
+  return res if res.summary is None else res.summary_only()
+
+def write_entries(entries, summary_dir):
+  """ Write the formatted entries (text, JSON entry, ...) into the summary 
+      file and the JSON sidecar file.
+  """
+  IOSH.create_dir(summary_dir)
+  with open(summary_dir + "/result_summary.txt", "w") as text_file, \
+       open(summary_dir + "/result_summary.json", "w") as json_file:
+    json_file.write("[\n")
+    for i, (text, entry, *_) in enumerate(entries):
+      text_file.write(text)
+      json_file.write("{}{}".format(",\n" if i > 0 else "", json.dumps(entry)))
+    json_file.write("\n]\n")
+
+def write_summary_file(mrr, summary_dir):
+  """ Write the summary of each result into the summary file and the JSON 
+      sidecar file.
+      The summaries are calculated and formatted in parallel and written as 
+      they are done, ordered by setup. Newly calculated summaries are kept 
+      with the results.
+  """
+  setup_results = sorted_results(mrr)
   
-file.close()
\ No newline at end of file
+  def entries():
+    outputs = MPSP.iter_tasks(summary_entry, 
+                              [(worker_result(res),) for res in setup_results])
+    for res, (text, entry, summary) in zip(setup_results, outputs):
+      res.summary = summary
+      yield text, entry
+  write_entries(entries(), summary_dir)
+
+def plot_jobs(mrr, output_base):
+  """ The jobs of this script as (name, function, arguments[, requires]), so 
+      that they can also be run by the Results runner: each setup is 
+      formatted in its own job, the files are written when all are done.
+  """
+  names = ["entry:{}".format(setup_name(res)) for res in sorted_results(mrr)]
+  jobs = [ (name, summary_entry, (res,)) 
+           for name, res in zip(names, sorted_results(mrr)) ]
+  summary_dir = "{}/summary".format(output_base)
+  jobs.append(("summary_file", write_entries, 
+               lambda results: ([results[name][:2] for name in names], 
+                                summary_dir), 
+               names))
+  return jobs
+
+def main():
+  log.basicConfig(level=log.INFO) # Set logging level
+
+  # Reading, summarising and formatting use the same worker processes
+  with MPSP.shared_pool():
+    msr = IOMRR.get_default_mrr(fit_output_base)
+    write_summary_file(msr, "{}/summary".format(output_base))
+
+if __name__ == "__main__":
+  main()
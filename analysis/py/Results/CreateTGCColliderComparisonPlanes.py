@@ -1,17 +1,17 @@
 import logging as log
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import IO.MultiResultReader as IOMRR
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Plotting.Statistics as PS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 import Setups.WWSetup as IOWWS
 
 #-------------------------------------------------------------------------------
@@ -119,14 +119,15 @@ def TGC_comparison_plot(mrr, output_dir):
 
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["cov_matrix"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   pol_lumi_setups = [ 2000 ]
   unpol_lumi_setups = [ 2000, 10000 ]
   pol_run_setups = [
@@ -144,17 +145,31 @@ def main():
     IOWWS.WWSetup("WWcTGCs_xs0Free_AFixd")
   ]
   
-  mrr = IOMRR.MultiResultReader(fit_output_base, pol_lumi_setups, 
-                                pol_run_setups, muacc_setups, 
-                                WW_setups=WW_setups)
-  mrr.append(IOMRR.MultiResultReader(fit_output_base, unpol_lumi_setups, 
-                                     unpol_run_setups, muacc_setups, 
-                                     WW_setups=WW_setups))
-
-  # Output directories
+  return [
+    SSG.SetupGrid(pol_lumi_setups, pol_run_setups, muacc_setups,
+                  WW_setups=WW_setups),
+    SSG.SetupGrid(unpol_lumi_setups, unpol_run_setups, muacc_setups,
+                  WW_setups=WW_setups)
+  ]
+
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/TGCPlaneComparison".format(output_base)
+  return [
+    ("TGC", TGC_comparison_plot, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
 
-  TGC_comparison_plot(mrr, output_dir)
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
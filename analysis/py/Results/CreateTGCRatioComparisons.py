@@ -2,41 +2,26 @@ import logging as log
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as pe
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import IO.MultiResultReader as IOMRR
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 import Setups.WWSetup as IOWWS
 
 #-------------------------------------------------------------------------------
 
-def draw_ratios(ax, rs_pol, rs_unpol, x_shift, **kwargs):
+def draw_ratios(ax, ratios, pol_key, unpol_key, x_shift, **kwargs):
   """ Draw the unpolarised/polarised ratio for given polarised and unpolarised 
-      results.
+      setups from the ratios of all pairs.
   """
   x = np.arange(3)+0.5+x_shift
-  
-  # Find the uncertainties
-  g_unc_pol = rs_pol.fit_unc("Delta-g1Z")
-  k_unc_pol = rs_pol.fit_unc("Delta-kappa_gamma")
-  l_unc_pol = rs_pol.fit_unc("Delta-lambda_gamma")
-  g_unc_unpol = rs_unpol.fit_unc("Delta-g1Z")
-  k_unc_unpol = rs_unpol.fit_unc("Delta-kappa_gamma")
-  l_unc_unpol = rs_unpol.fit_unc("Delta-lambda_gamma")
-        
-  y = np.array([
-    g_unc_unpol / g_unc_pol,
-    k_unc_unpol / k_unc_pol,
-    l_unc_unpol / l_unc_pol
-  ])
-    
-  # Plot the uncertainties
+  y = ratios.values[ratios.pair_index[(unpol_key, pol_key)]]
   ax.plot(x, y, **kwargs)
 
 #-------------------------------------------------------------------------------
@@ -56,24 +41,26 @@ def TGC_ratio_plot(mrr, output_dir):
   ax.set_xlim(-0.3, 3)
   ax.set_ylabel(r"Uncertainty ratio: $\frac{unpolarised}{polarised}$", size='large')
   
-  rs_0pol_ALRfixd = mrr.get(2000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary()
-  rs_1pol_ALRfixd = mrr.get(2000, "1pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary()
-  rs_2pol_ALRfixd = mrr.get(2000, "2pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary()
-  rs_2polExt_ALRfixd = mrr.get(2000, "2polExt_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFixd").result_summary()
-  rs_0pol_ALRfree = mrr.get(2000, "0pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()
-  rs_1pol_ALRfree = mrr.get(2000, "1pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()
-  rs_2pol_ALRfree = mrr.get(2000, "2pol_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()
-  rs_2polExt_ALRfree = mrr.get(2000, "2polExt_LPcnstr", "MuAccFree", WW_name="WWcTGCs_xs0Free_AFree").result_summary()
+  # Ratios of each unpolarised setup to the polarised ones with the same
+  # luminosity, muon acceptance and WW setup
+  ratios = mrr.ratios(dict(run_name="0pol_LPcnstr"), 
+                      dict(run_name=["1pol_LPcnstr", "2pol_LPcnstr", 
+                                     "2polExt_LPcnstr"]),
+                      same=["lumi", "muacc_name", "difparam_name", "WW_name"],
+                      par_names=["Delta-g1Z", "Delta-kappa_gamma", 
+                                 "Delta-lambda_gamma"])
+  key = lambda run_name, WW_name: (2000, run_name, "MuAccFree", None, WW_name)
+  ALRfixd, ALRfree = "WWcTGCs_xs0Free_AFixd", "WWcTGCs_xs0Free_AFree"
   
   # Get the colors of the color cycle (to get manual control over them)
   colors =  plt.rcParams['axes.prop_cycle'].by_key()['color']
   
-  draw_ratios(ax, rs_2polExt_ALRfixd, rs_0pol_ALRfixd, -0.2, color=colors[0], ls="", ms=15, marker="v")
-  draw_ratios(ax, rs_2pol_ALRfixd, rs_0pol_ALRfixd, 0,       color=colors[1], ls="", ms=15, marker="v")
-  draw_ratios(ax, rs_1pol_ALRfixd, rs_0pol_ALRfixd, 0.2,     color=colors[2], ls="", ms=15, marker="v")
-  draw_ratios(ax, rs_2polExt_ALRfree, rs_0pol_ALRfree, -0.2, color=colors[0], ls="", ms=15, marker="v", fillstyle="none")
-  draw_ratios(ax, rs_2pol_ALRfree, rs_0pol_ALRfree, 0,       color=colors[1], ls="", ms=15, marker="v", fillstyle="none")
-  draw_ratios(ax, rs_1pol_ALRfree, rs_0pol_ALRfree, 0.2,     color=colors[2], ls="", ms=15, marker="v", fillstyle="none")
+  draw_ratios(ax, ratios, key("2polExt_LPcnstr", ALRfixd), key("0pol_LPcnstr", ALRfixd), -0.2, color=colors[0], ls="", ms=15, marker="v")
+  draw_ratios(ax, ratios, key("2pol_LPcnstr", ALRfixd), key("0pol_LPcnstr", ALRfixd), 0,       color=colors[1], ls="", ms=15, marker="v")
+  draw_ratios(ax, ratios, key("1pol_LPcnstr", ALRfixd), key("0pol_LPcnstr", ALRfixd), 0.2,     color=colors[2], ls="", ms=15, marker="v")
+  draw_ratios(ax, ratios, key("2polExt_LPcnstr", ALRfree), key("0pol_LPcnstr", ALRfree), -0.2, color=colors[0], ls="", ms=15, marker="v", fillstyle="none")
+  draw_ratios(ax, ratios, key("2pol_LPcnstr", ALRfree), key("0pol_LPcnstr", ALRfree), 0,       color=colors[1], ls="", ms=15, marker="v", fillstyle="none")
+  draw_ratios(ax, ratios, key("1pol_LPcnstr", ALRfree), key("0pol_LPcnstr", ALRfree), 0.2,     color=colors[2], ls="", ms=15, marker="v", fillstyle="none")
 
   ax.set_ylim(1.0,ax.get_ylim()[1])
   ax.set_yticks([1.0,1.5,2.0])
@@ -93,14 +80,15 @@ def TGC_ratio_plot(mrr, output_dir):
 
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["uncs_fin"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   lumi_setups = [ 2000 ]
   pol_run_setups = [
     IORS.RunSetup("2polExt_LPcnstr"),
@@ -118,17 +106,31 @@ def main():
     IOWWS.WWSetup("WWcTGCs_xs0Free_AFixd")
   ]
   
-  mrr = IOMRR.MultiResultReader(fit_output_base, lumi_setups, 
-                                pol_run_setups, muacc_setups, 
-                                WW_setups=WW_setups)
-  mrr.append(IOMRR.MultiResultReader(fit_output_base, lumi_setups, 
-                                     unpol_run_setups, muacc_setups, 
-                                     WW_setups=WW_setups))
+  return [
+    SSG.SetupGrid(lumi_setups, pol_run_setups, muacc_setups,
+                  WW_setups=WW_setups),
+    SSG.SetupGrid(lumi_setups, unpol_run_setups, muacc_setups,
+                  WW_setups=WW_setups)
+  ]
 
-  # Output directories
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/TGCRatioComparison".format(output_base)
+  return [
+    ("TGC_ratios", TGC_ratio_plot, (mrr, output_dir))
+  ]
+
+#-------------------------------------------------------------------------------
 
-  TGC_ratio_plot(mrr, output_dir)
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
   main()
@@ -2,17 +2,18 @@ from functools import partial
 import logging as log
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import sys
 
 # Local modules
 sys.path.append("..") # Use the modules in the top level directory
-import IO.MultiResultReader as IOMRR
+import Analysis.ErrorPropagation as AEP
+import IO.ResultServer as IORSV
 import IO.SysHelp as IOSH
 import Plotting.DefaultFormat as PDF
 import Setups.DifParamSetup as IODPS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 
 #-------------------------------------------------------------------------------
 
@@ -36,6 +37,26 @@ truth_vals = {
 
 #-------------------------------------------------------------------------------
 
+def Af_unpol(AFB, Ae, ef, Poleff):
+  """ Af from AFB for an unpolarised collider with a residual effective 
+      polarisation Poleff (which changes the effective Ae).
+  """
+  Ae_eff = (Ae + Poleff) / (1 + Poleff * Ae)
+  return (8./3. * AFB - ef) / (2 * Ae_eff)
+
+def Af_unpol_jacobian(AFB, Ae, ef, Poleff):
+  """ Derivatives of Af_unpol w.r.t. AFB, Ae, ef and Poleff.
+  """
+  Af = Af_unpol(AFB, Ae, ef, Poleff)
+  Ae_eff = (Ae + Poleff) / (1 + Poleff * Ae)
+  dAeeff_dAe = (1 - Poleff**2) / (1 + Poleff * Ae)**2
+  dAeeff_dP = (1 - Ae**2) / (1 + Poleff * Ae)**2
+  return [[ 4./3. / Ae_eff, - Af / Ae_eff * dAeeff_dAe, - 0.5 / Ae_eff, 
+            - Af / Ae_eff * dAeeff_dP ]]
+
+Af_obs = AEP.Observable(["AFB", "Ae", "ef", "Poleff"], Af_unpol, 
+                        Af_unpol_jacobian)
+
 def Af_unc(Af, Ae, d_AFB, d_Poleff=0, d_Ae=0, d_ef=0):
   """ Estimate the uncertainty on Af.
       Needs Af, and Ae and the uncertainties:
@@ -43,10 +64,14 @@ def Af_unc(Af, Ae, d_AFB, d_Poleff=0, d_Ae=0, d_ef=0):
         d_Poleff: Uncertainty on the effective polarisation
         d_Ae: uncertainty on Ae
         d_ef: uncertainty on epsilon_f
+      The uncertainties can be arrays, all are propagated at once.
   """
-  return 1./np.abs(Ae) * np.sqrt(
-            (4/3 * d_AFB)**2 + (1/2 * d_ef)**2 + (Af * (1-Ae**2))**2 * d_Poleff**2 +\
-            (Af * d_Ae)**2 )
+  # The measurements are independent, evaluated at the nominal AFB for the 
+  # given Af (with epsilon_f = 0) and vanishing effective polarisation
+  uncs = np.stack(np.broadcast_arrays(d_AFB, d_Ae, d_ef, d_Poleff), axis=-1)
+  cov = uncs[..., np.newaxis] * np.eye(4) * uncs[..., np.newaxis, :]
+  AFB = 3./4. * Ae * Af
+  return Af_obs.uncs([AFB, Ae, 0., 0.], cov)[..., 0]
   
 #-------------------------------------------------------------------------------
 
@@ -114,14 +139,15 @@ def Af_uncertainty_plot(mrr, output_dir, mass_range, label):
 
 #-------------------------------------------------------------------------------
 
-def main():
-  log.basicConfig(level=log.INFO)
-  PDF.set_default_mpl_format()
-  os.environ["USE_N_CORES"] = "7"
-  
-  output_base = "../../../output"
-  fit_output_base = "{}/run_outputs".format(output_base)
-  
+output_base = "../../../output"
+fit_output_base = "{}/run_outputs".format(output_base)
+
+# Per-toy fields that the plots need (see IO.RunResultColumns)
+fields = ["uncs_fin"]
+
+def setup_grids():
+  """ The setup grids whose results are used in the plots.
+  """
   unpol_lumi_setups = [ 2000, 10000 ]
   unpol_run_setups = [
     IORS.RunSetup("0pol_LPcnstr",  0,  0, "constrained", "constrained")
@@ -133,15 +159,30 @@ def main():
     IODPS.DifParamSetup("mumu_unpol", "free", "fixed", "fixed", "free->AFB", "free->k0", "fixed")
   ]
   
-  mrr = IOMRR.MultiResultReader(fit_output_base, unpol_lumi_setups, 
-                                unpol_run_setups, muacc_setups, 
-                                unpol_difparam_setups)
+  return [
+    SSG.SetupGrid(unpol_lumi_setups, unpol_run_setups, muacc_setups,
+                  unpol_difparam_setups)
+  ]
 
-  # Output directories
+def plot_jobs(mrr, output_base):
+  """ The plots of this script as (name, plot function, arguments), so that
+      they can also be run by the Results runner.
+  """
   output_dir = "{}/plots/AfUncertainty".format(output_base)
+  return [
+    ("Af_81to101", Af_uncertainty_plot, (mrr, output_dir, "81to101", "return-to-Z")),
+    ("Af_180to275", Af_uncertainty_plot, (mrr, output_dir, "180to275", r"high-$\sqrt{s*}$"))
+  ]
 
-  Af_uncertainty_plot(mrr, output_dir, "81to101", "return-to-Z")
-  Af_uncertainty_plot(mrr, output_dir, "180to275", r"high-$\sqrt{s*}$")
+#-------------------------------------------------------------------------------
+
+def main():
+  log.basicConfig(level=log.INFO)
+  PDF.set_default_mpl_format()
+  
+  mrr = IORSV.get_mrr(fit_output_base, setup_grids(), fields=fields)
+  for _, plot_fct, args in plot_jobs(mrr, output_base):
+    plot_fct(*args)
   
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
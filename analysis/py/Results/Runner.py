@@ -0,0 +1,186 @@
+""" Unified runner for the result scripts.
+
+    The setups and per-toy fields needed by the jobs of all selected scripts
+    are collected, their union is read once and all jobs then run as one
+    dependency graph on the shared pool (see MultiProc.JobGraph):
+      summary of each setup -> plots that use the setup
+    so that each plot starts as soon as the summaries it needs are there.
+
+    Run from the py directory:
+      python -m Results list
+      python -m Results run all [<output_base>]
+      python -m Results run <script>[,<script>,...] [<output_base>]
+
+    A registered script provides:
+      fields                      per-toy fields it needs (None: all)
+      setup_grids()               the setup grids it uses
+      plot_jobs(mrr, output_base) its jobs as (name, function, arguments) or
+                                  (name, function, arguments, requires)
+    A job with requires (names of other jobs of the same script) runs after
+    them, its arguments can then be a function that gets the results of the
+    required jobs (by name) and returns the arguments.
+"""
+
+import functools
+import importlib
+import logging as log
+import os
+import sys
+
+# Local modules
+import Analysis.ResultSummary as ARS
+import IO.MultiResultReader as IOMRR
+import IO.NamingConventions as IONC
+import IO.ResultServer as IORSV
+import IO.RunResultColumns as IORRC
+import IO.SetupResult as IOSR
+import MultiProc.JobGraph as MPJG
+import MultiProc.SharedPool as MPSP
+
+# Registered scripts (modules in the Results directory)
+scripts = [
+  "CreateSummaryFile",
+  "CreateIndividualSummaryPlots",
+  "CreateColliderConfigComparison_Combined",
+  "CreateColliderConfigComparison_Difermion",
+  "CreateColliderConfigComparison_WW",
+  "CreateDifermionColliderComparisonPlanes",
+  "CreateFixedEmulationValidation",
+  "CreateLumiScalingPlots",
+  "CreateNuisanceImpactPlots",
+  "CreatePolScanPlots",
+  "CreateResultComparisonCombinedVSIndividual",
+  "CreateTGCColliderComparisonPlanes",
+  "CreateTGCRatioComparisons",
+  "CreateUnpolAmuUncertainty",
+  "CreateWWAsymMeasNoTGCComparison"
+]
+
+# Same output directory as used by the scripts themselves
+default_output_base = os.path.normpath(
+  "{}/../../../output".format(os.path.dirname(os.path.abspath(__file__))))
+
+def import_script(name):
+  """ Import the registered script with the given name (the "Create" can be
+      left out).
+  """
+  if (name not in scripts) and ("Create" + name in scripts):
+    name = "Create" + name
+  if name not in scripts:
+    raise Exception("Unknown script {}, known: {}".format(name, scripts))
+  return importlib.import_module("Results.{}".format(name))
+
+def union_fields(modules):
+  """ The per-toy fields that are needed by any of the scripts (None: all).
+  """
+  fields = set()
+  for module in modules:
+    if module.fields is None:
+      return None
+    fields.update(module.fields)
+  return [field for field in IORRC.toy_fields if field in fields]
+
+def setup_keys(args):
+  """ Keys of the setups whose results are in the given job arguments.
+  """
+  keys = []
+  for arg in args:
+    if isinstance(arg, IOSR.SetupResult):
+      keys.append(arg.key())
+    elif isinstance(arg, IOMRR.MultiResultReader):
+      keys += list(arg.results.keys())
+  return keys
+
+def worker_args(fct, args, results=None, requires=()):
+  """ Arguments to send to the worker: setup results only with their summary.
+      Arguments given as function are first made from the results of the
+      required jobs (see module description).
+  """
+  if callable(args):
+    args = args({ name: results[full_name] for name, full_name in requires })
+  return (fct, tuple([arg.summary_only() if isinstance(arg, IOSR.SetupResult)
+                      else arg for arg in args]))
+
+def run_plot(fct, args):
+  """ Run the plot function in a worker with the default formatting.
+  """
+  # Imported here, the pool workers set the matplotlib backend first
+  import matplotlib.pyplot as plt
+  import Plotting.DefaultFormat as PDF
+  PDF.set_default_mpl_format()
+  try:
+    return fct(*args)
+  finally:
+    plt.close("all")
+
+def run(script_names, output_base=default_output_base):
+  """ Read the results needed by the given scripts once and run all their jobs.
+  """
+  modules = [import_script(name) for name in script_names]
+  grids = { name: module.setup_grids()
+            for name, module in zip(script_names, modules) }
+  fit_output_base = "{}/run_outputs".format(output_base)
+
+  with MPSP.shared_pool():
+    mrr = IORSV.get_mrr(fit_output_base,
+                        [grid for name in script_names for grid in grids[name]],
+                        fields=union_fields(modules))
+    if isinstance(mrr, IORSV.ResultClient):
+      mrr.result_summaries() # Already calculated by the server
+
+    # Summary of each setup (if not yet calculated)
+    jobs, summary_jobs = [], {}
+    for key, res in mrr.results.items():
+      if res.summary is not None:
+        continue
+      summary_jobs[key] = "summary:{}".format(
+        IONC.setup_convention(res.lumi_setup, res.run_setup, res.muacc_setup,
+                              res.difparam_setup, res.WW_setup))
+      jobs.append(MPJG.Job(summary_jobs[key], ARS.ResultSummary,
+                           (res.run_result,),
+                           done=functools.partial(setattr, res, "summary")))
+
+    # Jobs of the scripts, each only sees the setups of its own grids
+    results = {} # Results of the jobs that other jobs of the script need
+    for name, module in zip(script_names, modules):
+      script_mrr = IOMRR.sub_reader(mrr, grids[name], summaries_only=True)
+      script_jobs = module.plot_jobs(script_mrr, output_base)
+      required = set([job_name for job in script_jobs if len(job) > 3
+                      for job_name in job[3]])
+      for job in script_jobs:
+        job_name, fct, args = job[:3]
+        own_requires = [(required_name, "{}:{}".format(name, required_name))
+                        for required_name in (job[3] if len(job) > 3 else ())]
+        requires = [summary_jobs[key] for key in setup_keys(
+                      [] if callable(args) else args) if key in summary_jobs]
+        full_name = "{}:{}".format(name, job_name)
+        done = None
+        if job_name in required:
+          done = functools.partial(results.__setitem__, full_name)
+        jobs.append(MPJG.Job(full_name, run_plot,
+                             functools.partial(worker_args, fct, args,
+                                               results, own_requires),
+                             requires + [full for _, full in own_requires],
+                             done=done))
+
+    log.info("Running {} jobs of {} scripts.".format(len(jobs),
+                                                     len(modules)))
+    MPJG.run_jobs(jobs)
+  log.info("Done!")
+
+def main():
+  log.basicConfig(level=log.INFO)
+  usage = "Usage: python -m Results list\n" \
+          "       python -m Results run all|<script>[,<script>,...] " \
+          "[<output_base>]"
+  if (len(sys.argv) == 2) and (sys.argv[1] == "list"):
+    print("\n".join(scripts))
+  elif (len(sys.argv) in [3, 4]) and (sys.argv[1] == "run"):
+    script_names = scripts if sys.argv[2] == "all" else sys.argv[2].split(",")
+    output_base = sys.argv[3] if len(sys.argv) == 4 else default_output_base
+    run(script_names, output_base)
+  else:
+    raise Exception(usage)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,7 @@
+""" Scripts that create the result summaries and plots.
+
+    Each script can be run on its own (from this directory), or all of them
+    together with the Results runner (from the py directory, see
+    Results.Runner):
+      python -m Results run all
+"""
@@ -0,0 +1,4 @@
+import Results.Runner as RR
+
+if __name__ == "__main__":
+  RR.main()
@@ -2,6 +2,7 @@
 import Setups.DifParamSetup as IODPS
 import Setups.MuAccSetup as IOMAS
 import Setups.RunSetup as IORS
+import Setups.SetupGrid as SSG
 import Setups.WWSetup as IOWWS
 
 default_lumi_setups = [
@@ -64,3 +65,11 @@ default_WW_setups = [                  # use_TGCs, use_s0, use_A
   IOWWS.WWSetup("WW_xs0Fixd_AFixd", False, False, False),
   IOWWS.WWSetup() # Dummy for case without WW
 ]
+
+default_pol_grid = SSG.SetupGrid(
+  default_lumi_setups, default_pol_run_setups, default_muacc_setups, 
+  default_pol_difparam_setups, default_WW_setups)
+
+default_unpol_grid = SSG.SetupGrid(
+  default_lumi_setups, default_unpol_run_setups, default_muacc_setups, 
+  default_unpol_difparam_setups, default_WW_setups)
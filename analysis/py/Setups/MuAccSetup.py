@@ -1,8 +1,8 @@
-class MuAccSetup:
+# Local modules
+import Setups.SetupRecord as SSR
+
+class MuAccSetup(SSR.setup_record(
+    "MuAccSetup", ["name", "costh", "c_setup", "w_setup"])):
   """ Storage class for the muon acceptance setup.
   """
-  def __init__(self, name=None, costh=None, c_setup=None, w_setup=None):
-    self.name = name
-    self.costh = costh
-    self.c_setup = c_setup
-    self.w_setup = w_setup
\ No newline at end of file
+  __slots__ = ()
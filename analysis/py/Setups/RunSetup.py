@@ -1,9 +1,8 @@
-class RunSetup:
+# Local modules
+import Setups.SetupRecord as SSR
+
+class RunSetup(SSR.setup_record(
+    "RunSetup", ["name", "PeM", "PeP", "L_setup", "P_setup"])):
   """ Storage class for the a collider run setup.
   """
-  def __init__(self, name=None, PeM=None, PeP=None, L_setup=None, P_setup=None):
-    self.name = name
-    self.PeM = PeM
-    self.PeP = PeP
-    self.L_setup = L_setup
-    self.P_setup = P_setup
\ No newline at end of file
+  __slots__ = ()
@@ -0,0 +1,31 @@
+import itertools
+
+# Local modules
+import Setups.DifParamSetup as IODPS
+import Setups.WWSetup as IOWWS
+
+class SetupGrid:
+  """ Storage class for a grid of setups, i.e. all combinations of the given 
+      setup options.
+  """
+  def __init__(self, lumi_setups, run_setups, muacc_setups, 
+               difparam_setups=[IODPS.DifParamSetup()], 
+               WW_setups=[IOWWS.WWSetup()]):
+    self.lumi_setups = lumi_setups
+    self.run_setups = run_setups
+    self.muacc_setups = muacc_setups
+    self.difparam_setups = difparam_setups
+    self.WW_setups = WW_setups
+    
+  def combinations(self):
+    """ Iterate over all setup combinations in the grid as tuples of 
+        (lumi_setup, run_setup, muacc_setup, difparam_setup, WW_setup).
+    """
+    return itertools.product(self.lumi_setups, self.run_setups, 
+                             self.muacc_setups, self.difparam_setups, 
+                             self.WW_setups)
+    
+  def __len__(self):
+    return len(self.lumi_setups) * len(self.run_setups) * \
+           len(self.muacc_setups) * len(self.difparam_setups) * \
+           len(self.WW_setups)
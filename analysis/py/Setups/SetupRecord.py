@@ -0,0 +1,29 @@
+""" Base for the setup storage classes: immutable, slotted and hashable records 
+    whose instances are interned, i.e. equal setups are the same object.
+    This allows using setups (and tuples of them) directly as dictionary keys,
+    and results that are read in parallel share the setup objects instead of 
+    each carrying a copy.
+"""
+
+import collections
+
+def setup_record(type_name, field_names):
+  """ Create the record base class with the given fields (all default to None).
+      Classes deriving from it need to set __slots__ = () to stay slotted.
+  """
+  base = collections.namedtuple(type_name, field_names, 
+                                defaults=[None] * len(field_names))
+  
+  class SetupRecord(base):
+    __slots__ = ()
+    _instances = {}
+    
+    def __new__(cls, *args, **kwargs):
+      instance = base.__new__(cls, *args, **kwargs)
+      return cls._instances.setdefault(instance, instance)
+      
+    @classmethod
+    def _make(cls, iterable):
+      return cls(*iterable)
+      
+  return SetupRecord
@@ -1,8 +1,8 @@
-class WWSetup:
+# Local modules
+import Setups.SetupRecord as SSR
+
+class WWSetup(SSR.setup_record(
+    "WWSetup", ["name", "use_TGCs", "use_s0", "use_A"])):
   """ Storage class for the WW physics setup.
   """
-  def __init__(self, name=None, use_TGCs=None, use_s0=None, use_A=None):
-    self.name = name
-    self.use_TGCs = use_TGCs
-    self.use_s0 = use_s0
-    self.use_A = use_A
\ No newline at end of file
+  __slots__ = ()
@@ -0,0 +1,98 @@
+#ifndef LIB_PREWRUNEXAMPLE_RUNMANIFEST_H
+#define LIB_PREWRUNEXAMPLE_RUNMANIFEST_H 1
+
+// Standard library
+#include <array>
+#include <cstdint>
+#include <fstream>
+#include <string>
+#include <utility>
+#include <vector>
+
+namespace RunManifest {
+
+/** Manifest that lists all output files of the run, one JSON object per line.
+    It is written next to the output files and used by the python analysis
+    code as index of the available results.
+ **/
+
+// -----------------------------------------------------------------------------
+
+inline std::string manifest_path(const std::string &output_base) {
+  /** Path of the manifest file for the given output base. **/
+  return output_base + "_manifest.jsonl";
+}
+
+inline std::string file_name(const std::string &path) {
+  /** File name without the directory. **/
+  auto pos = path.find_last_of('/');
+  return (pos == std::string::npos) ? path : path.substr(pos + 1);
+}
+
+// -----------------------------------------------------------------------------
+
+inline std::uint32_t crc32_file(const std::string &path, std::uint64_t &size) {
+  /** Calculate the CRC-32 checksum (same as zlib.crc32) and the size of the
+      given file.
+   **/
+  std::array<std::uint32_t, 256> table{};
+  for (std::uint32_t i = 0; i < 256; i++) {
+    std::uint32_t c = i;
+    for (int k = 0; k < 8; k++) {
+      c = (c & 1) ? (0xEDB88320u ^ (c >> 1)) : (c >> 1);
+    }
+    table[i] = c;
+  }
+
+  std::uint32_t crc = 0xFFFFFFFFu;
+  size = 0;
+  std::ifstream file(path, std::ios::binary);
+  std::vector<char> buffer(1 << 16);
+  while (file) {
+    file.read(buffer.data(), static_cast<std::streamsize>(buffer.size()));
+    auto n_read = file.gcount();
+    for (std::streamsize i = 0; i < n_read; i++) {
+      auto byte = static_cast<std::uint8_t>(buffer[static_cast<size_t>(i)]);
+      crc = table[(crc ^ byte) & 0xFFu] ^ (crc >> 8);
+    }
+    size += static_cast<std::uint64_t>(n_read);
+  }
+  return crc ^ 0xFFFFFFFFu;
+}
+
+// -----------------------------------------------------------------------------
+
+inline std::string json_value(const std::string &value) {
+  return "\"" + value + "\"";
+}
+inline std::string json_value(bool value) { return value ? "true" : "false"; }
+
+using Options = std::vector<std::pair<std::string, std::string>>;
+
+inline void add_entry(const std::string &output_base,
+                      const std::string &output_path, const Options &options,
+                      size_t n_toys) {
+  /** Append the entry for the given (completely written) output file to the
+      manifest.
+   **/
+  std::uint64_t size{};
+  auto crc = crc32_file(output_path, size);
+
+  std::string setup = "{";
+  for (const auto &[key, value] : options) {
+    setup += (setup.size() > 1 ? ", " : "") + json_value(key) + ": " + value;
+  }
+  setup += "}";
+
+  std::ofstream manifest(manifest_path(output_base), std::ios::app);
+  manifest << "{\"file\": " << json_value(file_name(output_path))
+           << ", \"setup\": " << setup << ", \"n_toys\": " << n_toys
+           << ", \"size\": " << size << ", \"crc32\": " << crc << "}"
+           << std::endl;
+}
+
+// -----------------------------------------------------------------------------
+
+} // namespace RunManifest
+
+#endif
@@ -1,5 +1,6 @@
 #include "Definitions/DifParPairs.h"
 #include "Definitions/RunInfos.h"
+#include "Helpers/RunManifest.h"
 
 // Includes from PrEW
 #include "GlobalVar/Chiral.h"
@@ -22,6 +23,11 @@ int main(int /*argc*/, char ** /*argv*/) {
   int energy = 250;
   int n_threads = 10;
   int n_toys = 300;
+  // The output of a shard (part of the toys of each setup) would get a
+  // "_shard<index>" suffix and be merged by the analysis code. Splitting a run
+  // into shards needs the toys of each shard to be seeded differently, which
+  // can't be passed to PrEW from here yet, so there is no sharding option.
+  int shard = -1; // No sharding
   std::string minuit_minimizers = "Combined(1000000,1000000,0.01)";
   std::string prew_minimizer = "PoissonNLL";
   std::string output_base = "../output/run_outputs/fit_results";
@@ -59,7 +65,7 @@ int main(int /*argc*/, char ** /*argv*/) {
     bool fix_WW_xs0{};
     bool fix_WW_A{};
 
-    std::string output_name(const std::string &base) const {
+    std::string output_name(const std::string &base, int shard = -1) const {
       /** Define how the output file is supposed to be called, depending on all
           the options in this setup.
        **/
@@ -98,9 +104,29 @@ int main(int /*argc*/, char ** /*argv*/) {
       }
     }
 
+    if (shard >= 0) {
+      result += "_shard" + std::to_string(shard);
+    }
+
     result += ".out";
     return result;
   }
+
+  RunManifest::Options manifest_options(int shard = -1) const {
+    /** All options of this setup, as they are written to the run manifest.
+     **/
+    using RunManifest::json_value;
+    return {{"run_name", json_value(run_name)},
+            {"lumi", std::to_string(int(lumi))},
+            {"fix_mu_acc", json_value(fix_mu_acc)},
+            {"use_mumu", json_value(use_mumu)},
+            {"mumu_par_name", json_value(mumu_par_name)},
+            {"use_WW", json_value(use_WW)},
+            {"use_WW_TGCs", json_value(use_WW_TGCs)},
+            {"fix_WW_xs0", json_value(fix_WW_xs0)},
+            {"fix_WW_A", json_value(fix_WW_A)},
+            {"shard", shard >= 0 ? std::to_string(shard) : "null"}};
+  }
 };
 
 std::vector<FullRunPhysSetup> run_phys_setups{};
@@ -266,13 +292,19 @@ for (const auto &rps : run_phys_setups) {
   spdlog::info("All threads done, printing first result.");
   spdlog::info(results.at(0));
 
-  auto output_path = rps.output_name(output_base);
+  auto output_path = rps.output_name(output_base, shard);
   spdlog::info("Write results to: {}", output_path);
   PrEW::Output::Printer printer(output_path);
   printer.new_setup(energy, runner.get_data_connector());
   printer.add_fits(results);
   printer.write();
 
+  // Only list the file in the manifest once it is completely written
+  spdlog::info("Add output to manifest: {}",
+               RunManifest::manifest_path(output_base));
+  RunManifest::add_entry(output_base, output_path,
+                         rps.manifest_options(shard), results.size());
+
   spdlog::info("Single test done!");
 
 } // Loop over full setups